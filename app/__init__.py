@@ -1,33 +1,69 @@
+import os
 from flask import Flask
-from flask_bootstrap import Bootstrap
 from flask_mail import Mail
-from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
-from flask_pagedown import PageDown
+from jinja2 import FileSystemBytecodeCache
 from config import config
+from .replicas import RoutingSQLAlchemy
+from .writes import WriteQueue
+from .follow_graph import FollowGraph
+from .compress import Compress
+from . import trending  # registers the activity listeners
 
-bootstrap = Bootstrap()
 mail = Mail()
-moment = Moment()
-db = SQLAlchemy()
-pagedown = PageDown()
+db = RoutingSQLAlchemy()
+writes = WriteQueue(db)
+compress = Compress()
 
 login_manager = LoginManager()
 login_manager.login_view = 'auth.login'
 
 
-def create_app(config_name):
+def _writable_dir(app, path):
+    # a read-only image still serves, compiling the templates in memory
+    try:
+        os.makedirs(path, exist_ok=True)
+    except OSError as e:
+        app.logger.warning('Template cache disabled: %s', e)
+        return False
+    if not os.access(path, os.W_OK):
+        app.logger.warning('Template cache disabled: %s is not writable',
+                           path)
+        return False
+    return True
+
+
+def create_app(config_name, web=True):
+    """Create an application. With ``web`` off the blueprints and the
+    extensions that only serve requests are not imported, for command line
+    tasks that do not need them."""
     app = Flask(__name__)
     app.config.from_object(config[config_name])
     config[config_name].init_app(app)
+    cache_dir = app.config['FLASKY_TEMPLATE_CACHE_DIR']
+    if cache_dir and _writable_dir(app, cache_dir):
+        # compiled templates survive restarts, see flask compile-templates
+        app.jinja_options = dict(app.jinja_options,
+                                 bytecode_cache=FileSystemBytecodeCache(
+                                     cache_dir))
 
-    bootstrap.init_app(app)
     mail.init_app(app)
-    moment.init_app(app)
     db.init_app(app)
     login_manager.init_app(app)
-    pagedown.init_app(app)
+    writes.init_app(app)
+    if app.config['FLASKY_FOLLOW_GRAPH']:
+        app.extensions['follow_graph'] = FollowGraph(
+            lambda: db.get_engine(app), app.config['FLASKY_FOLLOW_GRAPH_TTL'])
+    if not web:
+        return app
+
+    from flask_bootstrap import Bootstrap
+    from flask_moment import Moment
+    from flask_pagedown import PageDown
+    Bootstrap(app)
+    Moment(app)
+    PageDown(app)
+    compress.init_app(app)
 
     if app.config['SSL_REDIRECT']:
         from flask_sslify import SSLify
@@ -0,0 +1,87 @@
+import json
+import re
+from collections import OrderedDict
+from .models import Moderation, Follow, Post, Comment
+
+
+def record_queries(path, queries):
+    """Append the queries issued by a request to a JSON Lines log."""
+    with open(path, 'a') as f:
+        for query in queries:
+            f.write(json.dumps({'statement': query.statement,
+                                'parameters': query.parameters},
+                               default=str) + '\n')
+
+
+def load_queries(path):
+    """Return the distinct statements in a query log with a sample set of
+    parameters and the number of times each one was issued."""
+    queries = OrderedDict()
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            query = json.loads(line)
+            statement = query['statement']
+            if statement in queries:
+                queries[statement][1] += 1
+            else:
+                queries[statement] = [query['parameters'], 1]
+    return [(statement, parameters, count)
+            for statement, (parameters, count) in queries.items()]
+
+
+def page_queries(user_id=1, post_id=1):
+    """Return the ORM queries behind the most visited pages."""
+    return [
+        Post.query.order_by(Post.timestamp.desc()),
+        Post.query.filter_by(author_id=user_id).order_by(
+            Post.timestamp.desc()),
+        Post.query.join(Follow, Follow.followed_id == Post.author_id)
+            .filter(Follow.follower_id == user_id)
+            .order_by(Post.timestamp.desc()),
+        Comment.query.filter_by(post_id=post_id).order_by(
+            Comment.timestamp.asc()),
+        Comment.query.filter_by(state=Moderation.PENDING).order_by(
+            Comment.timestamp.desc(), Comment.id.desc()),
+        Follow.query.filter_by(followed_id=user_id),
+        Follow.query.filter_by(follower_id=user_id),
+    ]
+
+
+def hot_queries(engine):
+    """Return the queries behind the most visited pages."""
+    compiled_queries = []
+    for query in page_queries():
+        compiled = query.limit(20).statement.compile(bind=engine)
+        parameters = tuple(compiled.params[key]
+                           for key in compiled.positiontup or ())
+        compiled_queries.append((str(compiled), parameters, 1))
+    return compiled_queries
+
+
+def explain(engine, statement, parameters):
+    """Run a statement through SQLite's EXPLAIN QUERY PLAN and return the
+    plan along with the steps that scan a whole table or sort rows in a
+    temporary B-tree.
+
+    Walking a whole index to get rows in order is also reported when the
+    statement filters rows, as the index then does not match the filter.
+    """
+    conn = engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters or ())
+        plan = [row[-1] for row in cursor.fetchall()]
+    finally:
+        conn.close()
+    problems = []
+    for step in plan:
+        if step.startswith('SCAN') and 'INDEX' not in step:
+            problems.append('full scan: ' + step)
+        elif step.startswith('SCAN') and \
+                re.search(r'\bWHERE\b', statement, re.I):
+            problems.append('index scan: ' + step)
+        elif 'TEMP B-TREE' in step:
+            problems.append('temp b-tree: ' + step)
+    return plan, problems
@@ -1,6 +1,7 @@
-from flask import g, jsonify
+from flask import g
 from flask_httpauth import HTTPBasicAuth
 from ..models import User
+from ..serializers import jsonify
 from . import api
 from .errors import unauthorized, forbidden
 
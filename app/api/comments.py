@@ -1,12 +1,20 @@
-from flask import jsonify, request, g, url_for, current_app
-from .. import db
+from datetime import datetime, timezone
+from dateutil.parser import parse as parse_date
+from flask import request, g, url_for, current_app
+from .. import db, writes
+from ..exceptions import ValidationError
 from ..models import Post, Permission, Comment
+from ..rendering import render_all, render_comment
+from ..serializers import jsonify
 from . import api
 from .decorators import permission_required
+from .fields import comments_json, comment_fields, batch_json, valid_id
 
 
 @api.route('/comments/')
 def get_comments():
+    if 'ids' in request.args:
+        return jsonify({'comments': batch_json(Comment, comments_json)})
     page = request.args.get('page', 1, type=int)
     pagination = Comment.query.order_by(Comment.timestamp.desc()).paginate(
         page=page, per_page=current_app.config['FLASKY_COMMENTS_PER_PAGE'],
@@ -19,7 +27,7 @@ def get_comments():
     if pagination.has_next:
         next = url_for('api.get_comments', page=page+1)
     return jsonify({
-        'comments': [comment.to_json() for comment in comments],
+        'comments': comments_json(comments),
         'prev': prev,
         'next': next,
         'count': pagination.total
@@ -29,7 +37,7 @@ def get_comments():
 @api.route('/comments/<int:id>')
 def get_comment(id):
     comment = Comment.query.get_or_404(id)
-    return jsonify(comment.to_json())
+    return jsonify(comments_json([comment])[0])
 
 
 @api.route('/posts/<int:id>/comments/')
@@ -47,7 +55,7 @@ def get_post_comments(id):
     if pagination.has_next:
         next = url_for('api.get_post_comments', id=id, page=page+1)
     return jsonify({
-        'comments': [comment.to_json() for comment in comments],
+        'comments': comments_json(comments),
         'prev': prev,
         'next': next,
         'count': pagination.total
@@ -58,10 +66,103 @@ def get_post_comments(id):
 @permission_required(Permission.COMMENT)
 def new_post_comment(id):
     post = Post.query.get_or_404(id)
+    # a bad field must fail before the comment is written
+    fields = comment_fields()
     comment = Comment.from_json(request.json)
     comment.author = g.current_user
     comment.post = post
     db.session.add(comment)
     db.session.commit()
-    return jsonify(comment.to_json()), 201, \
+    return jsonify(comments_json([comment], fields)[0]), 201, \
         {'Location': url_for('api.get_comment', id=comment.id)}
+
+
+def _comment_item(item):
+    if not isinstance(item, dict):
+        raise ValidationError('comment must be an object')
+    post_id = item.get('post_id')
+    if not valid_id(post_id):
+        raise ValidationError('comment does not have a post_id')
+    # the same checks as Comment.from_json, which would render the body
+    body = item.get('body')
+    if body is None or body == '':
+        raise ValidationError('comment does not have a body')
+    if not isinstance(body, str):
+        raise ValidationError('comment body must be a string')
+    return post_id, body
+
+
+@api.route('/comments/batch', methods=['POST'])
+@permission_required(Permission.COMMENT)
+def new_comments():
+    items = request.json
+    if isinstance(items, dict):
+        items = items.get('comments')
+    if not isinstance(items, list) or not items:
+        raise ValidationError('comments must be a non-empty list')
+    if len(items) > current_app.config['FLASKY_API_MAX_COMMENT_BATCH']:
+        raise ValidationError(
+            'at most %d comments can be added at once' %
+            current_app.config['FLASKY_API_MAX_COMMENT_BATCH'])
+    results = [None] * len(items)
+    valid = {}
+    for i, item in enumerate(items):
+        try:
+            valid[i] = _comment_item(item)
+        except ValidationError as e:
+            results[i] = {'status': 400, 'error': 'bad request',
+                          'message': e.args[0]}
+    post_ids = set(post_id for post_id, body in valid.values())
+    found = set(id for id, in db.session.query(Post.id).filter(
+        Post.id.in_(post_ids))) if post_ids else set()
+    for i, (post_id, body) in list(valid.items()):
+        if post_id not in found:
+            results[i] = {'status': 404, 'error': 'not found',
+                          'message': 'post %d does not exist' % post_id}
+            del valid[i]
+    indexes = sorted(valid)
+    bodies = [valid[i][1] for i in indexes]
+    timestamp = datetime.utcnow()
+    rows = [{'body': body, 'body_html': body_html, 'timestamp': timestamp,
+             'author_id': g.current_user.id, 'post_id': valid[i][0]}
+            for i, body, body_html in zip(
+                indexes, bodies, render_all(render_comment, bodies))]
+    ids = writes.execute(Comment.insert_many, rows) if rows else []
+    for i, id in zip(indexes, ids):
+        results[i] = {'status': 201, 'url': url_for('api.get_comment', id=id)}
+    return jsonify({'results': results, 'count': len(ids)})
+
+
+@api.route('/comments/moderate', methods=['POST'])
+@permission_required(Permission.MODERATE)
+def moderate_comments():
+    json_request = request.json
+    if json_request is None:
+        json_request = {}
+    if not isinstance(json_request, dict):
+        raise ValidationError('body must be an object')
+    disabled = json_request.get('disabled')
+    if not isinstance(disabled, bool):
+        raise ValidationError('disabled must be true or false')
+    criteria = {}
+    for key in ('ids', 'author_id', 'post_id', 'since', 'until'):
+        if json_request.get(key) is not None:
+            criteria[key] = json_request[key]
+    if 'ids' in criteria and (
+            not isinstance(criteria['ids'], list) or
+            not all(valid_id(id) for id in criteria['ids'])):
+        raise ValidationError('ids must be a list of integers')
+    for key in ('author_id', 'post_id'):
+        if key in criteria and not valid_id(criteria[key]):
+            raise ValidationError('%s must be an integer' % key)
+    try:
+        for key in ('since', 'until'):
+            if key in criteria:
+                date = parse_date(criteria[key])
+                if date.tzinfo is not None:
+                    date = date.astimezone(timezone.utc).replace(tzinfo=None)
+                criteria[key] = date
+    except (TypeError, ValueError, OverflowError):
+        raise ValidationError('invalid moderation criteria')
+    count = writes.execute(Comment.moderate, disabled, **criteria)
+    return jsonify({'disabled': disabled, 'count': count})
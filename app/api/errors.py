@@ -1,5 +1,5 @@
-from flask import jsonify
 from app.exceptions import ValidationError
+from ..serializers import jsonify
 from . import api
 
 
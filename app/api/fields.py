@@ -0,0 +1,147 @@
+from flask import request, current_app
+from .. import db
+from ..exceptions import ValidationError
+from ..models import User, Post, Comment
+
+USER_FIELDS = {'url', 'username', 'member_since', 'last_seen', 'posts_url',
+               'followed_posts_url', 'post_count'}
+POST_FIELDS = {'url', 'body', 'body_html', 'timestamp', 'author_url',
+               'comments_url', 'comment_count'}
+COMMENT_FIELDS = {'url', 'post_url', 'body', 'body_html', 'timestamp',
+                  'author_url'}
+
+
+# the range of the id columns, larger ints fail in the database driver
+MAX_ID = 2 ** 63 - 1
+
+
+def valid_id(value):
+    """Tell if a JSON value is an id, an int (not a bool) in the range of
+    the id columns."""
+    return isinstance(value, int) and not isinstance(value, bool) and \
+        -MAX_ID - 1 <= value <= MAX_ID
+
+
+def _arg_list(name):
+    value = request.args.get(name)
+    if value is None:
+        return None
+    return set(item.strip() for item in value.split(',') if item.strip())
+
+
+def requested_ids():
+    """Parse the comma-separated ``ids`` argument of a batch request."""
+    try:
+        ids = [int(id) for id in request.args['ids'].split(',') if id.strip()]
+    except ValueError:
+        raise ValidationError('ids must be integers')
+    if not all(valid_id(id) for id in ids):
+        raise ValidationError('ids must be integers')
+    if not ids:
+        raise ValidationError('no ids given')
+    if len(ids) > current_app.config['FLASKY_API_MAX_BATCH']:
+        raise ValidationError('at most %d ids can be requested at once' %
+                              current_app.config['FLASKY_API_MAX_BATCH'])
+    return ids
+
+
+def batch_json(model, resources_json):
+    """Return the resources with the requested ids, loaded with a single
+    query, in the order of the request and with None for missing ids."""
+    ids = requested_ids()
+    found = {resource.id: resource for resource in
+             model.query.filter(model.id.in_(set(ids)))}
+    json_resources = dict(zip(found, resources_json(list(found.values()))))
+    return [json_resources.get(id) for id in ids]
+
+
+def _check_fields(fields, valid):
+    unknown = sorted((fields or set()) - valid)
+    if unknown:
+        raise ValidationError('unknown field %s' % unknown[0])
+
+
+def requested_fields(valid, expandable=()):
+    """Parse the ``fields`` and ``expand`` arguments of the request.
+
+    Return the fields to include in each resource (None for all of them),
+    whether to embed the authors, and the fields to include in the authors,
+    which are given with an ``author.`` prefix.
+    """
+    expand = _arg_list('expand') or set()
+    unexpandable = sorted(expand - set(expandable))
+    if unexpandable:
+        raise ValidationError('cannot expand %s' % unexpandable[0])
+    fields = _arg_list('fields')
+    author_fields = None
+    if fields is not None:
+        author_fields = set(name[len('author.'):] for name in fields
+                            if name.startswith('author.')) or None
+        fields = set(name for name in fields
+                     if not name.startswith('author.'))
+        if author_fields and 'author' not in expand:
+            raise ValidationError('author fields need expand=author')
+        _check_fields(fields, valid)
+        _check_fields(author_fields, USER_FIELDS)
+    return fields, 'author' in expand, author_fields
+
+
+def _counts(column, ids):
+    # one GROUP BY query instead of a COUNT query per resource
+    if not ids:
+        return {}
+    return dict(db.session.query(column, db.func.count())
+                .filter(column.in_(ids)).group_by(column))
+
+
+def _users_json(users, fields):
+    post_counts = {}
+    if fields is None or 'post_count' in fields:
+        post_counts = _counts(Post.author_id, [user.id for user in users])
+    return [user.to_json(fields, post_count=post_counts.get(user.id, 0))
+            for user in users]
+
+
+def _embed_authors(resources, json_resources, fields):
+    ids = set(resource.author_id for resource in resources)
+    authors = User.query.filter(User.id.in_(ids)).all() if ids else []
+    json_authors = dict(zip([author.id for author in authors],
+                            _users_json(authors, fields)))
+    for resource, json_resource in zip(resources, json_resources):
+        json_resource['author'] = json_authors.get(resource.author_id)
+
+
+def users_json(users):
+    fields, expand, author_fields = requested_fields(USER_FIELDS)
+    return _users_json(users, fields)
+
+
+def post_fields():
+    return requested_fields(POST_FIELDS, ('author',))
+
+
+def comment_fields():
+    return requested_fields(COMMENT_FIELDS, ('author',))
+
+
+def posts_json(posts, requested=None):
+    """Return the JSON of posts with the fields of the request, which
+    handlers that write parse with post_fields() before the write."""
+    fields, expand, author_fields = requested or post_fields()
+    comment_counts = {}
+    if fields is None or 'comment_count' in fields:
+        comment_counts = _counts(Comment.post_id, [post.id for post in posts])
+    json_posts = [post.to_json(fields,
+                               comment_count=comment_counts.get(post.id, 0))
+                  for post in posts]
+    if expand:
+        _embed_authors(posts, json_posts, author_fields)
+    return json_posts
+
+
+def comments_json(comments, requested=None):
+    fields, expand, author_fields = requested or comment_fields()
+    json_comments = [comment.to_json(fields) for comment in comments]
+    if expand:
+        _embed_authors(comments, json_comments, author_fields)
+    return json_comments
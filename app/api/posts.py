@@ -1,13 +1,18 @@
-from flask import jsonify, request, g, url_for, current_app
+from flask import request, g, url_for, current_app
 from .. import db
 from ..models import Post, Permission
+from ..serializers import jsonify
+from ..trending import TrendingPagination
 from . import api
 from .decorators import permission_required
 from .errors import forbidden
+from .fields import posts_json, post_fields, batch_json
 
 
 @api.route('/posts/')
 def get_posts():
+    if 'ids' in request.args:
+        return jsonify({'posts': batch_json(Post, posts_json)})
     page = request.args.get('page', 1, type=int)
     pagination = Post.query.paginate(
         page=page, per_page=current_app.config['FLASKY_POSTS_PER_PAGE'],
@@ -20,27 +25,44 @@ def get_posts():
     if pagination.has_next:
         next = url_for('api.get_posts', page=page+1)
     return jsonify({
-        'posts': [post.to_json() for post in posts],
+        'posts': posts_json(posts),
         'prev': prev,
         'next': next,
         'count': pagination.total
     })
 
 
+@api.route('/posts/trending/')
+def get_trending_posts():
+    pagination = TrendingPagination(
+        current_app.config['FLASKY_POSTS_PER_PAGE'],
+        cursor=request.args.get('after'))
+    next = None
+    if pagination.has_next:
+        next = url_for('api.get_trending_posts',
+                       after=pagination.next_cursor)
+    return jsonify({
+        'posts': posts_json(pagination.items),
+        'next': next
+    })
+
+
 @api.route('/posts/<int:id>')
 def get_post(id):
     post = Post.query.get_or_404(id)
-    return jsonify(post.to_json())
+    return jsonify(posts_json([post])[0])
 
 
 @api.route('/posts/', methods=['POST'])
 @permission_required(Permission.WRITE)
 def new_post():
+    # a bad field must fail before the post is written
+    fields = post_fields()
     post = Post.from_json(request.json)
     post.author = g.current_user
     db.session.add(post)
     db.session.commit()
-    return jsonify(post.to_json()), 201, \
+    return jsonify(posts_json([post], fields)[0]), 201, \
         {'Location': url_for('api.get_post', id=post.id)}
 
 
@@ -51,7 +73,8 @@ def edit_post(id):
     if g.current_user != post.author and \
             not g.current_user.can(Permission.ADMIN):
         return forbidden('Insufficient permissions')
+    fields = post_fields()
     post.body = request.json.get('body', post.body)
     db.session.add(post)
     db.session.commit()
-    return jsonify(post.to_json())
+    return jsonify(posts_json([post], fields)[0])
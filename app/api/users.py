@@ -1,12 +1,24 @@
-from flask import jsonify, request, current_app, url_for
+from flask import request, current_app, g, url_for
 from . import api
-from ..models import User, Post
+from .errors import forbidden
+from .fields import users_json, posts_json, batch_json
+from ..exceptions import ValidationError
+from ..models import User, Post, Permission
+from ..serializers import jsonify, resource_url
+from ..timeline import TimelinePage, use_merged_timeline
+
+
+@api.route('/users/')
+def get_users():
+    if 'ids' not in request.args:
+        raise ValidationError('ids is required')
+    return jsonify({'users': batch_json(User, users_json)})
 
 
 @api.route('/users/<int:id>')
 def get_user(id):
     user = User.query.get_or_404(id)
-    return jsonify(user.to_json())
+    return jsonify(users_json([user])[0])
 
 
 @api.route('/users/<int:id>/posts/')
@@ -24,7 +36,7 @@ def get_user_posts(id):
     if pagination.has_next:
         next = url_for('api.get_user_posts', id=id, page=page+1)
     return jsonify({
-        'posts': [post.to_json() for post in posts],
+        'posts': posts_json(posts),
         'prev': prev,
         'next': next,
         'count': pagination.total
@@ -35,9 +47,15 @@ def get_user_posts(id):
 def get_user_followed_posts(id):
     user = User.query.get_or_404(id)
     page = request.args.get('page', 1, type=int)
-    pagination = user.followed_posts.order_by(Post.timestamp.desc()).paginate(
-        page=page, per_page=current_app.config['FLASKY_POSTS_PER_PAGE'],
-        error_out=False)
+    per_page = current_app.config['FLASKY_POSTS_PER_PAGE']
+    if use_merged_timeline(user):
+        pagination = TimelinePage(user, max(page, 1), per_page)
+        # counting does not need to sort the posts of every followed user
+        pagination.total = user.followed_posts.count()
+    else:
+        pagination = user.followed_posts.order_by(
+            Post.timestamp.desc()).paginate(
+            page=page, per_page=per_page, error_out=False)
     posts = pagination.items
     prev = None
     if pagination.has_prev:
@@ -46,8 +64,24 @@ def get_user_followed_posts(id):
     if pagination.has_next:
         next = url_for('api.get_user_followed_posts', id=id, page=page+1)
     return jsonify({
-        'posts': [post.to_json() for post in posts],
+        'posts': posts_json(posts),
         'prev': prev,
         'next': next,
         'count': pagination.total
     })
+
+
+@api.route('/users/<int:id>/suggestions/')
+def get_user_suggestions(id):
+    user = User.query.get_or_404(id)
+    if g.current_user.id != id and not g.current_user.can(Permission.ADMIN):
+        return forbidden('Insufficient permissions')
+    suggestions = user.suggested_users(
+        current_app.config['FLASKY_SUGGESTIONS_TOP_K'])
+    return jsonify({
+        'suggestions': [{'url': resource_url('api.get_user', suggested.id),
+                         'username': suggested.username,
+                         'score': score}
+                        for suggested, score in suggestions],
+        'count': len(suggestions)
+    })
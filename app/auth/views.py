@@ -2,17 +2,25 @@ from flask import render_template, redirect, request, url_for, flash
 from flask_login import login_user, logout_user, login_required, \
     current_user
 from . import auth
-from .. import db
+from .. import db, writes
 from ..models import User
 from ..email import send_email
 from .forms import LoginForm, RegistrationForm, ChangePasswordForm,\
     PasswordResetRequestForm, PasswordResetForm, ChangeEmailForm
 
 
+def ping_user(id):
+    User.query.get(id).ping()
+
+
 @auth.before_app_request
 def before_request():
     if current_user.is_authenticated:
-        current_user.ping()
+        if writes.enabled:
+            # do not make the request wait for the writer
+            writes.submit(ping_user, current_user.id)
+        else:
+            current_user.ping()
         if not current_user.confirmed \
                 and request.endpoint \
                 and request.blueprint != 'auth' \
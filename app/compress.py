@@ -0,0 +1,172 @@
+import threading
+import zlib
+from collections import OrderedDict
+from flask import request, current_app
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+
+class GzipEncoder(object):
+    def __init__(self, level):
+        # 31 selects the gzip container with the largest window
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class BrotliEncoder(object):
+    def __init__(self, level):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class ZstdEncoder(object):
+    def __init__(self, level):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+def available_encoders():
+    """Return the encoders that can be used, from the most preferred."""
+    encoders = OrderedDict()
+    if brotli is not None:
+        encoders['br'] = BrotliEncoder
+    if zstandard is not None:
+        encoders['zstd'] = ZstdEncoder
+    encoders['gzip'] = GzipEncoder
+    return encoders
+
+
+class Compress(object):
+    """Compresses responses for clients that accept it.
+
+    The encoding is negotiated from the Accept-Encoding header among gzip
+    and, when their packages are installed, brotli and zstd. Responses of
+    the types in ``FLASKY_COMPRESS_MIMETYPES`` are compressed when they are
+    at least ``FLASKY_COMPRESS_MIN_SIZE`` bytes long, and streamed responses
+    are compressed chunk by chunk as they are generated. Compressed bodies
+    of responses that have an ETag and can be cached by anyone are kept in
+    a small cache, so static files are compressed once.
+    """
+    def __init__(self, app=None):
+        self.encoders = available_encoders()
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.after_request(self.after_request)
+
+    def negotiate(self, accept_encodings):
+        best, best_quality = None, 0
+        for name in self.encoders:
+            quality = accept_encodings[name]
+            if quality > best_quality:
+                best, best_quality = name, quality
+        return best
+
+    def encoder(self, name):
+        level = current_app.config['FLASKY_COMPRESS_LEVELS'][name]
+        return self.encoders[name](level)
+
+    def after_request(self, response):
+        config = current_app.config
+        if not config['FLASKY_COMPRESS'] or \
+                response.mimetype not in config['FLASKY_COMPRESS_MIMETYPES']:
+            return response
+        response.vary.add('Accept-Encoding')
+        if response.status_code < 200 or \
+                response.status_code in (204, 206, 304) or \
+                'Content-Encoding' in response.headers:
+            return response
+        name = self.negotiate(request.accept_encodings)
+        if name is None:
+            return response
+
+        if response.is_streamed and not response.direct_passthrough:
+            chunks = response.response
+            if hasattr(chunks, 'close'):
+                response.call_on_close(chunks.close)
+            response.response = self._stream(response.iter_encoded(),
+                                             self.encoder(name))
+            response.headers.pop('Content-Length', None)
+        else:
+            key = self._cache_key(response, name)
+            with self._lock:
+                body = self._cache.get(key) if key else None
+                if body is not None:
+                    self._cache.move_to_end(key)
+            if body is not None and hasattr(response.response, 'close'):
+                # the file behind a cached response is not read
+                response.call_on_close(response.response.close)
+            if body is None:
+                response.direct_passthrough = False
+                data = response.get_data()
+                if len(data) < config['FLASKY_COMPRESS_MIN_SIZE']:
+                    return response
+                encoder = self.encoder(name)
+                body = encoder.compress(data) + encoder.finish()
+                if key:
+                    self._store(key, body)
+            response.direct_passthrough = False
+            response.set_data(body)
+        response.headers['Content-Encoding'] = name
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            # the compressed body is a different representation of the
+            # resource, but weak comparison still matches If-None-Match
+            response.set_etag(etag, weak=True)
+        return response
+
+    def _stream(self, chunks, encoder):
+        for chunk in chunks:
+            data = encoder.compress(chunk) + encoder.flush()
+            if data:
+                yield data
+        yield encoder.finish()
+
+    def _cache_key(self, response, name):
+        etag, weak = response.get_etag()
+        if etag is None or response.cache_control.no_store or \
+                response.cache_control.private:
+            return None
+        return request.path, etag, name
+
+    def _store(self, key, body):
+        size = current_app.config['FLASKY_COMPRESS_CACHE_SIZE']
+        with self._lock:
+            self._cache[key] = body
+            while len(self._cache) > size:
+                self._cache.popitem(last=False)
@@ -0,0 +1,33 @@
+import time
+from alembic.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from flask import current_app
+from . import db
+from .models import Role, User
+
+
+def database_revisions():
+    """Return the current and the head revisions of the database."""
+    migrate = current_app.extensions['migrate']
+    config = migrate.migrate.get_config(migrate.directory)
+    heads = set(ScriptDirectory.from_config(config).get_heads())
+    with db.engine.connect() as conn:
+        current = set(MigrationContext.configure(conn).get_current_heads())
+    return current, heads
+
+
+def is_current():
+    """Check, without writing anything, that the deployment tasks have
+    nothing to do."""
+    current, heads = database_revisions()
+    return current == heads and Role.roles_are_current() and \
+        User.self_follows_are_current()
+
+
+def run_step(description, f):
+    print('%s...' % description, flush=True)
+    start = time.time()
+    result = f()
+    print('  done (%s%.2fs)' % ('' if result is None else '%s, ' % result,
+                                time.time() - start))
+    return result
@@ -0,0 +1,169 @@
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from flask import current_app
+from sqlalchemy import event
+from .replicas import RoutingSession
+
+
+def _contains(ids, id):
+    i = bisect_left(ids, id)
+    return i < len(ids) and ids[i] == id
+
+
+def _insert(ids, id):
+    i = bisect_left(ids, id)
+    if i == len(ids) or ids[i] != id:
+        ids.insert(i, id)
+
+
+def _remove(ids, id):
+    i = bisect_left(ids, id)
+    if i < len(ids) and ids[i] == id:
+        del ids[i]
+
+
+class FollowGraph(object):
+    """In-memory copy of the follows table.
+
+    Each user has a sorted array of the ids it follows and another one of
+    the ids of its followers, so the graph takes a fixed 16 bytes per
+    follow. It is loaded on first use, updated when a session that added or
+    removed follows commits in this process, and reloaded every
+    ``FLASKY_FOLLOW_GRAPH_TTL`` seconds to pick up changes made by other
+    processes.
+    """
+    def __init__(self, engine_getter, ttl):
+        self.engine_getter = engine_getter
+        self.ttl = ttl
+        self._reset()
+
+    def _reset(self):
+        self._lock = threading.RLock()
+        self._pid = os.getpid()
+        self._followed = None
+        self._followers = None
+        self._loaded_at = None
+
+    def _lock_for_pid(self):
+        if self._pid != os.getpid():
+            # do not share a lock that might have been held during a fork,
+            # the graph itself is inherited from the parent process
+            self._lock = threading.RLock()
+            self._pid = os.getpid()
+        return self._lock
+
+    def _ensure_loaded(self):
+        if self._followed is None or time.time() - self._loaded_at > self.ttl:
+            self.load()
+
+    def load(self):
+        followed = {}
+        followers = {}
+        rows = self.engine_getter().execute(
+            'SELECT follower_id, followed_id FROM follows '
+            'ORDER BY follower_id, followed_id')
+        for follower_id, followed_id in rows:
+            if follower_id not in followed:
+                followed[follower_id] = array('l')
+            followed[follower_id].append(followed_id)
+            if followed_id not in followers:
+                followers[followed_id] = array('l')
+            followers[followed_id].append(follower_id)
+        # ids were appended in follower order, so these are sorted too
+        with self._lock_for_pid():
+            self._followed = followed
+            self._followers = followers
+            self._loaded_at = time.time()
+
+    def invalidate(self):
+        with self._lock_for_pid():
+            self._followed = None
+            self._followers = None
+
+    def is_following(self, follower_id, followed_id):
+        with self._lock_for_pid():
+            self._ensure_loaded()
+            return _contains(self._followed.get(follower_id, ()), followed_id)
+
+    def followed_count(self, user_id):
+        with self._lock_for_pid():
+            self._ensure_loaded()
+            return len(self._followed.get(user_id, ()))
+
+    def followers_count(self, user_id):
+        with self._lock_for_pid():
+            self._ensure_loaded()
+            return len(self._followers.get(user_id, ()))
+
+    def followed_ids(self, user_id):
+        with self._lock_for_pid():
+            self._ensure_loaded()
+            return array('l', self._followed.get(user_id, ()))
+
+    def followers_ids(self, user_id):
+        with self._lock_for_pid():
+            self._ensure_loaded()
+            return array('l', self._followers.get(user_id, ()))
+
+    def add(self, follower_id, followed_id):
+        with self._lock_for_pid():
+            if self._followed is None:
+                return
+            _insert(self._followed.setdefault(follower_id, array('l')),
+                    followed_id)
+            _insert(self._followers.setdefault(followed_id, array('l')),
+                    follower_id)
+
+    def remove(self, follower_id, followed_id):
+        with self._lock_for_pid():
+            if self._followed is None:
+                return
+            _remove(self._followed.get(follower_id, array('l')), followed_id)
+            _remove(self._followers.get(followed_id, array('l')),
+                    follower_id)
+
+
+def get_follow_graph():
+    """Return the follow graph of the current application, if enabled."""
+    return current_app.extensions.get('follow_graph')
+
+
+def has_follow_changes(session):
+    """Check if a session holds follows that are not committed yet."""
+    from .models import Follow
+    return bool(session.info.get('follow_changes')) or \
+        any(isinstance(obj, Follow) for obj in session.new) or \
+        any(isinstance(obj, Follow) for obj in session.deleted)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def record_follow_changes(session, flush_context):
+    from .models import Follow
+    changes = session.info.setdefault('follow_changes', [])
+    for obj in session.new:
+        if isinstance(obj, Follow):
+            changes.append((True, obj.follower_id, obj.followed_id))
+    for obj in session.deleted:
+        if isinstance(obj, Follow):
+            changes.append((False, obj.follower_id, obj.followed_id))
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def apply_follow_changes(session):
+    changes = session.info.pop('follow_changes', None)
+    graph = session.app.extensions.get('follow_graph')
+    if not changes or graph is None:
+        return
+    for added, follower_id, followed_id in changes:
+        if added:
+            graph.add(follower_id, followed_id)
+        else:
+            graph.remove(follower_id, followed_id)
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def discard_follow_changes(session):
+    session.info.pop('follow_changes', None)
@@ -0,0 +1,239 @@
+"""Test impact analysis: which tests run which lines of the application.
+
+``flask test --record-impact`` runs the tests with a line tracer and saves
+the tests that ran each line of the project (outside of ``tests/``) to an
+impact map. ``flask test --changed`` then runs only the tests that ran the
+functions edited since the map was recorded, as reported by ``git diff``.
+
+Coverage 4.4 cannot tell the tests apart, as its contexts appeared in 5.0,
+hence the tracer of startup.py, which flasky.py starts before importing
+the application. The lines run before the first test, at import time or
+while loading the tests, are run for every test.
+"""
+import ast
+import json
+import os
+import re
+import subprocess
+import sys
+import unittest
+from collections import defaultdict, namedtuple
+from startup import LineRecorder, record_lines  # noqa: F401
+
+HUNK_RE = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+\d+(?:,\d+)? @@')
+
+Span = namedtuple('Span', ['name', 'start', 'end'])
+
+
+class ImpactMap(object):
+    """The tests that ran each line of each file."""
+    def __init__(self, commit=None, dirty=False):
+        self.commit = commit
+        self.dirty = dirty
+        self.tests = []
+        self.lines = defaultdict(lambda: defaultdict(set))
+        # the lines run before the tests, for all of them
+        self.imported = defaultdict(set)
+
+    def add_imported(self, lines):
+        for path, line in lines:
+            self.imported[path].add(line)
+
+    def add(self, test_id, lines):
+        index = len(self.tests)
+        self.tests.append(test_id)
+        for path, line in lines:
+            self.lines[path][line].add(index)
+
+    def tests_covering(self, path, start=None, end=None):
+        """Return the ids of the tests that ran lines ``start`` to ``end``
+        of a file, or any of its lines."""
+        indexes = set()
+        for line, tests in self.lines.get(path, {}).items():
+            if (start is None or line >= start) and \
+                    (end is None or line <= end):
+                indexes.update(tests)
+        return set(self.tests[index] for index in indexes)
+
+    def save(self, path):
+        with open(path + '.tmp', 'w') as f:
+            json.dump({
+                'commit': self.commit,
+                'dirty': self.dirty,
+                'tests': self.tests,
+                'lines': {
+                    file_path: {str(line): sorted(tests)
+                                for line, tests in lines.items()}
+                    for file_path, lines in self.lines.items()},
+                'imported': {file_path: sorted(lines) for file_path, lines
+                             in self.imported.items()}}, f)
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        impact = cls(data['commit'], data['dirty'])
+        impact.tests = data['tests']
+        for file_path, lines in data['lines'].items():
+            for line, tests in lines.items():
+                impact.lines[file_path][int(line)] = set(tests)
+        for file_path, lines in data.get('imported', {}).items():
+            impact.imported[file_path] = set(lines)
+        return impact
+
+
+def git(*args):
+    return subprocess.check_output(('git',) + args,
+                                   universal_newlines=True)
+
+
+def record_impact(suite, root, tests_dir, stream=None, recorder=None):
+    """Run a suite of tests with the line tracer and return the result and
+    the impact map of the files of ``root``, outside of ``tests_dir`` and
+    of the Python installation. The lines recorded by ``recorder``, the
+    tracer started by record_lines() before the tests were imported,
+    count as run before the tests."""
+    from .testing import ContextTestResult
+    if recorder is None:
+        recorder = record_lines(root, tests_dir)
+    impact = ImpactMap(git('rev-parse', 'HEAD').strip(),
+                       bool(git('status', '--porcelain',
+                                '--untracked-files=no').strip()))
+
+    class RecordingResult(ContextTestResult):
+        def startTest(self, test):
+            recorder.lines = set()
+            super(RecordingResult, self).startTest(test)
+
+        def stopTest(self, test):
+            super(RecordingResult, self).stopTest(test)
+            # threads left running by the test keep adding lines
+            lines, recorder.lines = recorder.lines, set()
+            impact.add(test.id(), list(lines))
+
+    runner = unittest.TextTestRunner(stream=stream or sys.stderr,
+                                     verbosity=2,
+                                     resultclass=RecordingResult)
+    lines, recorder.lines = recorder.lines, set()
+    impact.add_imported(lines)
+    try:
+        result = runner.run(suite)
+    finally:
+        recorder.stop()
+    return result, impact
+
+
+def function_spans(source):
+    """Return the spans of the functions of a module, from their first
+    decorator to the line before the next statement."""
+    spans = []
+
+    def first_line(node):
+        return min([node.lineno] + [decorator.lineno for decorator in
+                                    getattr(node, 'decorator_list', [])])
+
+    def visit(body, end, prefix):
+        for i, node in enumerate(body):
+            node_end = first_line(body[i + 1]) - 1 \
+                if i + 1 < len(body) else end
+            name = prefix
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef,
+                                 ast.ClassDef)):
+                name = prefix + node.name
+                if not isinstance(node, ast.ClassDef):
+                    spans.append(Span(name, first_line(node), node_end))
+                name += '.'
+            for field in ('body', 'orelse', 'finalbody'):
+                visit(getattr(node, field, []), node_end, name)
+            for handler in getattr(node, 'handlers', []):
+                visit(handler.body, node_end, name)
+
+    visit(ast.parse(source).body, len(source.splitlines()), '')
+    return spans
+
+
+def changed_lines(commit):
+    """Return the lines of each file, as of ``commit``, changed in the
+    working tree since then. Lines added between two lines count as a
+    change of the line before."""
+    changes = defaultdict(set)
+    path = None
+    for line in git('diff', '-U0', '--no-color', '--no-renames',
+                    commit).splitlines():
+        if line.startswith('--- '):
+            path = line[6:] if line.startswith('--- a/') else None
+            continue
+        match = HUNK_RE.match(line)
+        if match and path is not None:
+            start = int(match.group(1))
+            count = int(match.group(2) or 1)
+            if count:
+                changes[path].update(range(start, start + count))
+            else:
+                changes[path].add(max(start, 1))
+    return changes
+
+
+def affected_tests(impact, tests_dir, root):
+    """Return the ids of the tests affected by the changes made since the
+    impact map was recorded, the test modules that changed and a
+    description of each change.
+
+    A change in a function affects the tests that ran the function. A
+    change outside of the functions of a file, or in a file that is not
+    Python, such as a template, affects the tests that ran any of its
+    lines, or all of them when the file ran before the tests, as modules
+    do when they are imported. So does a change of a Python file that was
+    not recorded at all, the tracer may not have seen it run.
+    """
+    tests = set()
+    changes = []
+    tests_prefix = os.path.relpath(tests_dir, root).replace(os.sep, '/') \
+        + '/'
+    modules = set()
+    untracked = git('ls-files', '--others', '--exclude-standard', '--',
+                    tests_dir).splitlines()
+    changed = changed_lines(impact.commit)
+    for path in sorted(set(changed) | set(untracked)):
+        if path.startswith(tests_prefix):
+            name = path[len(tests_prefix):]
+            if os.path.basename(name).startswith('test') and \
+                    name.endswith('.py'):
+                modules.add(name[:-3].replace('/', '.'))
+                changes.append(path)
+            continue
+        imported = path in impact.imported
+        if path not in impact.lines and not imported:
+            if path.endswith('.py'):
+                tests.update(impact.tests)
+                changes.append('%s (not recorded)' % path)
+            continue
+        spans = []
+        if path.endswith('.py'):
+            spans = function_spans(git('show', '%s:%s' % (impact.commit,
+                                                          path)))
+        for line in sorted(changed[path]):
+            containing = [span for span in spans
+                          if span.start <= line <= span.end]
+            if containing:
+                span = max(containing, key=lambda span: span.start)
+                change = '%s:%s' % (path, span.name)
+                tests.update(impact.tests_covering(path, span.start,
+                                                   span.end))
+            else:
+                change = path
+                tests.update(impact.tests if imported
+                             else impact.tests_covering(path))
+            if change not in changes:
+                changes.append(change)
+    return tests, modules, changes
+
+
+def select_tests(suite, test_ids, modules):
+    """Return a suite of the tests of ``suite`` that have one of the ids or
+    are in one of the modules."""
+    from .testing import iter_tests
+    return unittest.TestSuite(
+        test for test in iter_tests(suite)
+        if test.id() in test_ids or type(test).__module__ in modules)
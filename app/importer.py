@@ -0,0 +1,141 @@
+import csv
+import json
+import os
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from itertools import islice
+from dateutil.parser import parse as parse_date
+from . import db
+from .models import User, Post
+from .rendering import render_all, render_post
+
+
+def guess_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        return 'csv'
+    if extension in ('.jsonl', '.ndjson', '.json'):
+        return 'jsonl'
+    return None
+
+
+def read_records(stream, format, skip=0):
+    """Yield the records of a JSON Lines or CSV stream one at a time, after
+    skipping the first ``skip``. JSON lines that cannot be parsed are
+    yielded as None, blank lines are not records."""
+    if format == 'csv':
+        for record in islice(csv.DictReader(stream), skip, None):
+            yield record
+        return
+    lines = (line for line in stream if line.strip())
+    for line in islice(lines, skip, None):
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield None
+
+
+def post_row(record, authors):
+    """Return the column values of the post in a record, and the reason the
+    record is skipped when it is not valid."""
+    if not isinstance(record, dict):
+        return None, 'invalid record'
+    body = record.get('body')
+    if not body or not isinstance(body, str):
+        return None, 'missing body'
+    author_id = authors.get(record.get('author'))
+    if author_id is None:
+        return None, 'unknown author'
+    timestamp = record.get('timestamp')
+    if timestamp:
+        try:
+            timestamp = parse_date(timestamp)
+        except (TypeError, ValueError, OverflowError):
+            return None, 'invalid timestamp'
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.astimezone(timezone.utc).replace(
+                tzinfo=None)
+    else:
+        timestamp = datetime.utcnow()
+    return {'body': body, 'timestamp': timestamp,
+            'author_id': author_id}, None
+
+
+def load_checkpoint(path):
+    if path is None or not os.path.exists(path):
+        return {'records': 0, 'imported': 0, 'skipped': {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_checkpoint(path, state):
+    # replaced atomically, an interrupted write keeps the previous state
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f)
+    os.replace(path + '.tmp', path)
+
+
+def import_posts(stream, format, batch_size=1000, workers=None,
+                 checkpoint=None, progress=None):
+    """Import the posts of a JSON Lines or CSV stream.
+
+    Each record has the ``author`` username, the ``body`` and optionally a
+    ``timestamp``. Records are read, rendered and inserted in batches, so
+    memory use does not depend on the size of the input. The bodies of a
+    batch render in the render pool while the previous batch is inserted.
+
+    After each batch is committed the number of records consumed is saved
+    to the ``checkpoint`` file, and an import given the same checkpoint
+    resumes after them. A batch committed right before a crash, before its
+    checkpoint is saved, is imported again on resume.
+
+    Returns the checkpoint state, with the totals of posts imported and of
+    records skipped by reason.
+    """
+    state = load_checkpoint(checkpoint)
+    skipped = Counter(state['skipped'])
+    # built once, looking up each author would be a query per post
+    authors = dict(db.session.query(User.username, User.id))
+    records = read_records(stream, format, skip=state['records'])
+    start = time.time()
+    imported = 0
+    pending = None
+
+    def insert(rows, bodies_html, count, batch_skipped):
+        nonlocal imported
+        for row, body_html in zip(rows, bodies_html):
+            row['body_html'] = body_html
+        if rows:
+            db.session.execute(Post.__table__.insert(), rows)
+        db.session.commit()
+        imported += len(rows)
+        state['records'] += count
+        state['imported'] += len(rows)
+        skipped.update(batch_skipped)
+        state['skipped'] = dict(skipped)
+        if checkpoint is not None:
+            save_checkpoint(checkpoint, state)
+        if progress:
+            progress(state['records'], imported, time.time() - start)
+
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            break
+        rows = []
+        batch_skipped = Counter()
+        for record in batch:
+            row, reason = post_row(record, authors)
+            if row is None:
+                batch_skipped[reason] += 1
+            else:
+                rows.append(row)
+        bodies_html = render_all(render_post, [row['body'] for row in rows],
+                                 workers)
+        if pending is not None:
+            insert(*pending)
+        pending = (rows, bodies_html, len(batch), batch_skipped)
+    if pending is not None:
+        insert(*pending)
+    return state
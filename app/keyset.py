@@ -0,0 +1,53 @@
+from datetime import datetime
+from sqlalchemy import and_, or_
+
+CURSOR_FORMAT = '%Y%m%d%H%M%S%f'
+
+
+def encode_cursor(timestamp, id):
+    return '%s-%d' % (timestamp.strftime(CURSOR_FORMAT), id)
+
+
+def decode_cursor(cursor):
+    """Return the (timestamp, id) key in a cursor, or None if invalid."""
+    try:
+        timestamp, id = cursor.split('-')
+        return datetime.strptime(timestamp, CURSOR_FORMAT), int(id)
+    except (AttributeError, ValueError):
+        return None
+
+
+class KeysetPagination(object):
+    """Pages through a query ordered by a (timestamp, id) key.
+
+    Instead of an OFFSET, each page starts right after the key of the last
+    item of the previous page (the cursor), so fetching any page costs the
+    same as fetching the first one when the key is indexed. Pages go from
+    the newest to the oldest item unless ``ascending`` is set.
+    """
+    def __init__(self, query, timestamp, id, per_page, cursor=None,
+                 ascending=False):
+        key = decode_cursor(cursor) if cursor else None
+        if key is not None:
+            if ascending:
+                query = query.filter(or_(
+                    timestamp > key[0],
+                    and_(timestamp == key[0], id > key[1])))
+            else:
+                query = query.filter(or_(
+                    timestamp < key[0],
+                    and_(timestamp == key[0], id < key[1])))
+        if ascending:
+            query = query.order_by(timestamp.asc(), id.asc())
+        else:
+            query = query.order_by(timestamp.desc(), id.desc())
+        items = query.limit(per_page + 1).all()
+        self.cursor = cursor if key is not None else None
+        self.per_page = per_page
+        self.has_next = len(items) > per_page
+        self.items = items[:per_page]
+        self.next_cursor = None
+        if self.has_next:
+            last = self.items[-1]
+            self.next_cursor = encode_cursor(
+                getattr(last, timestamp.key), getattr(last, id.key))
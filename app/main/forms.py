@@ -1,7 +1,7 @@
 from flask_wtf import FlaskForm
 from wtforms import StringField, TextAreaField, BooleanField, SelectField,\
-    SubmitField
-from wtforms.validators import DataRequired, Length, Email, Regexp
+    SubmitField, IntegerField, DateField
+from wtforms.validators import DataRequired, Length, Email, Regexp, Optional
 from wtforms import ValidationError
 from flask_pagedown.fields import PageDownField
 from ..models import Role, User
@@ -59,3 +59,12 @@ class PostForm(FlaskForm):
 class CommentForm(FlaskForm):
     body = StringField('Enter your comment', validators=[DataRequired()])
     submit = SubmitField('Submit')
+
+
+class BulkModerateForm(FlaskForm):
+    author = StringField('Author', validators=[Optional(), Length(1, 64)])
+    post = IntegerField('Post', validators=[Optional()])
+    since = DateField('From', validators=[Optional()])
+    until = DateField('To', validators=[Optional()])
+    enable = SubmitField('Enable')
+    disable = SubmitField('Disable')
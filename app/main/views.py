@@ -1,13 +1,20 @@
+from datetime import datetime, time, timedelta
+from urllib.parse import urlparse
 from flask import render_template, redirect, url_for, abort, flash, request,\
     current_app, make_response
 from flask_login import login_required, current_user
 from flask_sqlalchemy import get_debug_queries
 from . import main
 from .forms import EditProfileForm, EditProfileAdminForm, PostForm,\
-    CommentForm
-from .. import db
-from ..models import Permission, Role, User, Post, Comment
+    CommentForm, BulkModerateForm
+from .. import db, writes
+from ..models import Permission, Moderation, Role, User, Post, Comment
 from ..decorators import admin_required, permission_required
+from ..exceptions import ValidationError
+from ..keyset import KeysetPagination
+from ..advisor import record_queries
+from ..timeline import TimelinePage, use_merged_timeline
+from ..trending import TrendingPagination
 
 
 @main.after_app_request
@@ -18,9 +25,36 @@ def after_request(response):
                 'Slow query: %s\nParameters: %s\nDuration: %fs\nContext: %s\n'
                 % (query.statement, query.parameters, query.duration,
                    query.context))
+    if current_app.config['FLASKY_QUERY_LOG']:
+        record_queries(current_app.config['FLASKY_QUERY_LOG'],
+                       get_debug_queries())
     return response
 
 
+# units of work for the write queue, they receive ids instead of model
+# instances because they may run in the session of the writer thread
+def add_post(body, author_id):
+    post = Post(body=body, author_id=author_id)
+    db.session.add(post)
+    db.session.flush()
+    return post.id
+
+
+def add_comment(body, post_id, author_id):
+    comment = Comment(body=body, post_id=post_id, author_id=author_id)
+    db.session.add(comment)
+    db.session.flush()
+    return comment.id
+
+
+def follow_user(follower_id, followed_id):
+    User.query.get(follower_id).follow(User.query.get(followed_id))
+
+
+def unfollow_user(follower_id, followed_id):
+    User.query.get(follower_id).unfollow(User.query.get(followed_id))
+
+
 @main.route('/shutdown')
 def server_shutdown():
     if not current_app.testing:
@@ -36,27 +70,36 @@ def server_shutdown():
 def index():
     form = PostForm()
     if current_user.can(Permission.WRITE) and form.validate_on_submit():
-        post = Post(body=form.body.data,
-                    author=current_user._get_current_object())
-        db.session.add(post)
-        db.session.commit()
+        writes.execute(add_post, form.body.data, current_user.id)
         return redirect(url_for('.index'))
     page = request.args.get('page', 1, type=int)
     show_followed = False
     if current_user.is_authenticated:
         show_followed = bool(request.cookies.get('show_followed', ''))
-    if show_followed:
-        query = current_user.followed_posts
+    per_page = current_app.config['FLASKY_POSTS_PER_PAGE']
+    if show_followed and use_merged_timeline(current_user):
+        pagination = TimelinePage(current_user, max(page, 1), per_page)
     else:
-        query = Post.query
-    pagination = query.order_by(Post.timestamp.desc()).paginate(
-        page=page, per_page=current_app.config['FLASKY_POSTS_PER_PAGE'],
-        error_out=False)
+        if show_followed:
+            query = current_user.followed_posts
+        else:
+            query = Post.query
+        pagination = query.order_by(Post.timestamp.desc()).paginate(
+            page=page, per_page=per_page, error_out=False)
     posts = pagination.items
     return render_template('index.html', form=form, posts=posts,
                            show_followed=show_followed, pagination=pagination)
 
 
+@main.route('/trending')
+def trending():
+    pagination = TrendingPagination(
+        current_app.config['FLASKY_POSTS_PER_PAGE'],
+        cursor=request.args.get('after'))
+    return render_template('trending.html', posts=pagination.items,
+                           pagination=pagination)
+
+
 @main.route('/user/<username>')
 def user(username):
     user = User.query.filter_by(username=username).first_or_404()
@@ -65,8 +108,12 @@ def user(username):
         page=page, per_page=current_app.config['FLASKY_POSTS_PER_PAGE'],
         error_out=False)
     posts = pagination.items
+    suggestions = []
+    if user == current_user:
+        suggestions = user.suggested_users(
+            current_app.config['FLASKY_SUGGESTIONS_TOP_K'])
     return render_template('user.html', user=user, posts=posts,
-                           pagination=pagination)
+                           pagination=pagination, suggestions=suggestions)
 
 
 @main.route('/edit-profile', methods=['GET', 'POST'])
@@ -120,17 +167,21 @@ def post(id):
     post = Post.query.get_or_404(id)
     form = CommentForm()
     if form.validate_on_submit():
-        comment = Comment(body=form.body.data,
-                          post=post,
-                          author=current_user._get_current_object())
-        db.session.add(comment)
-        db.session.commit()
+        comment_id = writes.execute(add_comment, form.body.data, post.id,
+                                    current_user.id)
         flash('Your comment has been published.')
-        return redirect(url_for('.post', id=post.id, page=-1))
+        return redirect(url_for('.post', id=post.id, page=-1,
+                                _anchor='comment-%d' % comment_id))
     page = request.args.get('page', 1, type=int)
     if page == -1:
-        page = (post.comments.count() - 1) // \
-            current_app.config['FLASKY_COMMENTS_PER_PAGE'] + 1
+        # latest comments, read backwards from the end of the thread so
+        # that the cost does not depend on the number of comments
+        latest = KeysetPagination(
+            post.comments, Comment.timestamp, Comment.id,
+            current_app.config['FLASKY_COMMENTS_PER_PAGE'],
+            cursor=request.args.get('before'))
+        return render_template('post.html', posts=[post], form=form,
+                               comments=latest.items[::-1], latest=latest)
     pagination = post.comments.order_by(Comment.timestamp.asc()).paginate(
         page=page, per_page=current_app.config['FLASKY_COMMENTS_PER_PAGE'],
         error_out=False)
@@ -165,11 +216,10 @@ def follow(username):
     if user is None:
         flash('Invalid user.')
         return redirect(url_for('.index'))
-    if current_user.is_following(user):
+    if current_user.is_following(user, cached=False):
         flash('You are already following this user.')
         return redirect(url_for('.user', username=username))
-    current_user.follow(user)
-    db.session.commit()
+    writes.execute(follow_user, current_user.id, user.id)
     flash('You are now following %s.' % username)
     return redirect(url_for('.user', username=username))
 
@@ -182,11 +232,10 @@ def unfollow(username):
     if user is None:
         flash('Invalid user.')
         return redirect(url_for('.index'))
-    if not current_user.is_following(user):
+    if not current_user.is_following(user, cached=False):
         flash('You are not following this user.')
         return redirect(url_for('.user', username=username))
-    current_user.unfollow(user)
-    db.session.commit()
+    writes.execute(unfollow_user, current_user.id, user.id)
     flash('You are not following %s anymore.' % username)
     return redirect(url_for('.user', username=username))
 
@@ -251,7 +300,56 @@ def moderate():
         error_out=False)
     comments = pagination.items
     return render_template('moderate.html', comments=comments,
-                           pagination=pagination, page=page)
+                           pagination=pagination, page=page,
+                           form=BulkModerateForm())
+
+
+def _is_local_path(url):
+    # browsers read //host and /\host as URLs of another host
+    if not url or not url.startswith('/') or url.startswith(('//', '/\\')):
+        return False
+    parsed = urlparse(url)
+    return not parsed.scheme and not parsed.netloc
+
+
+@main.route('/moderate/bulk', methods=['POST'])
+@login_required
+@permission_required(Permission.MODERATE)
+def moderate_bulk():
+    form = BulkModerateForm()
+    page = request.args.get('page', 1, type=int)
+    next = request.args.get('next')
+    if not _is_local_path(next):
+        next = url_for('.moderate', page=page)
+    if not form.validate_on_submit():
+        flash('Invalid moderation criteria.')
+        return redirect(next)
+    criteria = {}
+    ids = request.form.getlist('ids', type=int)
+    if ids:
+        criteria['ids'] = ids
+    if form.author.data:
+        author = User.query.filter_by(username=form.author.data).first()
+        if author is None:
+            flash('Invalid user.')
+            return redirect(next)
+        criteria['author_id'] = author.id
+    if form.post.data is not None:
+        criteria['post_id'] = form.post.data
+    if form.since.data is not None:
+        criteria['since'] = datetime.combine(form.since.data, time())
+    if form.until.data is not None:
+        criteria['until'] = datetime.combine(form.until.data, time()) + \
+            timedelta(days=1)
+    disabled = bool(form.disable.data)
+    try:
+        count = writes.execute(Comment.moderate, disabled, **criteria)
+    except ValidationError:
+        flash('No comments selected.')
+        return redirect(next)
+    flash('%d comments have been %s.' %
+          (count, 'disabled' if disabled else 'enabled'))
+    return redirect(next)
 
 
 @main.route('/moderate/enable/<int:id>')
@@ -259,7 +357,7 @@ def moderate():
 @permission_required(Permission.MODERATE)
 def moderate_enable(id):
     comment = Comment.query.get_or_404(id)
-    comment.disabled = False
+    comment.set_disabled(False)
     db.session.add(comment)
     db.session.commit()
     return redirect(url_for('.moderate',
@@ -271,8 +369,51 @@ def moderate_enable(id):
 @permission_required(Permission.MODERATE)
 def moderate_disable(id):
     comment = Comment.query.get_or_404(id)
-    comment.disabled = True
+    comment.set_disabled(True)
     db.session.add(comment)
     db.session.commit()
     return redirect(url_for('.moderate',
                             page=request.args.get('page', 1, type=int)))
+
+
+MODERATION_QUEUES = {
+    'pending': Moderation.PENDING,
+    'flagged': Moderation.FLAGGED,
+    'disabled': Moderation.DISABLED,
+}
+
+
+@main.route('/moderate/queue')
+@main.route('/moderate/queue/<state>')
+@login_required
+@permission_required(Permission.MODERATE)
+def moderate_queue(state='pending'):
+    if state not in MODERATION_QUEUES:
+        abort(404)
+    query = Comment.query.filter(Comment.state == MODERATION_QUEUES[state])
+    author = request.args.get('author')
+    if author:
+        user = User.query.filter_by(username=author).first_or_404()
+        query = query.filter(Comment.author_id == user.id)
+    post_id = request.args.get('post', type=int)
+    if post_id is not None:
+        query = query.filter(Comment.post_id == post_id)
+    pagination = KeysetPagination(
+        query, Comment.timestamp, Comment.id,
+        current_app.config['FLASKY_COMMENTS_PER_PAGE'],
+        cursor=request.args.get('after'))
+    return render_template('moderate_queue.html', comments=pagination.items,
+                           pagination=pagination, state=state,
+                           queues=sorted(MODERATION_QUEUES), author=author,
+                           post_id=post_id, form=BulkModerateForm())
+
+
+@main.route('/flag/<int:id>')
+@login_required
+@permission_required(Permission.COMMENT)
+def flag(id):
+    comment = Comment.query.get_or_404(id)
+    comment.flag()
+    db.session.commit()
+    flash('The comment has been flagged for moderation.')
+    return redirect(url_for('.post', id=comment.post_id))
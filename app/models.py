@@ -2,11 +2,13 @@ from datetime import datetime
 import hashlib
 from werkzeug.security import generate_password_hash, check_password_hash
 from itsdangerous import TimedJSONWebSignatureSerializer as Serializer
-from markdown import markdown
-import bleach
-from flask import current_app, request, url_for
+from flask import current_app, request
 from flask_login import UserMixin, AnonymousUserMixin
 from app.exceptions import ValidationError
+from .follow_graph import get_follow_graph, has_follow_changes
+from .rendering import render_post, render_comment
+from .serializers import resource_url, select_fields
+from .trending import add_activity
 from . import db, login_manager
 
 
@@ -18,6 +20,13 @@ class Permission:
     ADMIN = 16
 
 
+class Moderation:
+    PENDING = 0
+    APPROVED = 1
+    DISABLED = 2
+    FLAGGED = 3
+
+
 class Role(db.Model):
     __tablename__ = 'roles'
     id = db.Column(db.Integer, primary_key=True)
@@ -31,17 +40,20 @@ class Role(db.Model):
         if self.permissions is None:
             self.permissions = 0
 
+    ROLES = {
+        'User': [Permission.FOLLOW, Permission.COMMENT, Permission.WRITE],
+        'Moderator': [Permission.FOLLOW, Permission.COMMENT,
+                      Permission.WRITE, Permission.MODERATE],
+        'Administrator': [Permission.FOLLOW, Permission.COMMENT,
+                          Permission.WRITE, Permission.MODERATE,
+                          Permission.ADMIN],
+    }
+    DEFAULT_ROLE = 'User'
+
     @staticmethod
     def insert_roles():
-        roles = {
-            'User': [Permission.FOLLOW, Permission.COMMENT, Permission.WRITE],
-            'Moderator': [Permission.FOLLOW, Permission.COMMENT,
-                          Permission.WRITE, Permission.MODERATE],
-            'Administrator': [Permission.FOLLOW, Permission.COMMENT,
-                              Permission.WRITE, Permission.MODERATE,
-                              Permission.ADMIN],
-        }
-        default_role = 'User'
+        roles = Role.ROLES
+        default_role = Role.DEFAULT_ROLE
         for r in roles:
             role = Role.query.filter_by(name=r).first()
             if role is None:
@@ -53,6 +65,30 @@ class Role(db.Model):
             db.session.add(role)
         db.session.commit()
 
+    @staticmethod
+    def permissions_by_id():
+        """Return the permissions of each role id. They are loaded once per
+        application, as roles only change when deploying."""
+        permissions = current_app.extensions.get('role_permissions')
+        if permissions is None:
+            permissions = dict(db.session.query(Role.id, Role.permissions))
+            current_app.extensions['role_permissions'] = permissions
+        return permissions
+
+    @staticmethod
+    def on_changed(mapper, connection, target):
+        current_app.extensions.pop('role_permissions', None)
+
+    @staticmethod
+    def roles_are_current():
+        """Check that the roles match the ones insert_roles() creates."""
+        expected = {name: (sum(perms), name == Role.DEFAULT_ROLE)
+                    for name, perms in Role.ROLES.items()}
+        current = {role.name: (role.permissions, bool(role.default))
+                   for role in Role.query.all()}
+        return all(current.get(name) == value
+                   for name, value in expected.items())
+
     def add_permission(self, perm):
         if not self.has_permission(perm):
             self.permissions += perm
@@ -71,6 +107,11 @@ class Role(db.Model):
         return '<Role %r>' % self.name
 
 
+db.event.listen(Role, 'after_insert', Role.on_changed)
+db.event.listen(Role, 'after_update', Role.on_changed)
+db.event.listen(Role, 'after_delete', Role.on_changed)
+
+
 class Follow(db.Model):
     __tablename__ = 'follows'
     follower_id = db.Column(db.Integer, db.ForeignKey('users.id'),
@@ -78,6 +119,33 @@ class Follow(db.Model):
     followed_id = db.Column(db.Integer, db.ForeignKey('users.id'),
                             primary_key=True)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    __table_args__ = (
+        db.Index('ix_follows_followed_id_timestamp',
+                 'followed_id', 'timestamp'),
+    )
+
+
+class Suggestion(db.Model):
+    __tablename__ = 'suggestions'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'),
+                        primary_key=True)
+    suggested_id = db.Column(db.Integer, db.ForeignKey('users.id'),
+                             primary_key=True)
+    score = db.Column(db.Float)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    __table_args__ = (
+        db.Index('ix_suggestions_user_id_score', 'user_id', 'score'),
+    )
+
+
+class TrendingPost(db.Model):
+    __tablename__ = 'trending_posts'
+    post_id = db.Column(db.Integer, db.ForeignKey('posts.id'),
+                        primary_key=True)
+    score = db.Column(db.Float, nullable=False)
+    __table_args__ = (
+        db.Index('ix_trending_posts_score_post_id', 'score', 'post_id'),
+    )
 
 
 class User(UserMixin, db.Model):
@@ -107,13 +175,36 @@ class User(UserMixin, db.Model):
                                 cascade='all, delete-orphan')
     comments = db.relationship('Comment', backref='author', lazy='dynamic')
 
+    @staticmethod
+    def missing_self_follows():
+        users = User.__table__
+        follows = Follow.__table__
+        return ~db.exists().where(db.and_(
+            follows.c.follower_id == users.c.id,
+            follows.c.followed_id == users.c.id))
+
     @staticmethod
     def add_self_follows():
-        for user in User.query.all():
-            if not user.is_following(user):
-                user.follow(user)
-                db.session.add(user)
-                db.session.commit()
+        """Make all users follow themselves with a single INSERT ... SELECT
+        and return the number of follows that were added."""
+        users = User.__table__
+        missing = db.select([
+            users.c.id.label('follower_id'),
+            users.c.id.label('followed_id'),
+            db.literal(datetime.utcnow(), db.DateTime).label('timestamp'),
+        ]).where(User.missing_self_follows())
+        result = db.session.execute(Follow.__table__.insert().from_select(
+            ['follower_id', 'followed_id', 'timestamp'], missing))
+        db.session.commit()
+        graph = get_follow_graph()
+        if graph is not None and result.rowcount:
+            graph.invalidate()
+        return result.rowcount
+
+    @staticmethod
+    def self_follows_are_current():
+        return db.session.query(User.id).filter(
+            User.missing_self_follows()).first() is None
 
     def __init__(self, **kwargs):
         super(User, self).__init__(**kwargs)
@@ -132,7 +223,8 @@ class User(UserMixin, db.Model):
 
     @password.setter
     def password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = generate_password_hash(
+            password, method=current_app.config['FLASKY_PASSWORD_HASH'])
 
     def verify_password(self, password):
         return check_password_hash(self.password_hash, password)
@@ -195,6 +287,11 @@ class User(UserMixin, db.Model):
         return True
 
     def can(self, perm):
+        if 'role' not in self.__dict__ and self.role_id is not None:
+            # skip loading the role of each user from the database
+            permissions = Role.permissions_by_id().get(self.role_id)
+            if permissions is not None:
+                return permissions & perm == perm
         return self.role is not None and self.role.has_permission(perm)
 
     def is_administrator(self):
@@ -214,7 +311,9 @@ class User(UserMixin, db.Model):
             url=url, hash=hash, size=size, default=default, rating=rating)
 
     def follow(self, user):
-        if not self.is_following(user):
+        # not the follow graph, it may miss the follows committed by the
+        # other processes and the row would be inserted twice
+        if self.id is None or not self.is_following(user, cached=False):
             f = Follow(follower=self, followed=user)
             db.session.add(f)
 
@@ -223,35 +322,76 @@ class User(UserMixin, db.Model):
         if f:
             db.session.delete(f)
 
-    def is_following(self, user):
+    @staticmethod
+    def _follow_graph():
+        # the graph only knows about committed follows
+        graph = get_follow_graph()
+        if graph is not None and not has_follow_changes(db.session()):
+            return graph
+
+    def is_following(self, user, cached=True):
+        """Check if this user follows another one. The cached answer comes
+        from the follow graph, which can be behind the follows committed by
+        other processes, writes must not rely on it."""
         if user.id is None:
             return False
+        graph = self._follow_graph() if cached else None
+        if graph is not None:
+            return graph.is_following(self.id, user.id)
         return self.followed.filter_by(
             followed_id=user.id).first() is not None
 
     def is_followed_by(self, user):
         if user.id is None:
             return False
+        graph = self._follow_graph()
+        if graph is not None:
+            return graph.is_following(user.id, self.id)
         return self.followers.filter_by(
             follower_id=user.id).first() is not None
 
+    def followed_count(self):
+        graph = self._follow_graph()
+        if graph is not None:
+            return graph.followed_count(self.id)
+        return self.followed.count()
+
+    def followers_count(self):
+        graph = self._follow_graph()
+        if graph is not None:
+            return graph.followers_count(self.id)
+        return self.followers.count()
+
+    def suggested_users(self, limit=None):
+        """Return (user, score) pairs of users this user may want to follow,
+        as computed by the last suggestions refresh."""
+        query = db.session.query(User, Suggestion.score)\
+            .join(Suggestion, Suggestion.suggested_id == User.id)\
+            .filter(Suggestion.user_id == self.id)\
+            .order_by(Suggestion.score.desc(), User.id)
+        # the user may have followed some of them since the refresh
+        return [(user, score) for user, score in query
+                if not self.is_following(user)][:limit]
+
     @property
     def followed_posts(self):
         return Post.query.join(Follow, Follow.followed_id == Post.author_id)\
             .filter(Follow.follower_id == self.id)
 
-    def to_json(self):
+    def to_json(self, fields=None, post_count=None):
         json_user = {
-            'url': url_for('api.get_user', id=self.id),
+            'url': resource_url('api.get_user', self.id),
             'username': self.username,
             'member_since': self.member_since,
             'last_seen': self.last_seen,
-            'posts_url': url_for('api.get_user_posts', id=self.id),
-            'followed_posts_url': url_for('api.get_user_followed_posts',
-                                          id=self.id),
-            'post_count': self.posts.count()
+            'posts_url': resource_url('api.get_user_posts', self.id),
+            'followed_posts_url': resource_url('api.get_user_followed_posts',
+                                               self.id),
         }
-        return json_user
+        if fields is None or 'post_count' in fields:
+            json_user['post_count'] = self.posts.count() \
+                if post_count is None else post_count
+        return select_fields(json_user, fields)
 
     def generate_auth_token(self, expiration):
         s = Serializer(current_app.config['SECRET_KEY'],
@@ -294,27 +434,27 @@ class Post(db.Model):
     timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow)
     author_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     comments = db.relationship('Comment', backref='post', lazy='dynamic')
+    __table_args__ = (
+        db.Index('ix_posts_author_id_timestamp', 'author_id', 'timestamp'),
+    )
 
     @staticmethod
     def on_changed_body(target, value, oldvalue, initiator):
-        allowed_tags = ['a', 'abbr', 'acronym', 'b', 'blockquote', 'code',
-                        'em', 'i', 'li', 'ol', 'pre', 'strong', 'ul',
-                        'h1', 'h2', 'h3', 'p']
-        target.body_html = bleach.linkify(bleach.clean(
-            markdown(value, output_format='html'),
-            tags=allowed_tags, strip=True))
-
-    def to_json(self):
+        target.body_html = render_post(value)
+
+    def to_json(self, fields=None, comment_count=None):
         json_post = {
-            'url': url_for('api.get_post', id=self.id),
+            'url': resource_url('api.get_post', self.id),
             'body': self.body,
             'body_html': self.body_html,
             'timestamp': self.timestamp,
-            'author_url': url_for('api.get_user', id=self.author_id),
-            'comments_url': url_for('api.get_post_comments', id=self.id),
-            'comment_count': self.comments.count()
+            'author_url': resource_url('api.get_user', self.author_id),
+            'comments_url': resource_url('api.get_post_comments', self.id),
         }
-        return json_post
+        if fields is None or 'comment_count' in fields:
+            json_post['comment_count'] = self.comments.count() \
+                if comment_count is None else comment_count
+        return select_fields(json_post, fields)
 
     @staticmethod
     def from_json(json_post):
@@ -329,32 +469,34 @@ db.event.listen(Post.body, 'set', Post.on_changed_body)
 
 class Comment(db.Model):
     __tablename__ = 'comments'
+    MODERATE_CHUNK_SIZE = 500
     id = db.Column(db.Integer, primary_key=True)
     body = db.Column(db.Text)
     body_html = db.Column(db.Text)
     timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow)
     disabled = db.Column(db.Boolean)
+    state = db.Column(db.Integer, default=Moderation.PENDING)
     author_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     post_id = db.Column(db.Integer, db.ForeignKey('posts.id'))
+    __table_args__ = (
+        db.Index('ix_comments_state_timestamp', 'state', 'timestamp'),
+        db.Index('ix_comments_post_id_timestamp', 'post_id', 'timestamp'),
+    )
 
     @staticmethod
     def on_changed_body(target, value, oldvalue, initiator):
-        allowed_tags = ['a', 'abbr', 'acronym', 'b', 'code', 'em', 'i',
-                        'strong']
-        target.body_html = bleach.linkify(bleach.clean(
-            markdown(value, output_format='html'),
-            tags=allowed_tags, strip=True))
+        target.body_html = render_comment(value)
 
-    def to_json(self):
+    def to_json(self, fields=None):
         json_comment = {
-            'url': url_for('api.get_comment', id=self.id),
-            'post_url': url_for('api.get_post', id=self.post_id),
+            'url': resource_url('api.get_comment', self.id),
+            'post_url': resource_url('api.get_post', self.post_id),
             'body': self.body,
             'body_html': self.body_html,
             'timestamp': self.timestamp,
-            'author_url': url_for('api.get_user', id=self.author_id),
+            'author_url': resource_url('api.get_user', self.author_id),
         }
-        return json_comment
+        return select_fields(json_comment, fields)
 
     @staticmethod
     def from_json(json_comment):
@@ -363,5 +505,63 @@ class Comment(db.Model):
             raise ValidationError('comment does not have a body')
         return Comment(body=body)
 
+    @staticmethod
+    def insert_many(rows):
+        """Insert comments given as dictionaries of column values, with the
+        ``body_html`` already rendered, and return their ids in order."""
+        db.session.bulk_insert_mappings(Comment, rows, return_defaults=True)
+        config = current_app.config
+        if config['FLASKY_TRENDING']:
+            # bulk inserts do not go through the flush listeners
+            add_activity(db.session.connection(), config,
+                         [(row['post_id'], row['timestamp'],
+                           config['FLASKY_TRENDING_COMMENT_WEIGHT'])
+                          for row in rows])
+        return [row['id'] for row in rows]
+
+    @staticmethod
+    def moderate(disabled, ids=None, author_id=None, post_id=None,
+                 since=None, until=None):
+        """Enable or disable all the matching comments with set-based
+        UPDATE statements and return the number of comments changed."""
+        if ids is None and author_id is None and post_id is None and \
+                since is None and until is None:
+            raise ValidationError('no comments selected')
+        query = Comment.query
+        if author_id is not None:
+            query = query.filter(Comment.author_id == author_id)
+        if post_id is not None:
+            query = query.filter(Comment.post_id == post_id)
+        if since is not None:
+            query = query.filter(Comment.timestamp >= since)
+        if until is not None:
+            query = query.filter(Comment.timestamp < until)
+        if ids is None:
+            return query.update(Comment.moderation_values(disabled),
+                                synchronize_session=False)
+        ids = list(ids)
+        count = 0
+        # keep the number of bound parameters under the SQLite limit
+        for i in range(0, len(ids), Comment.MODERATE_CHUNK_SIZE):
+            chunk = ids[i:i + Comment.MODERATE_CHUNK_SIZE]
+            count += query.filter(Comment.id.in_(chunk)).update(
+                Comment.moderation_values(disabled),
+                synchronize_session=False)
+        return count
+
+    @staticmethod
+    def moderation_values(disabled):
+        return {'disabled': disabled,
+                'state': Moderation.DISABLED if disabled
+                else Moderation.APPROVED}
+
+    def set_disabled(self, disabled):
+        for key, value in self.moderation_values(disabled).items():
+            setattr(self, key, value)
+
+    def flag(self):
+        if self.state != Moderation.DISABLED:
+            self.state = Moderation.FLAGGED
+
 
 db.event.listen(Comment.body, 'set', Comment.on_changed_body)
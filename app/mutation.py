@@ -0,0 +1,469 @@
+"""Mutation testing of the application code.
+
+Each mutant changes one operator, condition, constant or statement of a
+function. It is applied in a process forked from the one that imported the
+application and the tests, by replacing the code of the live function, so
+that every reference to it, such as the view functions of the blueprints,
+runs the mutant. The tests that ran the mutated lines, according to the
+impact map of ``flask test --record-impact``, then run against it, and
+the mutant is killed when one of them fails or when they time out.
+
+Only the code of functions is mutated, module level code has run before
+the fork.
+"""
+import ast
+import importlib
+import io
+import multiprocessing
+import os
+import signal
+import time
+import unittest
+from collections import OrderedDict, deque, namedtuple
+from multiprocessing.connection import wait
+from types import FunctionType
+from .testing import ContextTestResult
+
+# tools of the test suite, which must not run mutated
+EXCLUDED_MODULES = ('app/impact.py', 'app/mutation.py', 'app/testing.py')
+
+NEGATED_COMPARISONS = {
+    ast.Eq: ast.NotEq, ast.NotEq: ast.Eq,
+    ast.Lt: ast.GtE, ast.GtE: ast.Lt,
+    ast.Gt: ast.LtE, ast.LtE: ast.Gt,
+    ast.Is: ast.IsNot, ast.IsNot: ast.Is,
+    ast.In: ast.NotIn, ast.NotIn: ast.In,
+}
+SYMBOLS = {
+    ast.Eq: '==', ast.NotEq: '!=', ast.Lt: '<', ast.GtE: '>=', ast.Gt: '>',
+    ast.LtE: '<=', ast.Is: 'is', ast.IsNot: 'is not', ast.In: 'in',
+    ast.NotIn: 'not in', ast.And: 'and', ast.Or: 'or',
+}
+REMOVABLE_STATEMENTS = (ast.Expr, ast.Assign, ast.AugAssign, ast.Return,
+                        ast.Raise, ast.Delete)
+
+# killed and timeout count as killed, error mutants are not counted
+KILLED = 'killed'
+TIMEOUT = 'timeout'
+SURVIVED = 'survived'
+NO_TESTS = 'no tests'
+ERROR = 'error'
+
+Mutant = namedtuple('Mutant', [
+    'path', 'function', 'node', 'operator', 'line', 'end_line',
+    'description'])
+
+
+def _end_line(node):
+    return max(getattr(child, 'lineno', node.lineno)
+               for child in ast.walk(node))
+
+
+def _is_docstring(body, index, owner):
+    return index == 0 and isinstance(owner, (ast.FunctionDef,
+                                             ast.AsyncFunctionDef,
+                                             ast.ClassDef)) and \
+        isinstance(body[0], ast.Expr) and isinstance(body[0].value, ast.Str)
+
+
+def _constant(node):
+    """Return the mutated value of a number or boolean constant, or None."""
+    if isinstance(node, ast.NameConstant) and isinstance(node.value, bool):
+        return not node.value
+    if isinstance(node, ast.Num) and not isinstance(node.n, complex):
+        return node.n + 1
+    return None
+
+
+def _mutations(node):
+    """Yield the ``(operator, argument, description, lines node)`` of the
+    mutations of a node."""
+    if isinstance(node, ast.Compare):
+        for i, op in enumerate(node.ops):
+            negated = NEGATED_COMPARISONS[type(op)]
+            yield ('comparison', i, '%s -> %s' % (
+                SYMBOLS[type(op)], SYMBOLS[negated]), node)
+    elif isinstance(node, ast.BoolOp):
+        other = ast.Or if isinstance(node.op, ast.And) else ast.And
+        yield ('boolean', None, '%s -> %s' % (SYMBOLS[type(node.op)],
+                                            SYMBOLS[other]), node)
+    elif isinstance(node, (ast.If, ast.While, ast.IfExp, ast.Assert)):
+        if isinstance(node.test, ast.UnaryOp) and \
+                isinstance(node.test.op, ast.Not):
+            yield ('negation', None, 'removed not', node.test)
+        else:
+            yield ('negation', None, 'negated condition', node.test)
+    elif _constant(node) is not None:
+        value = node.value if isinstance(node, ast.NameConstant) else node.n
+        yield ('constant', None, '%r -> %r' % (value, _constant(node)),
+               node)
+    for field in ('body', 'orelse', 'finalbody'):
+        body = getattr(node, field, None)
+        if not isinstance(body, list):
+            continue
+        for i, statement in enumerate(body):
+            if isinstance(statement, REMOVABLE_STATEMENTS) and \
+                    not _is_docstring(body, i, node):
+                yield ('removal', (field, i), 'removed %s statement' %
+                       type(statement).__name__.lower(), statement)
+
+
+def _functions(tree):
+    """Yield the qualified name and the node of the outermost functions of
+    a module, the functions defined in them are part of them."""
+    def visit(body, prefix):
+        for node in body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                yield prefix + node.name, node
+            elif isinstance(node, ast.ClassDef):
+                yield from visit(node.body, prefix + node.name + '.')
+            else:
+                for field in ('body', 'orelse', 'finalbody'):
+                    yield from visit(getattr(node, field, []), prefix)
+    yield from visit(tree.body, '')
+
+
+def _nodes(function):
+    # not the decorators and the defaults, they have run when the function
+    # was defined
+    return [function] + [node for statement in function.body
+                         for node in ast.walk(statement)]
+
+
+def generate_mutants(path, source, functions=None):
+    """Return the mutants of the functions of a module. ``functions`` are
+    qualified names of functions or classes to restrict them to."""
+    mutants = []
+    for name, function in _functions(ast.parse(source)):
+        if functions is not None and not any(
+                name == selected or name.startswith(selected + '.')
+                for selected in functions):
+            continue
+        for index, node in enumerate(_nodes(function)):
+            for operator, argument, description, lines in _mutations(node):
+                mutants.append(Mutant(
+                    path, name, index, (operator, argument), lines.lineno,
+                    _end_line(lines), description))
+    return mutants
+
+
+def mutate_tree(tree, mutant):
+    """Apply a mutant to the tree of its module, in place."""
+    for name, function in _functions(tree):
+        if name == mutant.function:
+            break
+    else:
+        raise LookupError(mutant.function)
+    node = _nodes(function)[mutant.node]
+    operator, argument = mutant.operator
+    if operator == 'comparison':
+        node.ops[argument] = NEGATED_COMPARISONS[type(node.ops[argument])]()
+    elif operator == 'boolean':
+        node.op = ast.Or() if isinstance(node.op, ast.And) else ast.And()
+    elif operator == 'negation':
+        if isinstance(node.test, ast.UnaryOp) and \
+                isinstance(node.test.op, ast.Not):
+            node.test = node.test.operand
+        else:
+            node.test = ast.copy_location(
+                ast.UnaryOp(op=ast.Not(), operand=node.test), node.test)
+    elif operator == 'constant':
+        value = _constant(node)
+        if isinstance(node, ast.NameConstant):
+            node.value = value
+        else:
+            node.n = value
+    elif operator == 'removal':
+        field, index = argument
+        body = getattr(node, field)
+        body[index] = ast.copy_location(ast.Pass(), body[index])
+    ast.fix_missing_locations(tree)
+    return function
+
+
+def _find_code(code, name, lines):
+    for const in code.co_consts:
+        if hasattr(const, 'co_code'):
+            if const.co_name == name and const.co_firstlineno in lines:
+                return const
+            found = _find_code(const, name, lines)
+            if found is not None:
+                return found
+    return None
+
+
+def _unwrap(obj):
+    if isinstance(obj, property):
+        candidates = [obj.fget, obj.fset, obj.fdel]
+    elif isinstance(obj, (staticmethod, classmethod)):
+        candidates = [obj.__func__]
+    else:
+        candidates = [obj]
+    for candidate in candidates:
+        while candidate is not None:
+            if isinstance(candidate, FunctionType):
+                yield candidate
+            candidate = getattr(candidate, '__wrapped__', None)
+
+
+def module_name(path):
+    name = os.path.splitext(path)[0].replace('/', '.')
+    return name[:-len('.__init__')] if name.endswith('.__init__') else name
+
+
+def apply_mutant(mutant, root):
+    """Replace the code of the live function of a mutant with the mutated
+    code, and return the function and its original code."""
+    module = importlib.import_module(module_name(mutant.path))
+    with open(os.path.join(root, mutant.path)) as f:
+        tree = ast.parse(f.read())
+    function = mutate_tree(tree, mutant)
+    # the first line of a decorated function is its def or its first
+    # decorator, depending on the version of Python
+    lines = {function.lineno} | {decorator.lineno for decorator in
+                                 function.decorator_list}
+    code = _find_code(compile(tree, module.__file__, 'exec'),
+                      function.name, lines)
+    obj = module
+    for part in mutant.function.split('.'):
+        # the descriptors of a class, not what they return
+        namespace = vars(obj)
+        obj = namespace[part] if part in namespace else getattr(obj, part)
+    for live in _unwrap(obj):
+        if live.__code__.co_name == code.co_name and \
+                live.__code__.co_firstlineno == code.co_firstlineno:
+            break
+    else:
+        raise LookupError('No live function for %s' % mutant.function)
+    original = live.__code__
+    live.__code__ = code
+    return live, original
+
+
+class _TimedResult(ContextTestResult):
+    # the contexts and sessions leaked by a test would break the next ones
+    def startTest(self, test):
+        self._started = time.time()
+        super(_TimedResult, self).startTest(test)
+
+    def stopTest(self, test):
+        super(_TimedResult, self).stopTest(test)
+        self.seconds[test.id()] = time.time() - self._started
+
+
+def _run_tests(test_ids, failfast):
+    suite = unittest.defaultTestLoader.loadTestsFromNames(test_ids)
+    result = _TimedResult(io.StringIO(), False, 0)
+    result.seconds = {}
+    result.failfast = failfast
+    suite.run(result)
+    return result
+
+
+def _silence():
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    os.dup2(devnull, 2)
+
+
+def _child(connection, target, args):
+    from .rendering import shutdown_render_pool
+    # a process group, so that a timeout stops the processes it started
+    os.setpgid(0, 0)
+    _silence()
+    try:
+        connection.send(target(*args))
+    except BaseException as e:
+        connection.send(e)
+    finally:
+        # the process is not done until the render pool of the tests is
+        shutdown_render_pool()
+
+
+def _baseline(test_ids):
+    result = _run_tests(test_ids, failfast=False)
+    failed = set(test.id() for test, traceback in
+                 result.failures + result.errors +
+                 [(test, None) for test in result.unexpectedSuccesses])
+    return failed, result.seconds
+
+
+def _test_mutant(mutant, root, test_ids):
+    try:
+        apply_mutant(mutant, root)
+    except Exception as e:
+        return ERROR, '%s: %s' % (type(e).__name__, e)
+    result = _run_tests(test_ids, failfast=True)
+    if result.wasSuccessful():
+        return SURVIVED, None
+    failed = (result.failures + result.errors)[0][0]
+    return KILLED, failed.id()
+
+
+def run_forked(target, args, timeout=None):
+    """Run a function in a forked process and return its result, or raise
+    TimeoutError."""
+    return list(run_pool([(target, args, timeout)], 1))[0][1]
+
+
+def run_pool(jobs, workers):
+    """Run ``(target, args, timeout)`` jobs, each in a new process forked
+    from this one, ``workers`` at a time, and yield the index and the
+    result of each job as it completes. A job that does not complete in
+    time is stopped, and its result is a TimeoutError."""
+    context = multiprocessing.get_context('fork')
+    pending = deque(enumerate(jobs))
+    running = {}
+    while pending or running:
+        while pending and len(running) < workers:
+            index, (target, args, timeout) = pending.popleft()
+            receiver, sender = context.Pipe(duplex=False)
+            process = context.Process(target=_child,
+                                      args=(sender, target, args))
+            process.start()
+            sender.close()
+            deadline = time.time() + timeout if timeout else None
+            running[process.sentinel] = (index, process, receiver, deadline)
+        deadlines = [deadline for index, process, receiver, deadline in
+                     running.values() if deadline is not None]
+        wait(list(running) + [receiver for index, process, receiver,
+                              deadline in running.values()],
+             timeout=max(0, min(deadlines) - time.time())
+             if deadlines else None)
+        for sentinel, (index, process, receiver, deadline) in \
+                list(running.items()):
+            if receiver.poll():
+                try:
+                    result = receiver.recv()
+                except EOFError:
+                    result = RuntimeError('The process exited with %s' %
+                                          process.exitcode)
+            elif not process.is_alive():
+                result = RuntimeError('The process exited with %s' %
+                                      process.exitcode)
+            elif deadline is not None and time.time() >= deadline:
+                try:
+                    os.killpg(process.pid, signal.SIGKILL)
+                except OSError:
+                    # not in its own group yet
+                    process.terminate()
+                result = TimeoutError()
+            else:
+                continue
+            process.join()
+            receiver.close()
+            del running[sentinel]
+            yield index, result
+
+
+def parse_target(target, root):
+    """Split a ``path::Class.function`` target, with a path relative to the
+    project or to the application."""
+    path, _, function = target.partition('::')
+    if not os.path.exists(os.path.join(root, path)) and \
+            os.path.exists(os.path.join(root, 'app', path)):
+        path = 'app/' + path
+    return path.replace(os.sep, '/'), function or None
+
+
+def find_mutants(targets, root):
+    """Return the mutants of the targets, all the modules of the
+    application by default."""
+    if not targets:
+        targets = []
+        for dirpath, dirnames, filenames in os.walk(os.path.join(root,
+                                                                 'app')):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if filename.endswith('.py'):
+                    path = os.path.relpath(os.path.join(dirpath, filename),
+                                           root).replace(os.sep, '/')
+                    if path not in EXCLUDED_MODULES:
+                        targets.append(path)
+    functions = OrderedDict()
+    for target in targets:
+        path, function = parse_target(target, root)
+        if path not in functions:
+            functions[path] = set()
+        if functions[path] is not None:
+            functions[path] = None if function is None else \
+                functions[path] | {function}
+    mutants = []
+    for path, selected in functions.items():
+        with open(os.path.join(root, path)) as f:
+            mutants.extend(generate_mutants(path, f.read(), selected))
+    return mutants
+
+
+MutantResult = namedtuple('MutantResult', ['mutant', 'status', 'detail'])
+
+
+def run_mutants(mutants, impact, root, workers, timeout, test_prefix='',
+                progress=None, baseline_failures=None):
+    """Test mutants against the tests that cover their lines and return the
+    result of each, in the order of the mutants.
+
+    The tests that fail without mutation are left out, and passed in order
+    to ``baseline_failures`` when given. A mutant times out
+    after twice the time of its tests without mutation plus ``timeout``
+    seconds.
+    """
+    tests = {}
+    for mutant in mutants:
+        tests[mutant] = sorted(
+            test_id for test_id in impact.tests_covering(
+                mutant.path, mutant.line, mutant.end_line)
+            if test_id.startswith(test_prefix))
+    covering = sorted(set(test_id for test_ids in tests.values()
+                          for test_id in test_ids))
+    failed, seconds = set(), {}
+    if covering:
+        # imported once here rather than in each process
+        unittest.defaultTestLoader.loadTestsFromNames(covering)
+        failed, seconds = run_forked(_baseline, (covering,))
+    if failed and baseline_failures:
+        baseline_failures(sorted(failed))
+    results = [None] * len(mutants)
+    jobs = []
+    indexes = []
+    for i, mutant in enumerate(mutants):
+        # the fastest tests first, they fail sooner
+        test_ids = sorted((test_id for test_id in tests[mutant]
+                           if test_id not in failed),
+                          key=lambda test_id: seconds.get(test_id, 0))
+        if not test_ids:
+            dropped = len(set(tests[mutant]) & failed)
+            results[i] = MutantResult(
+                mutant, NO_TESTS, '%d failing without mutation' % dropped
+                if dropped else None)
+            continue
+        jobs.append((_test_mutant, (mutant, root, test_ids),
+                     2 * sum(seconds.get(test_id, 0) for test_id in test_ids)
+                     + timeout))
+        indexes.append(i)
+    for job, outcome in run_pool(jobs, workers):
+        mutant = mutants[indexes[job]]
+        if isinstance(outcome, TimeoutError):
+            result = MutantResult(mutant, TIMEOUT, None)
+        elif isinstance(outcome, BaseException):
+            result = MutantResult(mutant, ERROR, repr(outcome))
+        else:
+            result = MutantResult(mutant, *outcome)
+        results[indexes[job]] = result
+        if progress:
+            progress(result)
+    return results
+
+
+def function_scores(results):
+    """Return the killed and the total mutants of each function, in the
+    order of the results, leaving out the mutants that could not run."""
+    scores = OrderedDict()
+    for result in results:
+        if result.status == ERROR:
+            continue
+        key = '%s::%s' % (result.mutant.path, result.mutant.function)
+        killed, total = scores.get(key, (0, 0))
+        scores[key] = (killed + (result.status in (KILLED, TIMEOUT)),
+                       total + 1)
+    return scores
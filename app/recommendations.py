@@ -0,0 +1,106 @@
+"""Friend-of-friend follow suggestions.
+
+The follow graph is exported into a sparse adjacency matrix A, where
+A[i, j] = 1 when user i follows user j. For a batch of users B, the rows of
+A[B] @ A count, for every candidate, how many of the users followed by each
+user of the batch follow that candidate. After removing the users that are
+already followed, the top K candidates of each row are stored in the
+suggestions table.
+
+NumPy and SciPy are only needed to refresh the suggestions, serving them is
+a plain indexed query.
+"""
+import time
+from datetime import datetime
+from . import db
+from .models import Follow, Suggestion
+
+
+def follow_matrix():
+    """Load the follows table, without self-follows, as a CSR matrix."""
+    import numpy as np
+    from scipy import sparse
+    follows = Follow.__table__
+    rows = db.session.execute(
+        db.select([follows.c.follower_id, follows.c.followed_id]).where(
+            follows.c.follower_id != follows.c.followed_id)).fetchall()
+    max_id = db.session.execute(
+        'SELECT MAX(id) FROM users').scalar() or 0
+    edges = np.array(rows, dtype=np.int64).reshape(-1, 2)
+    return sparse.csr_matrix(
+        (np.ones(len(edges), dtype=np.float32), (edges[:, 0], edges[:, 1])),
+        shape=(max_id + 1, max_id + 1))
+
+
+def changed_users(matrix, since):
+    """Return the users whose two-hop neighborhood may have changed since a
+    given time: those that followed someone, and those following them.
+
+    Unfollows leave no trace in the follows table, they are only taken into
+    account by a full refresh. Suggestions are filtered against the current
+    follows when they are served, so this only affects their ranking.
+    """
+    import numpy as np
+    follows = Follow.__table__
+    ids = [row[0] for row in db.session.execute(
+        db.select([follows.c.follower_id]).where(
+            follows.c.timestamp > since).distinct())]
+    changed = np.zeros(matrix.shape[0], dtype=bool)
+    changed[ids] = True
+    changed |= (matrix @ changed.astype(np.float32)) > 0
+    return np.flatnonzero(changed)
+
+
+def top_suggestions(matrix, user_ids, top_k):
+    """Compute the top K suggestions of a batch of users, returned as a
+    list of (user_id, suggested_id, score) tuples."""
+    import numpy as np
+    batch = matrix[user_ids]
+    scores = (batch @ matrix).tolil()
+    suggestions = []
+    for row, user_id in enumerate(user_ids):
+        candidates = np.array(scores.rows[row], dtype=np.int64)
+        values = np.array(scores.data[row], dtype=np.float32)
+        # skip the user and the users it already follows
+        keep = (candidates != user_id) & \
+            ~np.in1d(candidates, batch.indices[
+                batch.indptr[row]:batch.indptr[row + 1]])
+        candidates, values = candidates[keep], values[keep]
+        if len(candidates) > top_k:
+            best = np.argpartition(-values, top_k - 1)[:top_k]
+            candidates, values = candidates[best], values[best]
+        suggestions.extend((int(user_id), int(c), float(v))
+                           for c, v in zip(candidates, values))
+    return suggestions
+
+
+def refresh_suggestions(top_k, batch_size=1000, full=False, progress=None):
+    """Recompute the suggestions of the users affected by follows created
+    since the previous refresh, or of all users when ``full`` is set.
+    Returns the number of users refreshed."""
+    import numpy as np
+    # taken before reading the graph, so that follows made while the
+    # refresh runs are picked up by the next one
+    now = datetime.utcnow()
+    last_refresh = db.session.query(db.func.max(Suggestion.timestamp)).scalar()
+    matrix = follow_matrix()
+    if full or last_refresh is None:
+        user_ids = np.arange(1, matrix.shape[0])
+    else:
+        user_ids = changed_users(matrix, last_refresh)
+    suggestions = Suggestion.__table__
+    for start in range(0, len(user_ids), batch_size):
+        t = time.time()
+        batch = [int(id) for id in user_ids[start:start + batch_size]]
+        rows = top_suggestions(matrix, batch, top_k)
+        db.session.execute(suggestions.delete().where(
+            suggestions.c.user_id.in_(batch)))
+        if rows:
+            db.session.execute(suggestions.insert(), [
+                {'user_id': user_id, 'suggested_id': suggested_id,
+                 'score': score, 'timestamp': now}
+                for user_id, suggested_id, score in rows])
+        db.session.commit()
+        if progress:
+            progress(start + len(batch), len(user_ids), time.time() - t)
+    return len(user_ids)
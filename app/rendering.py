@@ -0,0 +1,87 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from flask import current_app
+
+POST_TAGS = ['a', 'abbr', 'acronym', 'b', 'blockquote', 'code', 'em', 'i',
+             'li', 'ol', 'pre', 'strong', 'ul', 'h1', 'h2', 'h3', 'p']
+COMMENT_TAGS = ['a', 'abbr', 'acronym', 'b', 'code', 'em', 'i', 'strong']
+
+
+def render_post(body):
+    # imported on first use, commands that do not render skip the cost
+    import bleach
+    from markdown import markdown
+    return bleach.linkify(bleach.clean(markdown(body, output_format='html'),
+                                       tags=POST_TAGS, strip=True))
+
+
+def render_comment(body):
+    import bleach
+    from markdown import markdown
+    return bleach.linkify(bleach.clean(markdown(body, output_format='html'),
+                                       tags=COMMENT_TAGS, strip=True))
+
+
+_pool = None
+_pool_pid = None
+_pool_workers = None
+_pool_lock = None
+_lock_pid = None
+
+
+def _lock_for_pid():
+    global _pool_lock, _lock_pid
+    if _lock_pid != os.getpid():
+        # do not share a lock that might have been held during a fork
+        _pool_lock = threading.Lock()
+        _lock_pid = os.getpid()
+    return _pool_lock
+
+
+def render_pool(workers=None):
+    """Return the process pool used to render bodies, or None when a single
+    worker is configured. ``FLASKY_RENDER_WORKERS`` defaults to one worker
+    per CPU, gunicorn_config.py divides the CPUs between the web workers.
+
+    The pool is created once per process, with the size given on first
+    use, and stays up until shutdown_render_pool() is called.
+    """
+    global _pool, _pool_pid, _pool_workers
+    workers = workers or current_app.config['FLASKY_RENDER_WORKERS'] or \
+        os.cpu_count()
+    if workers < 2:
+        return None
+    # a pool created before a fork belongs to the parent process
+    if _pool is None or _pool_pid != os.getpid():
+        with _lock_for_pid():
+            if _pool is None or _pool_pid != os.getpid():
+                _pool = ProcessPoolExecutor(workers)
+                _pool_workers = workers
+                _pool_pid = os.getpid()
+    return _pool
+
+
+def shutdown_render_pool():
+    """Stop the render pool of the current process, if it has one."""
+    global _pool
+    with _lock_for_pid():
+        pool, _pool = _pool, None
+    if pool is not None and _pool_pid == os.getpid():
+        pool.shutdown()
+
+
+def render_all(render, bodies, workers=None):
+    """Render Markdown bodies with ``render_post`` or ``render_comment``.
+
+    Rendering holds the GIL, so batches of at least
+    ``FLASKY_RENDER_PARALLEL_MIN`` bodies are spread over the render pool.
+    The result is an iterator when the pool is used.
+    """
+    pool = None
+    if len(bodies) >= current_app.config['FLASKY_RENDER_PARALLEL_MIN']:
+        pool = render_pool(workers)
+    if pool is None:
+        return [render(body) for body in bodies]
+    chunksize = max(1, len(bodies) // (_pool_workers * 4))
+    return pool.map(render, bodies, chunksize=chunksize)
@@ -0,0 +1,156 @@
+import random
+import threading
+import time
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy import SQLAlchemy, SignallingSession, get_state
+from sqlalchemy import event, inspect, orm, text
+
+# attributes that are written as a side effect of reading (e.g. by
+# User.ping) and do not make a request sticky to the primary
+NON_STICKY_ATTRIBUTES = {'last_seen'}
+READ_METHODS = {'GET', 'HEAD'}
+
+
+def _is_significant(obj):
+    state = inspect(obj)
+    if state.deleted or state.pending:
+        return True
+    for attr in state.attrs:
+        if attr.key not in NON_STICKY_ATTRIBUTES and \
+                attr.history.has_changes():
+            return True
+    return False
+
+
+def has_pending_writes(session):
+    return any(_is_significant(obj) for obj in session.new) or \
+        any(_is_significant(obj) for obj in session.dirty) or \
+        bool(session.deleted)
+
+
+class ReplicaMonitor(object):
+    """Caches the replication lag of each replica bind.
+
+    A replica whose lag cannot be measured because the probe fails is
+    reported with an infinite lag, so that reads fall back to the primary.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._lags = {}
+
+    def lag(self, bind, engine, interval):
+        now = time.time()
+        with self._lock:
+            checked_at, lag = self._lags.get(bind, (None, None))
+        if checked_at is not None and now - checked_at < interval:
+            return lag
+        try:
+            lag = self.probe(engine)
+        except Exception:
+            current_app.logger.warning('Replica %s is unavailable', bind)
+            lag = float('inf')
+        with self._lock:
+            self._lags[bind] = (now, lag)
+        return lag
+
+    def probe(self, engine):
+        with engine.connect() as conn:
+            if engine.dialect.name == 'postgresql':
+                lag = conn.execute(text(
+                    'SELECT EXTRACT(EPOCH FROM now() - '
+                    'pg_last_xact_replay_timestamp())')).scalar()
+            elif engine.dialect.name == 'mysql':
+                row = conn.execute(text('SHOW SLAVE STATUS')).first()
+                lag = row['Seconds_Behind_Master'] if row else None
+                if row is not None and lag is None:
+                    # replication threads are stopped
+                    return float('inf')
+            else:
+                # no replication metadata (e.g. a SQLite copy), only check
+                # that the replica answers
+                conn.execute(text('SELECT 1'))
+                lag = None
+        return float(lag or 0)
+
+    def reset(self):
+        with self._lock:
+            self._lags.clear()
+
+
+class RoutingSession(SignallingSession):
+    """Session that sends reads from GET/HEAD requests to a replica.
+
+    Everything else (flushes, queries issued while the session holds
+    unflushed changes, requests that already wrote and requests made shortly
+    after the same client wrote) goes to the primary database.
+    """
+    def get_bind(self, mapper=None, clause=None):
+        if self.use_replica():
+            bind = self.pick_replica()
+            if bind is not None:
+                return get_state(self.app).db.get_engine(self.app, bind=bind)
+        return super(RoutingSession, self).get_bind(mapper, clause)
+
+    def use_replica(self):
+        if not self.app.config['FLASKY_DB_REPLICAS'] or \
+                not has_request_context() or \
+                request.method not in READ_METHODS:
+            return False
+        if self._flushing or g.get('db_wrote') or has_pending_writes(self):
+            return False
+        last_write = session.get('db_last_write')
+        if last_write is not None and time.time() - last_write < \
+                self.app.config['FLASKY_DB_STICKY_SECONDS']:
+            return False
+        return True
+
+    def pick_replica(self):
+        # a request reads from a single replica, so that it sees a
+        # consistent snapshot
+        if 'db_replica' not in g:
+            db = get_state(self.app).db
+            config = self.app.config
+            healthy = [
+                bind for bind in config['FLASKY_DB_REPLICAS']
+                if db.replica_monitor.lag(
+                    bind, db.get_engine(self.app, bind=bind),
+                    config['FLASKY_DB_REPLICA_CHECK_INTERVAL']) <=
+                config['FLASKY_DB_REPLICA_MAX_LAG']]
+            g.db_replica = random.choice(healthy) if healthy else None
+        return g.db_replica
+
+
+def mark_write():
+    """Keep the current client on the primary for a while."""
+    if has_request_context():
+        g.db_wrote = True
+        session['db_last_write'] = time.time()
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def record_write(db_session, flush_context):
+    if has_pending_writes(db_session):
+        mark_write()
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def __init__(self, *args, **kwargs):
+        super(RoutingSQLAlchemy, self).__init__(*args, **kwargs)
+        self.replica_monitor = ReplicaMonitor()
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def dispose_engines(self, app, close=True):
+        """Drop the pooled connections of all the engines of the application.
+
+        A forked process passes ``close=False`` to only forget the
+        connections it inherited, closing them could end the sessions its
+        parent holds on the same sockets.
+        """
+        for connector in get_state(app).connectors.values():
+            engine = connector.get_engine()
+            if close:
+                engine.dispose()
+            else:
+                engine.pool = engine.pool.recreate()
@@ -0,0 +1,106 @@
+import json
+from datetime import date
+from flask import current_app, request, url_for, has_request_context
+from werkzeug.http import http_date
+from werkzeug.routing import parse_rule
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+def _default(o):
+    # dates are encoded as in Flask's JSON encoder
+    if isinstance(o, date):
+        return http_date(o.timetuple())
+    raise TypeError('%r is not JSON serializable' % o)
+
+
+class JSONSerializer(object):
+    """Serializer based on the standard library json module."""
+    def dumps(self, obj, pretty=False, sort_keys=False):
+        if pretty:
+            data = json.dumps(obj, indent=2, separators=(', ', ': '),
+                              sort_keys=sort_keys, default=_default)
+        else:
+            data = json.dumps(obj, separators=(',', ':'),
+                              sort_keys=sort_keys, default=_default)
+        return data.encode('utf-8')
+
+
+class OrjsonSerializer(object):
+    """Serializer based on orjson, which encodes straight to bytes."""
+    def dumps(self, obj, pretty=False, sort_keys=False):
+        option = orjson.OPT_PASSTHROUGH_DATETIME
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=_default, option=option)
+
+
+SERIALIZERS = {
+    'json': JSONSerializer(),
+    'orjson': OrjsonSerializer() if orjson is not None else None,
+}
+
+
+def get_serializer(name=None):
+    """Return the serializer selected by ``FLASKY_JSON_SERIALIZER``. The
+    ``auto`` setting picks orjson when it is installed."""
+    name = name or current_app.config['FLASKY_JSON_SERIALIZER']
+    if name == 'auto':
+        name = 'orjson' if orjson is not None else 'json'
+    serializer = SERIALIZERS.get(name)
+    if serializer is None:
+        raise ValueError('JSON serializer %s is not available' % name)
+    return serializer
+
+
+def jsonify(data):
+    """Drop-in replacement for Flask's jsonify for a single object, using
+    the configured serializer."""
+    config = current_app.config
+    pretty = config['JSONIFY_PRETTYPRINT_REGULAR'] and not request.is_xhr
+    body = get_serializer().dumps(data, pretty=pretty,
+                                  sort_keys=config['JSON_SORT_KEYS'])
+    return current_app.response_class(body + b'\n',
+                                      mimetype=config['JSONIFY_MIMETYPE'])
+
+
+def select_fields(json, fields):
+    """Keep the given fields of a resource, or all of them if None."""
+    if fields is None:
+        return json
+    return {name: value for name, value in json.items() if name in fields}
+
+
+def url_template(endpoint):
+    """Return a format string for the URLs of an endpoint that has a single
+    integer variable, or None for other endpoints. Templates are built from
+    the URL map once per application."""
+    templates = current_app.extensions.setdefault('url_templates', {})
+    if endpoint not in templates:
+        template = None
+        for rule in current_app.url_map.iter_rules(endpoint):
+            parts = list(parse_rule(rule.rule))
+            variables = [converter for converter, arguments, variable in parts
+                         if converter is not None]
+            if variables == ['int']:
+                template = ''.join(
+                    variable.replace('%', '%%') if converter is None else '%d'
+                    for converter, arguments, variable in parts)
+            break
+        templates[endpoint] = template
+    return templates[endpoint]
+
+
+def resource_url(endpoint, id):
+    """Return the URL of the resource with the given id, which is the same
+    url_for() returns but is formatted from the endpoint's template."""
+    template = current_app.config['FLASKY_URL_TEMPLATES'] and \
+        has_request_context() and url_template(endpoint)
+    if not template:
+        return url_for(endpoint, id=id)
+    return request.script_root + template % id
@@ -0,0 +1,235 @@
+"""Database fixtures and parallel runner for the unit tests.
+
+Creating the tables and inserting the roles for each test dominates the
+time of most tests, so the in-memory database of a test is cloned from a
+template built by the first test of the process instead. Other databases,
+and applications with replicas, are created and dropped as usual.
+"""
+import io
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import unittest
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing.util import Finalize
+from flask import _app_ctx_stack, _request_ctx_stack
+from sqlalchemy.engine.url import make_url
+from config import config
+from . import db
+from .models import Role
+from .rendering import shutdown_render_pool
+
+_templates = {}
+
+
+class TemplateDatabase(object):
+    """An in-memory SQLite database with the tables and the roles, copied
+    into the database of each test."""
+    def __init__(self, connection):
+        self.connection = sqlite3.connect(':memory:',
+                                          check_same_thread=False)
+        self.script = '\n'.join(connection.iterdump())
+        self.connection.executescript(self.script)
+
+    def clone(self, connection):
+        if hasattr(connection, 'backup'):
+            # the backup API needs Python 3.7
+            self.connection.backup(connection)
+        else:
+            connection.executescript(self.script)
+
+
+def _clonable(app):
+    engine = db.get_engine(app)
+    return (engine.dialect.name == 'sqlite' and
+            engine.url.database in (None, '', ':memory:') and
+            not app.config.get('SQLALCHEMY_BINDS'))
+
+
+def create_database():
+    """Create the tables and the roles in the database of the current
+    application."""
+    app = db.get_app()
+    if not _clonable(app):
+        db.create_all()
+        Role.insert_roles()
+        return
+    engine = db.get_engine(app)
+    key = str(engine.url)
+    if key not in _templates:
+        db.create_all()
+        # a session leaked by an earlier test would write the roles to the
+        # database of that test, they go through a connection of this one
+        db.session.remove()
+        connection = engine.connect()
+        try:
+            db.session(bind=connection)
+            Role.insert_roles()
+        finally:
+            db.session.remove()
+            connection.close()
+    # the in-memory database lives in the one connection of a StaticPool
+    connection = engine.raw_connection()
+    try:
+        if key in _templates:
+            _templates[key].clone(connection.connection)
+        else:
+            template = TemplateDatabase(connection.connection)
+            roles = template.connection.execute(
+                'SELECT COUNT(*) FROM roles').fetchone()[0]
+            if roles != len(Role.ROLES):
+                raise RuntimeError('The template database has %d roles '
+                                   'instead of %d' % (roles, len(Role.ROLES)))
+            _templates[key] = template
+    finally:
+        connection.close()
+
+
+def drop_database():
+    """Drop the database created by create_database()."""
+    app = db.get_app()
+    if not _clonable(app):
+        db.drop_all()
+        return
+    # closing the connection discards the in-memory database
+    db.get_engine(app).dispose()
+
+
+class ContextTestResult(unittest.TextTestResult):
+    """Pop the request and application contexts that a test leaves pushed,
+    which would otherwise run the next tests in the application of that
+    test and fail the pop of the context of the flask command."""
+    def startTest(self, test):
+        self._contexts = (_request_ctx_stack.top, _app_ctx_stack.top)
+        super(ContextTestResult, self).startTest(test)
+
+    def stopTest(self, test):
+        super(ContextTestResult, self).stopTest(test)
+        request_context, app_context = self._contexts
+        while _request_ctx_stack.top not in (None, request_context):
+            _request_ctx_stack.top.pop()
+        while _app_ctx_stack.top not in (None, app_context):
+            _app_ctx_stack.top.pop()
+
+
+ModuleResult = namedtuple('ModuleResult', [
+    'name', 'tests', 'failures', 'errors', 'skipped', 'successful',
+    'output', 'seconds'])
+
+
+def suite_modules(suite):
+    """Return the names of the modules of the tests of a suite, in order."""
+    names = []
+    for test in iter_tests(suite):
+        if isinstance(test, unittest.loader._FailedTest):
+            # a module that failed to import, its test reports the error
+            name = test._testMethodName
+        else:
+            name = type(test).__module__
+        if name not in names:
+            names.append(name)
+    return names
+
+
+def iter_tests(suite):
+    for test in suite:
+        if isinstance(test, unittest.TestSuite):
+            yield from iter_tests(test)
+        else:
+            yield test
+
+
+def _worker_database(url, workdir, name):
+    if make_url(url).database in (None, '', ':memory:'):
+        return url
+    return 'sqlite:///' + os.path.join(
+        workdir, '%s-%d.sqlite' % (name, os.getpid()))
+
+
+_worker_pid = None
+
+
+def _init_worker(top_level_dir, workdir, coverage_options):
+    global _worker_pid
+    if _worker_pid == os.getpid():
+        return
+    _worker_pid = os.getpid()
+    if top_level_dir not in sys.path:
+        sys.path.insert(0, top_level_dir)
+    # the tests of a worker must not see the rows written by the others
+    testing = config['testing']
+    testing.SQLALCHEMY_DATABASE_URI = _worker_database(
+        testing.SQLALCHEMY_DATABASE_URI, workdir, 'test')
+    testing.SQLALCHEMY_BINDS = {
+        bind: _worker_database(url, workdir, bind)
+        for bind, url in testing.SQLALCHEMY_BINDS.items()}
+    # a worker exits after its children, stop them first
+    Finalize(None, shutdown_render_pool, exitpriority=20)
+    if coverage_options is not None:
+        import coverage
+        cov = coverage.Coverage(data_file=os.path.join(workdir, '.coverage'),
+                                data_suffix=True, **coverage_options)
+        cov.start()
+        # saved when the pool is shut down and the worker exits
+        Finalize(None, _save_coverage, args=(cov,), exitpriority=10)
+
+
+def _save_coverage(cov):
+    cov.stop()
+    cov.save()
+
+
+def _run_module(name, *worker_args):
+    # ProcessPoolExecutor has no initializer before Python 3.7
+    _init_worker(*worker_args)
+    start = time.time()
+    stream = io.StringIO()
+    suite = unittest.defaultTestLoader.loadTestsFromName(name)
+    result = unittest.TextTestRunner(
+        stream=stream, verbosity=2, resultclass=ContextTestResult).run(suite)
+    return ModuleResult(name, result.testsRun, len(result.failures),
+                        len(result.errors), len(result.skipped),
+                        result.wasSuccessful(), stream.getvalue(),
+                        time.time() - start)
+
+
+def run_parallel(names, workers, top_level_dir, cov=None, stream=None):
+    """Run test modules, or other test names, in a pool of processes.
+
+    Each worker has its own SQLite databases when the testing databases
+    are not in memory. When ``cov`` is given, the workers measure the
+    coverage with its settings and their data is combined into it.
+
+    The output of each module is written to ``stream`` as it completes,
+    and the results of the modules are returned in that order.
+    """
+    stream = stream or sys.stderr
+    workdir = tempfile.mkdtemp()
+    coverage_options = None
+    if cov is not None:
+        coverage_options = {'branch': cov.config.branch,
+                            'include': cov.config.include}
+    # not a multiprocessing.Pool, its daemonic workers could not start the
+    # render pool of the tests
+    executor = ProcessPoolExecutor(workers)
+    try:
+        futures = [executor.submit(_run_module, name, top_level_dir, workdir,
+                                   coverage_options) for name in names]
+        results = []
+        for future in as_completed(futures):
+            result = future.result()
+            stream.write(result.output)
+            stream.flush()
+            results.append(result)
+        # the workers save their coverage data as they exit
+        executor.shutdown()
+        if cov is not None:
+            cov.combine(data_paths=[workdir])
+        return results
+    finally:
+        executor.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
@@ -0,0 +1,138 @@
+import heapq
+import sys
+from collections import deque
+from datetime import datetime
+from flask import current_app
+from . import db
+from .models import Follow, Post
+
+EPOCH = datetime(1970, 1, 1)
+
+# the time of the newest post of each user followed by a user, a MAX per
+# author is a single index lookup where a GROUP BY would read all the posts
+NEWEST_POSTS = db.select([
+    Follow.followed_id,
+    db.select([db.func.max(Post.timestamp)])
+    .where(Post.author_id == Follow.followed_id).as_scalar()])\
+    .where(Follow.follower_id == db.bindparam('user_id'))
+
+FIRST_KEYS = db.select([Post.timestamp, Post.id])\
+    .where(Post.author_id == db.bindparam('author_id'))\
+    .order_by(Post.timestamp.desc(), Post.id.desc())\
+    .limit(db.bindparam('size'))
+
+NEXT_KEYS = FIRST_KEYS.where(db.or_(
+    Post.timestamp < db.bindparam('timestamp'),
+    db.and_(Post.timestamp == db.bindparam('timestamp'),
+            Post.id < db.bindparam('id'))))
+
+# the statements above are compiled once per dialect instead of on every
+# execution, which takes longer than running them
+_compiled_cache = {}
+
+
+def _execute(statement, **params):
+    connection = db.session.connection(mapper=Post.__mapper__)\
+        .execution_options(compiled_cache=_compiled_cache)
+    return connection.execute(statement, params)
+
+
+def _key(timestamp, id):
+    # heapq pops the smallest key first, newest posts must come first
+    return (-(timestamp - EPOCH).total_seconds(), -id)
+
+
+class AuthorStream(object):
+    """The (timestamp, id) keys of the posts of one author, newest first,
+    read in chunks from the (author_id, timestamp) index."""
+    def __init__(self, author_id):
+        self.author_id = author_id
+        self.buffer = deque()
+        self.exhausted = False
+        self.last = None
+
+    def fill(self, size):
+        if self.last is None:
+            keys = _execute(FIRST_KEYS, author_id=self.author_id, size=size)
+        else:
+            keys = _execute(NEXT_KEYS, author_id=self.author_id, size=size,
+                            timestamp=self.last[0], id=self.last[1])
+        keys = [tuple(key) for key in keys]
+        self.buffer.extend(keys)
+        self.exhausted = len(keys) < size
+        if keys:
+            self.last = keys[-1]
+
+    def entry(self):
+        """Return the heap entry of the stream, keyed by its next post. When
+        the buffer is empty the last post read is an upper bound for it."""
+        key = _key(*(self.buffer[0] if self.buffer else self.last))
+        return key + (self.author_id, self)
+
+
+def merged_timeline(user, count, skip=0):
+    """Return the ``count`` newest posts of the users followed by ``user``
+    after skipping ``skip`` of them, plus a flag telling if there are more.
+
+    The newest post time of each followed author is read from the index
+    and a heap merges the authors' streams, reading keys from an author
+    only when it is the newest remaining one. The cost depends on the size
+    of the page and not on the number of posts of the followed authors.
+    Only the posts in the page are loaded.
+    """
+    # one post after the page tells if there is a next one
+    need = skip + count + 1
+    heap = []
+    for author_id, timestamp in _execute(NEWEST_POSTS, user_id=user.id):
+        if timestamp is None:
+            continue
+        # the id of the newest post is not known until the stream is read,
+        # the largest one places it before any post with the same time
+        heap.append(_key(timestamp, sys.maxsize) +
+                    (author_id, AuthorStream(author_id)))
+    heapq.heapify(heap)
+    ids = []
+    while heap and len(ids) < need:
+        stream = heapq.heappop(heap)[-1]
+        if stream.buffer:
+            ids.append(stream.buffer.popleft()[1])
+        else:
+            stream.fill(need - len(ids))
+        if stream.buffer or not stream.exhausted:
+            heapq.heappush(heap, stream.entry())
+    ids = ids[skip:]
+    has_more = len(ids) > count
+    ids = ids[:count]
+    posts = {}
+    if ids:
+        posts = {post.id: post for post in
+                 Post.query.filter(Post.id.in_(ids))}
+    return [posts[id] for id in ids], has_more
+
+
+def use_merged_timeline(user):
+    threshold = current_app.config['FLASKY_TIMELINE_MERGE_THRESHOLD']
+    return threshold is not None and user.followed_count() >= threshold
+
+
+class TimelinePage(object):
+    """A page of the merged timeline, with the attributes of a Flask-SQLAlchemy
+    pagination object needed by the templates except for the totals."""
+    def __init__(self, user, page, per_page):
+        self.page = page
+        self.per_page = per_page
+        self.items, self.has_next = merged_timeline(
+            user, per_page, (page - 1) * per_page)
+        self.has_prev = page > 1
+        self.prev_num = page - 1
+        self.next_num = page + 1
+
+    def iter_pages(self, left_edge=2, left_current=2, right_current=5,
+                   right_edge=2):
+        # the number of pages is unknown, show the ones up to the next one
+        last = self.page + 1 if self.has_next else self.page
+        for num in range(1, last + 1):
+            if num <= left_edge or num > self.page - left_current - 1:
+                yield num
+            elif num == left_edge + 1:
+                yield None
@@ -0,0 +1,135 @@
+import math
+from datetime import datetime
+from sqlalchemy import and_, or_, event, select
+from .replicas import RoutingSession
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def _logaddexp(a, b):
+    if a < b:
+        a, b = b, a
+    return a + math.log1p(math.exp(b - a))
+
+
+def activity_score(timestamp, weight, half_life):
+    """Return the score of an activity of the given weight at a time.
+
+    Scores are stored in log space relative to a fixed epoch, so adding an
+    activity only updates the score of its post, and the ranking of two
+    posts by score is the same as the ranking by their current decayed
+    value ``sum(weight * 0.5 ** (age / half_life))``.
+    """
+    seconds = (timestamp - EPOCH).total_seconds()
+    return seconds * math.log(2) / half_life + math.log(weight)
+
+
+def decayed_value(score, half_life, now=None):
+    """Return the current value of a score, the sum of decayed weights."""
+    return math.exp(score - activity_score(now or datetime.utcnow(), 1.0,
+                                           half_life))
+
+
+def _insert_ignore(connection, table):
+    # an insert that does nothing when another transaction has just added
+    # the row, instead of failing the flush that triggered it
+    dialect = connection.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        return insert(table).on_conflict_do_nothing()
+    if dialect == 'sqlite':
+        return table.insert().prefix_with('OR IGNORE')
+    if dialect == 'mysql':
+        return table.insert().prefix_with('IGNORE')
+    return table.insert()
+
+
+def add_activity(connection, config, activities):
+    """Add ``(post_id, timestamp, weight)`` activities to the ranking, and
+    remove the posts whose value has decayed below the minimum score."""
+    from .models import TrendingPost
+    table = TrendingPost.__table__
+    half_life = config['FLASKY_TRENDING_HALF_LIFE']
+    inserted = False
+    for post_id, timestamp, weight in activities:
+        score = activity_score(timestamp, weight, half_life)
+        query = select([table.c.score]).where(
+            table.c.post_id == post_id).with_for_update()
+        current = connection.execute(query).scalar()
+        if current is None:
+            if connection.execute(_insert_ignore(connection, table).values(
+                    post_id=post_id, score=score)).rowcount:
+                inserted = True
+                continue
+            current = connection.execute(query).scalar()
+        connection.execute(table.update().where(
+            table.c.post_id == post_id).values(
+            score=_logaddexp(current, score)))
+    if inserted:
+        floor = activity_score(datetime.utcnow(),
+                               config['FLASKY_TRENDING_MIN_SCORE'], half_life)
+        connection.execute(table.delete().where(table.c.score < floor))
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def record_activity(session, flush_context):
+    from .models import Follow, Post, Comment
+    config = session.app.config
+    if not config['FLASKY_TRENDING']:
+        return
+    activities = []
+    for obj in session.new:
+        if isinstance(obj, Comment):
+            activities.append((obj.post_id, obj.timestamp,
+                               config['FLASKY_TRENDING_COMMENT_WEIGHT']))
+        elif isinstance(obj, Follow) and obj.follower_id != obj.followed_id:
+            # a new follower counts for the latest post of the user
+            post_id = session.connection().execute(
+                select([Post.id]).where(Post.author_id == obj.followed_id)
+                .order_by(Post.timestamp.desc()).limit(1)).scalar()
+            if post_id is not None:
+                activities.append((post_id, obj.timestamp,
+                                   config['FLASKY_TRENDING_FOLLOW_WEIGHT']))
+    if activities:
+        add_activity(session.connection(), config, activities)
+
+
+def encode_cursor(score, post_id):
+    return '%r_%d' % (score, post_id)
+
+
+def decode_cursor(cursor):
+    """Return the (score, post_id) key in a cursor, or None if invalid."""
+    try:
+        score, post_id = cursor.split('_')
+        return float(score), int(post_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+class TrendingPagination(object):
+    """Pages through the ranking from the highest score, each page starting
+    after the (score, post_id) key of the last post of the previous one."""
+    def __init__(self, per_page, cursor=None):
+        from .models import Post, TrendingPost
+        query = Post.query.join(TrendingPost,
+                                TrendingPost.post_id == Post.id)
+        key = decode_cursor(cursor) if cursor else None
+        if key is not None:
+            query = query.filter(or_(
+                TrendingPost.score < key[0],
+                and_(TrendingPost.score == key[0],
+                     TrendingPost.post_id < key[1])))
+        rows = query.add_columns(TrendingPost.score).order_by(
+            TrendingPost.score.desc(), TrendingPost.post_id.desc())\
+            .limit(per_page + 1).all()
+        self.cursor = cursor if key is not None else None
+        self.per_page = per_page
+        self.has_next = len(rows) > per_page
+        rows = rows[:per_page]
+        self.items = [post for post, score in rows]
+        self.scores = [score for post, score in rows]
+        self.next_cursor = None
+        if self.has_next:
+            self.next_cursor = encode_cursor(self.scores[-1],
+                                             self.items[-1].id)
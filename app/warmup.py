@@ -0,0 +1,89 @@
+import time
+from collections import OrderedDict
+from jinja2 import TemplateSyntaxError
+from sqlalchemy.orm import configure_mappers
+from . import db
+from .advisor import page_queries
+from .models import Role, User, Post
+from .rendering import render_post
+from .serializers import url_template
+from .timeline import TimelinePage, use_merged_timeline
+from .trending import TrendingPagination
+
+
+def compile_templates(app):
+    """Compile all the templates of the application into the cache of its
+    Jinja environment and return how many were compiled."""
+    env = app.jinja_env
+    count = 0
+    for name in env.list_templates():
+        try:
+            env.get_template(name)
+        except TemplateSyntaxError:
+            app.logger.exception('Cannot compile template %s', name)
+            continue
+        count += 1
+    return count
+
+
+def run_page_queries(app):
+    """Issue the queries of the most visited pages for a sample user and
+    post, and return how many were issued."""
+    user = User.query.order_by(User.id).first()
+    post_id = db.session.query(Post.id).order_by(Post.id).scalar()
+    if user is None:
+        return 0
+    queries = page_queries(user.id, post_id or 0)
+    for query in queries:
+        query.limit(app.config['FLASKY_POSTS_PER_PAGE']).all()
+    count = len(queries)
+    if use_merged_timeline(user):
+        TimelinePage(user, 1, app.config['FLASKY_POSTS_PER_PAGE'])
+        count += 1
+    if app.config['FLASKY_TRENDING']:
+        TrendingPagination(app.config['FLASKY_POSTS_PER_PAGE'])
+        count += 1
+    return count
+
+
+def build_url_templates(app):
+    endpoints = set(rule.endpoint for rule in app.url_map.iter_rules()
+                    if rule.endpoint.startswith('api.'))
+    return sum(1 for endpoint in endpoints if url_template(endpoint))
+
+
+def warm_up(app):
+    """Fill the caches of an application before its workers are forked,
+    so that they start with them through copy-on-write.
+
+    Returns the result and the time of each step, with a None result for
+    the steps that failed.
+    """
+    graph = app.extensions.get('follow_graph')
+    steps = [
+        ('mappers', lambda: configure_mappers() or 'configured'),
+        ('templates', lambda: compile_templates(app)),
+        ('roles', lambda: len(Role.permissions_by_id())),
+        ('queries', lambda: run_page_queries(app)),
+        ('follow graph',
+         (lambda: graph.load() or 'loaded') if graph is not None else None),
+        ('url templates', lambda: build_url_templates(app)),
+        # imports Markdown and bleach
+        ('renderer', lambda: render_post('*warm*') and 'imported'),
+    ]
+    results = OrderedDict()
+    with app.app_context():
+        for name, step in steps:
+            if step is None:
+                continue
+            start = time.time()
+            try:
+                result = step()
+            except Exception:
+                # a cold cache is no reason to not start the server
+                app.logger.exception('Warmup of %s failed', name)
+                db.session.rollback()
+                result = None
+            results[name] = (result, time.time() - start)
+        db.session.remove()
+    return results
@@ -0,0 +1,130 @@
+import os
+import threading
+import time
+from concurrent.futures import Future
+from queue import Queue, Empty
+from flask import current_app
+from .replicas import mark_write
+
+
+class WorkUnit(object):
+    def __init__(self, fn, args, kwargs):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+
+    def __call__(self):
+        return self.fn(*self.args, **self.kwargs)
+
+
+class WriteQueue(object):
+    """Serializes database writes through one writer thread per process.
+
+    Units of work are functions that operate on ``db.session`` and return a
+    plain value (not ORM instances, which belong to the writer's session).
+    The writer runs all the units it finds queued in a single transaction,
+    so concurrent requests share one commit instead of competing for the
+    database write lock. If the group fails, each unit is retried on its own
+    so that an error is only reported to the request that caused it.
+
+    When ``FLASKY_SERIALIZE_WRITES`` is off, units run inline in the request
+    session and are committed right away.
+    """
+    def __init__(self, db, app=None):
+        self.db = db
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self.batches = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['writes'] = self
+
+    @property
+    def enabled(self):
+        return current_app.config['FLASKY_SERIALIZE_WRITES']
+
+    def execute(self, fn, *args, **kwargs):
+        """Run a unit of work and return its result once committed."""
+        if not self.enabled:
+            result = fn(*args, **kwargs)
+            self.db.session.commit()
+            return result
+        future = self.submit(fn, *args, **kwargs)
+        result = future.result(current_app.config['FLASKY_WRITE_TIMEOUT'])
+        mark_write()
+        return result
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue a unit of work and return a future for its result."""
+        unit = WorkUnit(fn, args, kwargs)
+        self._ensure_writer()
+        self._queue.put(unit)
+        return unit.future
+
+    def _ensure_writer(self):
+        # the writer thread does not survive a fork, start a new one in
+        # each worker process
+        with self._lock:
+            if self._pid != os.getpid() or not self._thread.is_alive():
+                self._pid = os.getpid()
+                self._queue = Queue()
+                self._thread = threading.Thread(
+                    target=self._run,
+                    args=(current_app._get_current_object(), self._queue),
+                    name='flasky-writer')
+                self._thread.daemon = True
+                self._thread.start()
+
+    def stop(self, timeout=None):
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                self._queue.put(None)
+                self._thread.join(timeout)
+            self._thread = None
+            self._pid = None
+
+    def _run(self, app, queue):
+        with app.app_context():
+            batch_size = app.config['FLASKY_WRITE_BATCH_SIZE']
+            group_wait = app.config['FLASKY_WRITE_GROUP_WAIT']
+            while True:
+                batch = [queue.get()]
+                deadline = time.time() + group_wait
+                while batch[-1] is not None and len(batch) < batch_size:
+                    try:
+                        batch.append(queue.get(
+                            timeout=max(deadline - time.time(), 0)))
+                    except Empty:
+                        break
+                stop = batch[-1] is None
+                batch = [unit for unit in batch if unit is not None and
+                         unit.future.set_running_or_notify_cancel()]
+                if batch:
+                    self._commit(batch)
+                    self.db.session.remove()
+                if stop:
+                    break
+
+    def _commit(self, batch):
+        self.batches += 1
+        results = []
+        try:
+            for unit in batch:
+                results.append(unit())
+            self.db.session.commit()
+        except Exception as e:
+            self.db.session.rollback()
+            if len(batch) == 1:
+                current_app.logger.exception('Write failed')
+                batch[0].future.set_exception(e)
+            else:
+                for unit in batch:
+                    self._commit([unit])
+            return
+        for unit, result in zip(batch, results):
+            unit.future.set_result(result)
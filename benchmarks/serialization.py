@@ -0,0 +1,84 @@
+"""Measure the cost of serializing a page of posts, users and comments.
+
+    python benchmarks/serialization.py [--runs 200]
+
+For a page of FLASKY_POSTS_PER_PAGE items of each resource, the time to
+build the dictionaries with url_for or with the URL templates, and the time
+to encode them with Flask's JSON encoder and with each available serializer
+are reported, in microseconds per page. The counts of posts and comments
+issue queries, so they are left out of the dictionaries.
+"""
+import argparse
+import os
+import sys
+import time
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from flask.json import dumps as flask_dumps  # noqa: E402
+from app import create_app, db  # noqa: E402
+from app.models import User, Role, Post, Comment  # noqa: E402
+from app.serializers import SERIALIZERS  # noqa: E402
+
+
+def populate(count):
+    db.create_all()
+    Role.insert_roles()
+    users = [User(username='user%d' % i, email='user%d@example.com' % i)
+             for i in range(count)]
+    posts = [Post(body='A *post* with some text ' * 10, author=user)
+             for user in users]
+    comments = [Comment(body='A comment with some text ' * 4, post=post,
+                        author=post.author) for post in posts]
+    db.session.add_all(users + posts + comments)
+    db.session.commit()
+    return {'users': users, 'posts': posts, 'comments': comments}
+
+
+def best_time(f, runs):
+    times = []
+    for _ in range(runs):
+        t = time.perf_counter()
+        f()
+        times.append(time.perf_counter() - t)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=200)
+    args = parser.parse_args()
+
+    app = create_app('testing')
+    app.config['JSONIFY_PRETTYPRINT_REGULAR'] = False
+    with app.app_context():
+        pages = populate(app.config['FLASKY_POSTS_PER_PAGE'])
+        serializers = sorted(name for name, serializer in SERIALIZERS.items()
+                             if serializer is not None)
+        print('%-9s %10s %10s %10s' % ('', 'url_for', 'templates', 'flask') +
+              ''.join(' %10s' % name for name in serializers))
+        with mock.patch('sqlalchemy.orm.dynamic.AppenderMixin.count',
+                        return_value=0), app.test_request_context():
+            for resource, items in sorted(pages.items()):
+                def to_json():
+                    return [item.to_json() for item in items]
+
+                times = []
+                app.config['FLASKY_URL_TEMPLATES'] = False
+                times.append(best_time(to_json, args.runs))
+                app.config['FLASKY_URL_TEMPLATES'] = True
+                times.append(best_time(to_json, args.runs))
+                page = {resource: to_json()}
+                times.append(best_time(lambda: flask_dumps(page), args.runs))
+                for name in serializers:
+                    times.append(best_time(
+                        lambda: SERIALIZERS[name].dumps(page, sort_keys=True),
+                        args.runs))
+                print('%-9s' % resource +
+                      ''.join(' %10.1f' % (t * 1e6) for t in times))
+        db.session.remove()
+
+
+if __name__ == '__main__':
+    main()
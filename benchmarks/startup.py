@@ -0,0 +1,68 @@
+"""Measure the startup time of the application and of its commands.
+
+    python benchmarks/startup.py [--runs 7] [--database sqlite:////tmp/db]
+
+Each case runs in a new interpreter, as gunicorn workers and the flask
+command do, and the best and median wall clock times of the runs are
+reported. "import flasky" is the work of a worker booting without
+preload_app. Set FLASKY_IMPORT_TIMES=1 to see where the time of a single
+start goes.
+
+Measured on one CPU before and after the lazy initialization of the
+blueprints, the web extensions, Flask-Migrate, dotenv and the Markdown
+renderer, interleaving the two trees over 15 runs (best / median):
+
+    import flasky          550 / 646 ms -> 418 / 472 ms
+    flask sync-replicas    622 / 685 ms -> 554 / 577 ms
+    flask deploy           680 / 726 ms -> 582 / 689 ms
+
+Every flask command imports Flask-Migrate through its plugin entry point,
+so the commands gain less than the workers.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+basedir = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+flask = os.path.join(os.path.dirname(sys.executable), 'flask')
+
+CASES = [
+    ('import flasky', [sys.executable, '-c', 'import flasky']),
+    ('flask --help', [flask, '--help']),
+    ('flask sync-replicas', [flask, 'sync-replicas']),
+    ('flask deploy', [flask, 'deploy']),
+]
+
+
+def run(command, runs, env):
+    times = []
+    for _ in range(runs):
+        t = time.perf_counter()
+        subprocess.run(command, cwd=basedir, env=env,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append(time.perf_counter() - t)
+    times.sort()
+    return times[0], times[len(times) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=7)
+    parser.add_argument('--database', default=None,
+                        help='Database URL of the development configuration.')
+    args = parser.parse_args()
+
+    env = dict(os.environ, FLASK_APP='flasky.py')
+    env.pop('FLASKY_IMPORT_TIMES', None)
+    if args.database:
+        env['DEV_DATABASE_URL'] = args.database
+    print('%-22s %8s %8s' % ('', 'best', 'median'))
+    for name, command in CASES:
+        best, median = run(command, args.runs, env)
+        print('%-22s %6.0fms %6.0fms' % (name, best * 1000, median * 1000))
+
+
+if __name__ == '__main__':
+    main()
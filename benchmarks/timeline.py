@@ -0,0 +1,103 @@
+"""Compare the join and the k-way merge engines of the followed posts
+timeline on a generated database.
+
+    python benchmarks/timeline.py [--authors 10000] [--followed 1000]
+                                  [--posts 20] [--runs 20]
+
+Every author gets ``--posts`` posts. The first page of the timeline of a
+user following ``--followed`` of the authors is fetched with each engine and
+the median time of the runs is reported.
+
+Recent SQLite versions stop reading the posts of a followed author in the
+join once they cannot make it into the page, which is why the merge engine
+is only enabled by FLASKY_TIMELINE_MERGE_THRESHOLD. Databases that sort all
+the followed posts before applying the limit benefit from it.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from app import create_app, db  # noqa: E402
+from app.models import User, Role, Post  # noqa: E402
+from app.timeline import merged_timeline  # noqa: E402
+
+
+def populate(authors, followed, posts):
+    db.create_all()
+    Role.insert_roles()
+    engine = db.get_engine()
+    start = datetime(2017, 1, 1)
+    engine.execute(User.__table__.insert(), [
+        {'id': i, 'username': 'user%d' % i, 'email': 'user%d@example.com' % i}
+        for i in range(1, authors + 2)])
+    engine.execute('INSERT INTO follows (follower_id, followed_id, timestamp) '
+                   'VALUES (1, ?, ?)',
+                   [(id, start) for id in random.sample(
+                       range(2, authors + 2), followed)])
+    for author_id in range(2, authors + 2):
+        engine.execute(Post.__table__.insert(), [
+            {'body': 'post', 'body_html': 'post', 'author_id': author_id,
+             'timestamp': start + timedelta(
+                 seconds=random.randint(0, 365 * 24 * 3600))}
+            for _ in range(posts)])
+
+
+def median_time(f, runs):
+    times = []
+    for _ in range(runs):
+        db.session.remove()
+        t = time.perf_counter()
+        f()
+        times.append(time.perf_counter() - t)
+    return sorted(times)[len(times) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--authors', type=int, default=10000)
+    parser.add_argument('--followed', type=int, default=1000)
+    parser.add_argument('--posts', type=int, default=20)
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.sqlite')
+    os.close(fd)
+    app = create_app('testing')
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + path
+    try:
+        with app.app_context():
+            random.seed(0)
+            populate(args.authors, args.followed, args.posts)
+            per_page = app.config['FLASKY_POSTS_PER_PAGE']
+            reader = User.query.get(1)
+            join = reader.followed_posts.order_by(
+                Post.timestamp.desc(), Post.id.desc()).limit(per_page).all()
+            merge, _ = merged_timeline(reader, per_page)
+            assert [p.id for p in join] == [p.id for p in merge]
+
+            # the follow graph is loaded once and shared by both engines
+            print('%d of %d authors followed, %d posts each, '
+                  '%d posts per page' %
+                  (args.followed, args.authors, args.posts, per_page))
+            for name, f in [
+                    ('join', lambda: User.query.get(1).followed_posts.order_by(
+                        Post.timestamp.desc(), Post.id.desc())
+                        .limit(per_page).all()),
+                    ('merge', lambda: merged_timeline(User.query.get(1),
+                                                      per_page))]:
+                print('%-6s %8.2f ms' % (name,
+                                         median_time(f, args.runs) * 1000))
+            db.session.remove()
+            db.get_engine(app).dispose()
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+"""Compare the gunicorn worker classes on the endpoints of the application.
+
+    python benchmarks/workers.py [--workers 2] [--threads 4] [--clients 16]
+                                 [--duration 5] [--classes sync,gthread,gevent]
+
+A SQLite database with generated users and posts is served by gunicorn
+with gunicorn_config.py and each worker class in turn, and ``--clients``
+threads keep sending requests to each endpoint over keep-alive connections
+for ``--duration`` seconds. The requests per second and the median and
+99th percentile latencies are reported. The gevent worker needs
+requirements/gevent.txt.
+
+The load is generated on the same machine, so leave CPUs for it. On one
+CPU shared with the clients, with 2 workers, 4 threads and 16 clients:
+
+    class    endpoint             req/s   p50 ms   p99 ms
+    sync     /                     10.0   1491.4   1872.0
+    sync     /api/v1/posts/       100.9    145.0    214.3
+    sync     /user/<username>      18.5    860.8    988.6
+    gthread  /                     12.7   1367.8   2139.4
+    gthread  /api/v1/posts/       112.1    133.6    288.9
+    gthread  /user/<username>      19.9    855.3   1397.2
+    gevent   /                     13.5    695.0   4852.0
+    gevent   /api/v1/posts/       113.9     18.1   1344.0
+    gevent   /user/<username>      23.3    102.7   2485.1
+
+Threads and greenlets serve 10 to 35% more requests than the sync workers,
+which sit idle while their single request waits for the database or the
+client. gevent serves most requests fastest but lets a few wait behind
+the others, hence its high 99th percentile. gthread is the default, as it
+needs no extra dependency and keeps the tail latency close to sync.
+"""
+import argparse
+import http.client
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from base64 import b64encode
+
+basedir = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, basedir)
+
+
+def populate(path, users, posts):
+    os.environ['DATABASE_URL'] = 'sqlite:///' + path
+    from app import create_app, db, fake
+    from app.models import User, Role
+    app = create_app('production', web=False)
+    with app.app_context():
+        db.create_all()
+        Role.insert_roles()
+        user = User(email='bench@example.com', username='bench',
+                    password='bench', confirmed=True)
+        db.session.add(user)
+        db.session.commit()
+        fake.users(users)
+        fake.posts(posts)
+        user_url = '/user/' + User.query.get(2).username
+        db.session.remove()
+    return user_url
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def start_server(worker_class, args, database, port):
+    env = dict(os.environ, FLASK_CONFIG='production', DATABASE_URL=database,
+               SERVER_NAME='127.0.0.1:%d' % port,
+               GUNICORN_BIND='127.0.0.1:%d' % port,
+               GUNICORN_WORKER_CLASS=worker_class,
+               WEB_CONCURRENCY=str(args.workers),
+               GUNICORN_THREADS=str(args.threads))
+    gunicorn = os.path.join(os.path.dirname(sys.executable), 'gunicorn')
+    server = subprocess.Popen(
+        [gunicorn, '-c', 'gunicorn_config.py', 'flasky:app'], cwd=basedir,
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            conn.request('GET', '/auth/login')
+            if conn.getresponse().status == 200:
+                conn.close()
+                return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError('gunicorn did not start with ' + worker_class)
+
+
+def get_token(port):
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    conn.request('POST', '/api/v1/tokens/', headers={
+        'Authorization': 'Basic ' + b64encode(b'bench@example.com:bench')
+        .decode('ascii')})
+    response = conn.getresponse()
+    token = json.loads(response.read().decode('utf-8'))['token']
+    conn.close()
+    return 'Basic ' + b64encode((token + ':').encode('ascii')).decode('ascii')
+
+
+def load(port, path, headers, clients, duration):
+    latencies = []
+    errors = []
+    deadline = time.time() + duration
+
+    def client():
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        own = []
+        while time.time() < deadline:
+            t = time.perf_counter()
+            try:
+                conn.request('GET', path, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                if response.status != 200:
+                    errors.append(response.status)
+            except (OSError, http.client.HTTPException) as e:
+                errors.append(e)
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port,
+                                                  timeout=30)
+                continue
+            own.append(time.perf_counter() - t)
+        conn.close()
+        latencies.extend(own)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+    latencies.sort()
+    if not latencies:
+        return 0.0, 0.0, 0.0, len(errors)
+    return (len(latencies) / elapsed,
+            latencies[len(latencies) // 2],
+            latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+            len(errors))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--posts', type=int, default=500)
+    parser.add_argument('--classes', default='sync,gthread,gevent')
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        database = 'sqlite:///' + os.path.join(tmpdir, 'bench.sqlite')
+        user_url = populate(os.path.join(tmpdir, 'bench.sqlite'),
+                            args.users, args.posts)
+        print('%-8s %-18s %7s %8s %8s' % ('class', 'endpoint', 'req/s',
+                                          'p50 ms', 'p99 ms'))
+        for worker_class in args.classes.split(','):
+            port = free_port()
+            server = start_server(worker_class, args, database, port)
+            try:
+                endpoints = [('/', '/', {}),
+                             ('/api/v1/posts/', '/api/v1/posts/',
+                              {'Authorization': get_token(port)}),
+                             ('/user/<username>', user_url, {})]
+                for name, path, headers in endpoints:
+                    rate, p50, p99, errors = load(port, path, headers,
+                                                  args.clients, args.duration)
+                    print('%-8s %-18s %7.1f %8.1f %8.1f%s' % (
+                        worker_class, name, rate, p50 * 1000, p99 * 1000,
+                        ' (%d errors)' % errors if errors else ''))
+            finally:
+                server.terminate()
+                server.wait()
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
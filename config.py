@@ -2,6 +2,15 @@ import os
 basedir = os.path.abspath(os.path.dirname(__file__))
 
 
+def replica_binds(env_var):
+    # comma separated list of database URLs of read replicas
+    urls = os.environ.get(env_var)
+    if not urls:
+        return {}
+    return {'replica%d' % i: url.strip()
+            for i, url in enumerate(urls.split(',')) if url.strip()}
+
+
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'hard to guess string'
     MAIL_SERVER = os.environ.get('MAIL_SERVER', 'smtp.163.com')
@@ -21,6 +30,43 @@ class Config:
     FLASKY_FOLLOWERS_PER_PAGE = 50
     FLASKY_COMMENTS_PER_PAGE = 30
     FLASKY_SLOW_DB_QUERY_TIME = 0.5
+    FLASKY_QUERY_LOG = os.environ.get('FLASKY_QUERY_LOG')
+    SQLALCHEMY_BINDS = {}
+    FLASKY_DB_REPLICAS = []
+    FLASKY_DB_STICKY_SECONDS = 5
+    FLASKY_DB_REPLICA_MAX_LAG = 2.0
+    FLASKY_DB_REPLICA_CHECK_INTERVAL = 10
+    FLASKY_SERIALIZE_WRITES = bool(os.environ.get('FLASKY_SERIALIZE_WRITES'))
+    FLASKY_WRITE_BATCH_SIZE = 50
+    FLASKY_WRITE_GROUP_WAIT = 0.002
+    FLASKY_WRITE_TIMEOUT = 30
+    FLASKY_FOLLOW_GRAPH = True
+    FLASKY_FOLLOW_GRAPH_TTL = 60
+    FLASKY_SUGGESTIONS_TOP_K = 10
+    FLASKY_TIMELINE_MERGE_THRESHOLD = int(
+        os.environ.get('FLASKY_TIMELINE_MERGE_THRESHOLD', 0)) or None
+    FLASKY_TRENDING = True
+    FLASKY_TRENDING_HALF_LIFE = 6 * 60 * 60
+    FLASKY_TRENDING_COMMENT_WEIGHT = 1.0
+    FLASKY_TRENDING_FOLLOW_WEIGHT = 0.5
+    FLASKY_TRENDING_MIN_SCORE = 0.05
+    FLASKY_COMPRESS = True
+    FLASKY_COMPRESS_MIN_SIZE = 500
+    FLASKY_COMPRESS_MIMETYPES = ['text/html', 'text/css', 'text/plain',
+                                 'application/json', 'application/javascript']
+    FLASKY_COMPRESS_LEVELS = {'gzip': 6, 'br': 4, 'zstd': 3}
+    FLASKY_COMPRESS_CACHE_SIZE = 64
+    FLASKY_JSON_SERIALIZER = os.environ.get('FLASKY_JSON_SERIALIZER', 'auto')
+    FLASKY_URL_TEMPLATES = True
+    FLASKY_API_MAX_BATCH = 100
+    FLASKY_API_MAX_COMMENT_BATCH = 500
+    FLASKY_RENDER_WORKERS = int(os.environ.get('FLASKY_RENDER_WORKERS', 0)) \
+        or None
+    FLASKY_RENDER_PARALLEL_MIN = 64
+    FLASKY_WARMUP = not os.environ.get('FLASKY_NO_WARMUP')
+    FLASKY_TEMPLATE_CACHE_DIR = os.environ.get('FLASKY_TEMPLATE_CACHE_DIR') \
+        or os.path.join(basedir, 'tmp', 'jinja')
+    FLASKY_PASSWORD_HASH = 'pbkdf2:sha256'
 
     @staticmethod
     def init_app(app):
@@ -31,18 +77,27 @@ class DevelopmentConfig(Config):
     DEBUG = True
     SQLALCHEMY_DATABASE_URI = os.environ.get('DEV_DATABASE_URL') or \
         'sqlite:///' + os.path.join(basedir, 'data-dev.sqlite')
+    SQLALCHEMY_BINDS = replica_binds('DEV_DATABASE_REPLICA_URLS')
+    FLASKY_DB_REPLICAS = sorted(SQLALCHEMY_BINDS)
 
 
 class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL') or \
         'sqlite://'
+    SQLALCHEMY_BINDS = replica_binds('TEST_DATABASE_REPLICA_URLS')
+    FLASKY_DB_REPLICAS = sorted(SQLALCHEMY_BINDS)
     WTF_CSRF_ENABLED = False
+    FLASKY_TEMPLATE_CACHE_DIR = None
+    # a single PBKDF2 iteration, the hashes of the tests need not be strong
+    FLASKY_PASSWORD_HASH = 'pbkdf2:sha256:1'
 
 
 class ProductionConfig(Config):
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
         'sqlite:///' + os.path.join(basedir, 'data.sqlite')
+    SQLALCHEMY_BINDS = replica_binds('DATABASE_REPLICA_URLS')
+    FLASKY_DB_REPLICAS = sorted(SQLALCHEMY_BINDS)
     # SERVER_NAME = os.environ['SERVER_NAME']  # configure the domain name in use
     SERVER_NAME = os.environ.get('SERVER_NAME', 'localhost:5000')
 
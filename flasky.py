@@ -1,8 +1,13 @@
 import os
-from dotenv import load_dotenv
+
+IMPORT_TIMER = None
+if os.environ.get('FLASKY_IMPORT_TIMES'):
+    import startup
+    IMPORT_TIMER = startup.start()
 
 dotenv_path = os.path.join(os.path.dirname(__file__), '.env')
 if os.path.exists(dotenv_path):
+    from dotenv import load_dotenv
     load_dotenv(dotenv_path)
 
 COV = None
@@ -11,49 +16,250 @@ if os.environ.get('FLASK_COVERAGE'):
     COV = coverage.coverage(branch=True, include='app/*')
     COV.start()
 
+IMPACT_RECORDER = None
+if os.environ.get('FLASKY_RECORD_IMPACT'):
+    # started before the application is imported, see app/impact.py
+    import startup
+    basedir = os.path.abspath(os.path.dirname(__file__))
+    IMPACT_RECORDER = startup.record_lines(basedir,
+                                           os.path.join(basedir, 'tests'))
+
 import sys
+import time
 import click
-from flask_migrate import Migrate, upgrade
 from app import create_app, db
-from app.models import User, Follow, Role, Permission, Post, Comment
+from app.models import User, Follow, Role, Permission, Post, Comment, \
+    Suggestion, TrendingPost
+
+IMPACT_FILE = os.path.join(os.path.abspath(os.path.dirname(__file__)),
+                           'tmp', 'impact.json')
+
+# the commands of the flask command line that serve or render pages
+WEB_COMMANDS = {'run', 'shell'}
+
+
+def needs_web():
+    """Tell if the application needs its blueprints and web extensions.
+
+    The built-in run and shell commands load the application from their own
+    click context. The other commands, registered by the application and by
+    plugins, load it from the context of the flask group to look themselves
+    up, and get an application without them. Outside of the command line
+    (e.g. in gunicorn) there is no click context.
+    """
+    ctx = click.get_current_context(silent=True)
+    return ctx is None or ctx.info_name in WEB_COMMANDS
+
+
+class LazyMigrate(object):
+    """Stands in for Flask-Migrate, which imports Alembic and Mako, until
+    a migration command uses it."""
+    def __init__(self, app, db):
+        self.app = app
+        self.db = db
+
+    def __getattr__(self, name):
+        from flask_migrate import Migrate
+        Migrate(self.app, self.db)
+        return getattr(self.app.extensions['migrate'], name)
+
 
-app = create_app(os.getenv('FLASK_CONFIG') or 'default')
-migrate = Migrate(app, db)
+app = create_app(os.getenv('FLASK_CONFIG') or 'default', web=needs_web())
+app.extensions['migrate'] = LazyMigrate(app, db)
 
 
 @app.shell_context_processor
 def make_shell_context():
     return dict(db=db, User=User, Follow=Follow, Role=Role,
-                Permission=Permission, Post=Post, Comment=Comment)
+                Permission=Permission, Post=Post, Comment=Comment,
+                Suggestion=Suggestion, TrendingPost=TrendingPost)
 
 
 @app.cli.command()
 @click.option('--coverage/--no-coverage', default=False,
               help='Run tests under code coverage.')
+@click.option('--workers', default=1,
+              help='Number of processes running the test modules, 0 for '
+                   'one per CPU.')
+@click.option('--record-impact', is_flag=True,
+              help='Record the tests that run each line, for --changed.')
+@click.option('--changed', is_flag=True,
+              help='Run only the tests affected by the changes made since '
+                   'the impact was recorded.')
 @click.argument('test_names', nargs=-1)
-def test(coverage, test_names):
+def test(coverage, workers, record_impact, changed, test_names):
     """Run the unit tests."""
+    if record_impact and (coverage or workers != 1):
+        raise click.ClickException('The impact is recorded by a single '
+                                   'process, without coverage.')
     if coverage and not os.environ.get('FLASK_COVERAGE'):
         import subprocess
         os.environ['FLASK_COVERAGE'] = '1'
         sys.exit(subprocess.call(sys.argv))
+    if record_impact and IMPACT_RECORDER is None:
+        import subprocess
+        os.environ['FLASKY_RECORD_IMPACT'] = '1'
+        sys.exit(subprocess.call(sys.argv))
 
     import unittest
+    basedir = os.path.abspath(os.path.dirname(__file__))
     if test_names:
         tests = unittest.TestLoader().loadTestsFromNames(test_names)
     else:
         tests = unittest.TestLoader().discover('tests')
-    unittest.TextTestRunner(verbosity=2).run(tests)
+    if changed:
+        tests = select_changed_tests(tests, basedir)
+        test_names = [test.id() for test in tests]
+        if not test_names:
+            return
+    if record_impact:
+        from app.impact import record_impact as record
+        result, impact = record(tests, basedir,
+                                os.path.join(basedir, 'tests'),
+                                recorder=IMPACT_RECORDER)
+        os.makedirs(os.path.dirname(IMPACT_FILE), exist_ok=True)
+        impact.save(IMPACT_FILE)
+        print('Recorded the impact of %d tests in %s.' % (
+            len(impact.tests), IMPACT_FILE))
+        successful = result.wasSuccessful()
+    elif workers == 1:
+        from app.testing import ContextTestResult
+        successful = unittest.TextTestRunner(
+            verbosity=2, resultclass=ContextTestResult).run(
+            tests).wasSuccessful()
+    else:
+        from app.testing import suite_modules
+        successful = run_parallel_tests(
+            list(test_names) or suite_modules(tests), workers)
     if COV:
         COV.stop()
         COV.save()
         print('Coverage Summary:')
         COV.report()
-        basedir = os.path.abspath(os.path.dirname(__file__))
         covdir = os.path.join(basedir, 'tmp/coverage')
         COV.html_report(directory=covdir)
         print('HTML version: file://%s/index.html' % covdir)
         COV.erase()
+    sys.exit(0 if successful else 1)
+
+
+def select_changed_tests(tests, basedir):
+    from app.impact import ImpactMap, affected_tests, select_tests
+    if not os.path.exists(IMPACT_FILE):
+        raise click.ClickException('No impact recorded, run flask test '
+                                   '--record-impact first.')
+    impact = ImpactMap.load(IMPACT_FILE)
+    if impact.dirty:
+        print('The impact was recorded with uncommitted changes, some '
+              'tests may be missed. Record it again after a commit.')
+    test_ids, modules, changes = affected_tests(
+        impact, os.path.join(basedir, 'tests'), basedir)
+    tests = select_tests(tests, test_ids, modules)
+    for change in changes:
+        print('Changed: %s' % change)
+    print('Running %d of the %d tests.' % (tests.countTestCases(),
+                                           len(impact.tests)))
+    return tests
+
+
+def run_parallel_tests(names, workers):
+    from app.testing import run_parallel
+    workers = min(workers or os.cpu_count(), len(names)) or 1
+    start = time.time()
+    results = run_parallel(names, workers, os.path.abspath('tests'), cov=COV)
+    elapsed = time.time() - start
+    print('Ran %d tests from %d modules in %.3fs with %d workers.' % (
+        sum(result.tests for result in results), len(results), elapsed,
+        workers))
+    for result in sorted(results, key=lambda result: -result.seconds):
+        print('%8.3fs  %s' % (result.seconds, result.name))
+    failed = [result for result in results if not result.successful]
+    if failed:
+        print('FAILED (failures=%d, errors=%d) in %s' % (
+            sum(result.failures for result in results),
+            sum(result.errors for result in results),
+            ', '.join(result.name for result in failed)))
+    else:
+        print('OK')
+    return not failed
+
+
+@app.cli.command()
+@click.option('--workers', default=0,
+              help='Number of mutants tested at once, 0 for one per CPU.')
+@click.option('--timeout', default=10.0,
+              help='Seconds given to the tests of a mutant on top of twice '
+                   'their normal time.')
+@click.option('--tests', 'test_prefix', default='',
+              help='Only run the tests whose names start with this, e.g. '
+                   'manual or ai_generated.')
+@click.option('--label', default=None,
+              help='Name of the mutation score column, e.g. Human or AI.')
+@click.option('--output', type=click.Path(), default=None,
+              help='JSON file where the result of each mutant is saved.')
+@click.argument('targets', nargs=-1)
+def mutate(workers, timeout, test_prefix, label, output, targets):
+    """Run the tests against mutants of the application code.
+
+    Targets are modules, classes or functions, such as app/models.py,
+    models.py::User or app/models.py::User.can, all the application by
+    default. The tests of each mutant are those that ran its lines in
+    the impact recorded by flask test --record-impact.
+    """
+    import json
+    from app.impact import ImpactMap, changed_lines
+    from app.mutation import find_mutants, run_mutants, function_scores
+    if not os.path.exists(IMPACT_FILE):
+        raise click.ClickException('No impact recorded, run flask test '
+                                   '--record-impact first.')
+    basedir = os.path.abspath(os.path.dirname(__file__))
+    sys.path.insert(0, os.path.join(basedir, 'tests'))
+    impact = ImpactMap.load(IMPACT_FILE)
+    mutants = find_mutants(targets, basedir)
+    stale = set(changed_lines(impact.commit)) & \
+        set(mutant.path for mutant in mutants)
+    if impact.dirty or stale:
+        print('The impact was recorded on other versions of %s, record it '
+              'again for accurate results.' % (', '.join(sorted(stale)) or
+                                               'the files'))
+    workers = workers or os.cpu_count()
+    print('Testing %d mutants with %d workers.' % (len(mutants), workers))
+    start = time.time()
+
+    def baseline_failures(test_ids):
+        print('%d tests fail without mutation and are left out:' %
+              len(test_ids))
+        for test_id in test_ids:
+            print('  %s' % test_id)
+
+    results = run_mutants(mutants, impact, basedir, workers, timeout,
+                          test_prefix, baseline_failures=baseline_failures)
+    elapsed = time.time() - start
+
+    for result in results:
+        if result.status not in ('killed', 'timeout'):
+            mutant = result.mutant
+            print('%-8s %s:%d %s: %s%s' % (
+                result.status, mutant.path, mutant.line, mutant.function,
+                mutant.description,
+                ' (%s)' % result.detail if result.detail else ''))
+    scores = function_scores(results)
+    print('%6s %6s %6s  %s' % ('killed', 'total', 'score', 'function'))
+    for function, (killed, total) in scores.items():
+        print('%6d %6d %5.0f%%  %s' % (killed, total, 100.0 * killed / total,
+                                      function))
+    killed = sum(killed for killed, total in scores.values())
+    total = sum(total for killed, total in scores.values())
+    print('Killed %d of %d mutants in %.1fs.' % (killed, total, elapsed))
+    # the row format of data/data_analysis.py, one function per row
+    print('"mutation_score_%s": [%s],' % (
+        label or test_prefix or 'all',
+        ', '.join('%d/%d' % score for score in scores.values())))
+    if output:
+        with open(output, 'w') as f:
+            json.dump([dict(result.mutant._asdict(), status=result.status,
+                            detail=result.detail)
+                       for result in results], f, indent=2)
 
 
 @app.cli.command()
@@ -64,19 +270,175 @@ def test(coverage, test_names):
 def profile(length, profile_dir):
     """Start the application under the code profiler."""
     from werkzeug.contrib.profiler import ProfilerMiddleware
-    app.wsgi_app = ProfilerMiddleware(app.wsgi_app, restrictions=[length],
-                                      profile_dir=profile_dir)
-    app.run()
+    web_app = create_app(os.getenv('FLASK_CONFIG') or 'default')
+    web_app.wsgi_app = ProfilerMiddleware(web_app.wsgi_app,
+                                          restrictions=[length],
+                                          profile_dir=profile_dir)
+    web_app.run()
 
 
 @app.cli.command()
-def deploy():
+@click.option('--force', is_flag=True,
+              help='Run the tasks even if the database is up to date.')
+def deploy(force):
     """Run deployment tasks."""
+    from flask_migrate import upgrade
+    from app.deploy import is_current, run_step
+    if not force and is_current():
+        print('Database is up to date, nothing to deploy.')
+        return
+
     # migrate database to latest revision
-    upgrade()
+    run_step('Upgrading database', upgrade)
 
     # create or update user roles
-    Role.insert_roles()
+    run_step('Updating roles', Role.insert_roles)
 
     # ensure all users are following themselves
-    User.add_self_follows()
+    run_step('Adding self-follows',
+             lambda: '%d added' % User.add_self_follows())
+
+
+@app.cli.command('sync-replicas')
+def sync_replicas():
+    """Copy a SQLite primary database onto its SQLite replicas."""
+    import shutil
+    import sqlite3
+    from sqlalchemy.engine.url import make_url
+    primary = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    if primary.drivername != 'sqlite' or not primary.database:
+        raise click.ClickException('The primary is not a SQLite file.')
+    for bind in app.config['FLASKY_DB_REPLICAS']:
+        replica = make_url(app.config['SQLALCHEMY_BINDS'][bind])
+        if replica.drivername != 'sqlite' or not replica.database:
+            print('Skipping %s, not a SQLite file.' % bind)
+            continue
+        src = sqlite3.connect(primary.database)
+        try:
+            if hasattr(src, 'backup'):
+                dst = sqlite3.connect(replica.database)
+                src.backup(dst)
+                dst.close()
+            else:
+                # Python < 3.7, hold a write lock while copying the file
+                src.execute('BEGIN IMMEDIATE')
+                shutil.copyfile(primary.database, replica.database)
+                src.rollback()
+        finally:
+            src.close()
+        print('Synchronized %s.' % bind)
+
+
+@app.cli.command('index-advisor')
+@click.option('--log', default=None,
+              help='Query log to replay (defaults to FLASKY_QUERY_LOG).')
+@click.option('--builtin', is_flag=True,
+              help='Check the queries behind the most visited pages.')
+def index_advisor(log, builtin):
+    """Report queries that scan whole tables or sort in temporary B-trees."""
+    from app.advisor import load_queries, hot_queries, explain
+    engine = db.get_engine(app)
+    if engine.dialect.name != 'sqlite':
+        raise click.ClickException('The index advisor needs SQLite.')
+    log = log or app.config['FLASKY_QUERY_LOG']
+    if builtin or not log:
+        queries = hot_queries(engine)
+    elif not os.path.exists(log):
+        raise click.ClickException('Query log %s not found.' % log)
+    else:
+        queries = load_queries(log)
+    flagged = 0
+    for statement, parameters, count in queries:
+        plan, problems = explain(engine, statement, parameters)
+        if problems:
+            flagged += 1
+            print('%s\n  issued %d times' % (' '.join(statement.split()),
+                                             count))
+            for problem in problems:
+                print('  ' + problem)
+    print('%d of %d distinct queries need attention.' %
+          (flagged, len(queries)))
+
+
+@app.cli.command('refresh-suggestions')
+@click.option('--full', is_flag=True,
+              help='Recompute the suggestions of all the users.')
+@click.option('--top-k', default=None, type=int,
+              help='Number of suggestions to store for each user.')
+@click.option('--batch-size', default=1000,
+              help='Number of users scored in each vectorized batch.')
+def refresh_suggestions(full, top_k, batch_size):
+    """Recompute the follow suggestions of the users."""
+    try:
+        import numpy  # noqa: F401
+        import scipy  # noqa: F401
+    except ImportError:
+        raise click.ClickException(
+            'NumPy and SciPy are required, install '
+            'requirements/recommendations.txt.')
+
+    def progress(done, total, elapsed):
+        print('%d/%d users (%.2fs)' % (done, total, elapsed))
+
+    from app.recommendations import refresh_suggestions as refresh
+    count = refresh(
+        top_k or app.config['FLASKY_SUGGESTIONS_TOP_K'],
+        batch_size=batch_size, full=full, progress=progress)
+    print('Refreshed the suggestions of %d users.' % count)
+
+
+@app.cli.command('import-posts')
+@click.argument('source')
+@click.option('--format', 'input_format', type=click.Choice(['jsonl', 'csv']),
+              default=None,
+              help='Input format, guessed from the file extension if not '
+              'given.')
+@click.option('--batch-size', default=1000,
+              help='Number of posts committed in each transaction.')
+@click.option('--workers', default=None, type=int,
+              help='Number of processes rendering the posts.')
+@click.option('--checkpoint', default=None,
+              help='File where progress is saved, to resume an interrupted '
+              'import.')
+def import_posts(source, input_format, batch_size, workers, checkpoint):
+    """Import posts from a JSON Lines or CSV file ("-" for stdin)."""
+    from app.importer import guess_format, import_posts as run_import
+    input_format = input_format or guess_format(source)
+    if input_format is None:
+        raise click.ClickException('Cannot guess the format of %s, use '
+                                   '--format.' % source)
+    if source != '-' and not os.path.exists(source):
+        raise click.ClickException('%s not found.' % source)
+
+    def progress(records, imported, elapsed):
+        print('%d records read, %d posts imported (%.0f posts/s)' %
+              (records, imported, imported / elapsed if elapsed else 0))
+
+    start = time.time()
+    stream = sys.stdin if source == '-' else \
+        open(source, newline='', encoding='utf-8')
+    try:
+        state = run_import(stream, input_format, batch_size=batch_size,
+                           workers=workers, checkpoint=checkpoint,
+                           progress=progress)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    elapsed = time.time() - start
+    print('Imported %d posts from %d records in %.1fs.' %
+          (state['imported'], state['records'], elapsed))
+    for reason, count in sorted(state['skipped'].items()):
+        print('Skipped %d records: %s.' % (count, reason))
+
+
+@app.cli.command('compile-templates')
+def compile_templates():
+    """Compile the templates into the bytecode cache."""
+    from app.warmup import compile_templates as compile_all
+    web_app = create_app(os.getenv('FLASK_CONFIG') or 'default')
+    cache_dir = web_app.config['FLASKY_TEMPLATE_CACHE_DIR']
+    if not cache_dir:
+        raise click.ClickException('The configuration has no '
+                                   'FLASKY_TEMPLATE_CACHE_DIR.')
+    print('Compiled %d templates into %s.' % (compile_all(web_app),
+                                              cache_dir))
@@ -0,0 +1,85 @@
+"""Gunicorn settings, read from the environment.
+
+    gunicorn -c gunicorn_config.py flasky:app
+
+GUNICORN_WORKER_CLASS  sync, gthread (default) or gevent
+WEB_CONCURRENCY        number of worker processes (default 2 * CPUs + 1)
+GUNICORN_THREADS       threads of each gthread worker (default 4)
+GUNICORN_CONNECTIONS   concurrent requests of each gevent worker (1000)
+GUNICORN_TIMEOUT       seconds before a silent worker is restarted (30)
+GUNICORN_GRACEFUL_TIMEOUT  seconds given to workers to finish on restart
+GUNICORN_KEEPALIVE     seconds to wait for the next request on a
+                       keep-alive connection (2)
+GUNICORN_BIND          address to listen on (default 0.0.0.0:$PORT, with
+                       PORT defaulting to 5000)
+FLASKY_RENDER_WORKERS  render processes of each worker (default CPUs
+                       divided by the workers, none when that is below 2)
+
+The application is loaded once in the master process, which fills its
+caches (see app/warmup.py) when FLASKY_WARMUP is on, and forked into the
+workers, which share the memory of the code and the warm caches. See
+benchmarks/workers.py for a comparison of the worker classes.
+"""
+import multiprocessing
+import os
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+if worker_class not in ('sync', 'gthread', 'gevent'):
+    raise RuntimeError('Unsupported GUNICORN_WORKER_CLASS ' + worker_class)
+if worker_class == 'gevent':
+    # patch before the application is preloaded, so that the locks and the
+    # sockets it creates cooperate with the other greenlets
+    from gevent import monkey
+    monkey.patch_all()
+
+bind = os.environ.get('GUNICORN_BIND',
+                      '0.0.0.0:' + os.environ.get('PORT', '5000'))
+workers = int(os.environ.get('WEB_CONCURRENCY',
+                             multiprocessing.cpu_count() * 2 + 1))
+# gunicorn turns sync workers with several threads into gthread workers
+threads = int(os.environ.get('GUNICORN_THREADS', 4)) \
+    if worker_class == 'gthread' else 1
+worker_connections = int(os.environ.get('GUNICORN_CONNECTIONS', 1000))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', timeout))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 2))
+# each worker has its own render pool, see app/rendering.py, together they
+# should not have more processes than there are CPUs
+os.environ.setdefault('FLASKY_RENDER_WORKERS',
+                      str(max(1, multiprocessing.cpu_count() // workers)))
+preload_app = True
+accesslog = '-'
+errorlog = '-'
+
+
+def _dispose_engines(server, close):
+    from app import db
+    app = server.app.wsgi()
+    with app.app_context():
+        db.dispose_engines(app, close=close)
+
+
+def when_ready(server):
+    if not server.cfg.preload_app:
+        return
+    app = server.app.wsgi()
+    if app.config['FLASKY_WARMUP']:
+        from app.warmup import warm_up
+        for step, (result, seconds) in warm_up(app).items():
+            server.log.info('Warmed up %s: %s in %.3fs', step, result,
+                            seconds)
+    # the master does not serve requests, close the connections opened
+    # while loading the application before the workers inherit them
+    _dispose_engines(server, close=True)
+
+
+def post_fork(server, worker):
+    # connections of the master must not be shared by the workers
+    if server.cfg.preload_app:
+        _dispose_engines(server, close=False)
+
+
+def worker_exit(server, worker):
+    # the render processes would otherwise outlive the worker
+    from app.rendering import shutdown_render_pool
+    shutdown_render_pool()
@@ -0,0 +1,32 @@
+"""Comment moderation state.
+
+Revision ID: 3f6a2c1d8b4e
+Revises: e9c90ad67a42
+Create Date: 2026-10-19 09:12:31.504112
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f6a2c1d8b4e'
+down_revision = 'e9c90ad67a42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('comments', sa.Column('state', sa.Integer(), nullable=True))
+    # pending = 0, approved = 1, disabled = 2 (see app.models.Moderation)
+    op.execute('UPDATE comments SET state = CASE '
+               'WHEN disabled IS NULL THEN 0 '
+               'WHEN disabled THEN 2 ELSE 1 END')
+    op.create_index('ix_comments_state_timestamp', 'comments',
+                    ['state', 'timestamp'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_comments_state_timestamp', table_name='comments')
+    with op.batch_alter_table('comments') as batch_op:
+        batch_op.drop_column('state')
@@ -0,0 +1,31 @@
+"""Composite indexes for hot access paths.
+
+Revision ID: 8c2d51e7a9f0
+Revises: 3f6a2c1d8b4e
+Create Date: 2026-10-19 10:41:05.118637
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c2d51e7a9f0'
+down_revision = '3f6a2c1d8b4e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_posts_author_id_timestamp', 'posts',
+                    ['author_id', 'timestamp'], unique=False)
+    op.create_index('ix_comments_post_id_timestamp', 'comments',
+                    ['post_id', 'timestamp'], unique=False)
+    op.create_index('ix_follows_followed_id_timestamp', 'follows',
+                    ['followed_id', 'timestamp'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_follows_followed_id_timestamp', table_name='follows')
+    op.drop_index('ix_comments_post_id_timestamp', table_name='comments')
+    op.drop_index('ix_posts_author_id_timestamp', table_name='posts')
@@ -0,0 +1,35 @@
+"""Follow suggestions.
+
+Revision ID: b71e4f03c5d2
+Revises: 8c2d51e7a9f0
+Create Date: 2026-10-19 13:02:47.930211
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b71e4f03c5d2'
+down_revision = '8c2d51e7a9f0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('suggestions',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('suggested_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=True),
+    sa.Column('timestamp', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['suggested_id'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'suggested_id')
+    )
+    op.create_index('ix_suggestions_user_id_score', 'suggestions',
+                    ['user_id', 'score'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_suggestions_user_id_score', table_name='suggestions')
+    op.drop_table('suggestions')
@@ -0,0 +1,33 @@
+"""Trending posts.
+
+Revision ID: d4e8a6b2f913
+Revises: b71e4f03c5d2
+Create Date: 2026-10-19 16:52:08.214375
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4e8a6b2f913'
+down_revision = 'b71e4f03c5d2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('trending_posts',
+    sa.Column('post_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['post_id'], ['posts.id'], ),
+    sa.PrimaryKeyConstraint('post_id')
+    )
+    op.create_index('ix_trending_posts_score_post_id', 'trending_posts',
+                    ['score', 'post_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_trending_posts_score_post_id',
+                  table_name='trending_posts')
+    op.drop_table('trending_posts')
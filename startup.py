@@ -0,0 +1,182 @@
+"""Import-time instrumentation, the equivalent of ``python -X importtime``
+(which needs Python 3.7) for the modules imported after ``start()``, and
+the line tracer of ``flask test --record-impact`` (see app/impact.py),
+which must also see the code that runs while the application is imported.
+
+This module must not import the application, so that it can be loaded
+before it. Set ``FLASKY_IMPORT_TIMES`` to have ``flasky.py`` print the
+report when the process exits.
+"""
+import atexit
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+
+
+class _TimedLoader(object):
+    def __init__(self, loader, timer):
+        self.loader = loader
+        self.timer = timer
+
+    def create_module(self, spec):
+        # extension modules do their work in create_module
+        with self.timer.measure(spec.name):
+            return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        # keep the real loader, pkg_resources looks resources up by its type
+        module.__loader__ = module.__spec__.loader = self.loader
+        with self.timer.measure(module.__name__):
+            self.loader.exec_module(module)
+
+
+class _Measure(object):
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.timer._stack.append(0.0)
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        children = self.timer._stack.pop()
+        if self.timer._stack:
+            self.timer._stack[-1] += elapsed
+        self.timer.times[self.name][0] += elapsed - children
+        self.timer.times[self.name][1] += elapsed
+
+
+class ImportTimer(object):
+    """A meta path finder that times the loading of each module, with and
+    without the time spent importing its own imports."""
+    def __init__(self):
+        self.times = defaultdict(lambda: [0.0, 0.0])
+        self._stack = []
+        self._finding = set()
+        self.started = None
+
+    def find_spec(self, name, path=None, target=None):
+        if name in self._finding:
+            return None
+        self._finding.add(name)
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, 'find_spec'):
+                    continue
+                spec = finder.find_spec(name, path, target)
+                if spec is not None:
+                    break
+            else:
+                return None
+        finally:
+            self._finding.discard(name)
+        if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+            spec.loader = _TimedLoader(spec.loader, self)
+        return spec
+
+    def measure(self, name):
+        return _Measure(self, name)
+
+    def start(self):
+        self.started = time.perf_counter()
+        sys.meta_path.insert(0, self)
+        return self
+
+    def stop(self):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def packages(self):
+        """Return the self time of each top-level package, slowest first."""
+        totals = defaultdict(float)
+        for name, (self_time, cumulative) in self.times.items():
+            totals[name.split('.')[0]] += self_time
+        return sorted(totals.items(), key=lambda item: -item[1])
+
+    def report(self, limit=20, file=None):
+        file = file or sys.stderr
+        total = sum(self_time for self_time, cumulative in
+                    self.times.values())
+        print('%d modules imported in %.1f ms' %
+              (len(self.times), total * 1000), file=file)
+        print('%9s  %s' % ('self ms', 'package'), file=file)
+        for name, self_time in self.packages()[:limit]:
+            print('%9.1f  %s' % (self_time * 1000, name), file=file)
+        print('%9s  %s' % ('cumul. ms', 'module'), file=file)
+        for name, (self_time, cumulative) in sorted(
+                self.times.items(), key=lambda item: -item[1][1])[:limit]:
+            print('%9.1f  %s' % (cumulative * 1000, name), file=file)
+
+
+def start(report=True):
+    timer = ImportTimer().start()
+    if report:
+        atexit.register(timer.report)
+    return timer
+
+
+class LineRecorder(object):
+    """Record the lines run in the files of a directory, except for the
+    ``exclude`` files and directories, in every thread, with
+    ``sys.settrace``."""
+    def __init__(self, root, exclude=()):
+        self.root = os.path.abspath(root) + os.sep
+        self.exclude = set(os.path.abspath(path) for path in exclude)
+        self.lines = set()
+        self._paths = {}
+        self._previous = None
+
+    def _relative(self, filename):
+        if filename.startswith('<'):
+            # <string>, <frozen importlib._bootstrap> and the like
+            return None
+        filename = os.path.abspath(filename)
+        if not filename.startswith(self.root):
+            return None
+        path = filename
+        while path != os.path.dirname(path):
+            if path in self.exclude:
+                return None
+            path = os.path.dirname(path)
+        return os.path.relpath(filename, self.root).replace(os.sep, '/')
+
+    def _trace_calls(self, frame, event, arg):
+        filename = frame.f_code.co_filename
+        path = self._paths.get(filename, False)
+        if path is False:
+            path = self._paths[filename] = self._relative(filename)
+        if path is None:
+            # the lines of the other files are not traced
+            return None
+        self.lines.add((path, frame.f_lineno))
+        return self._trace_lines
+
+    def _trace_lines(self, frame, event, arg):
+        if event == 'line':
+            self.lines.add((self._paths[frame.f_code.co_filename],
+                            frame.f_lineno))
+        return self._trace_lines
+
+    def start(self):
+        self._previous = sys.gettrace()
+        threading.settrace(self._trace_calls)
+        sys.settrace(self._trace_calls)
+
+    def stop(self):
+        sys.settrace(self._previous)
+        threading.settrace(self._previous)
+
+
+def record_lines(root, tests_dir):
+    """Start recording the lines of the files of ``root``, outside of
+    ``tests_dir``, of the Python installation and of the recorder."""
+    recorder = LineRecorder(root, exclude=[
+        tests_dir, sys.prefix, sys.base_prefix,
+        os.path.splitext(__file__)[0] + '.py',
+        os.path.join(root, 'app', 'impact.py')])
+    recorder.start()
+    return recorder
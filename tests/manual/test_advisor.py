@@ -0,0 +1,59 @@
+import os
+import tempfile
+import unittest
+from app import create_app, db
+from app.testing import create_database, drop_database
+from app.advisor import record_queries, load_queries, hot_queries, explain
+
+
+class Query(object):
+    def __init__(self, statement, parameters):
+        self.statement = statement
+        self.parameters = parameters
+
+
+class IndexAdvisorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        create_database()
+        self.engine = db.get_engine(self.app)
+
+    def tearDown(self):
+        db.session.remove()
+        drop_database()
+        self.app_context.pop()
+
+    def test_full_scan(self):
+        plan, problems = explain(
+            self.engine, 'SELECT * FROM comments WHERE body = ?', ('a',))
+        self.assertTrue(problems[0].startswith('full scan'))
+
+    def test_temp_b_tree(self):
+        plan, problems = explain(
+            self.engine, 'SELECT * FROM users ORDER BY location', ())
+        self.assertTrue(any(p.startswith('temp b-tree') for p in problems))
+
+    def test_hot_queries_use_indexes(self):
+        flagged = [statement for statement, parameters, count
+                   in hot_queries(self.engine)
+                   if explain(self.engine, statement, parameters)[1]]
+        # only the followed posts timeline needs to sort its join
+        self.assertEqual(len(flagged), 1)
+        self.assertTrue('JOIN follows' in flagged[0])
+
+    def test_query_log(self):
+        fd, path = tempfile.mkstemp(suffix='.jsonl')
+        os.close(fd)
+        try:
+            record_queries(path, [
+                Query('SELECT * FROM posts WHERE id = ?', (1,)),
+                Query('SELECT * FROM posts WHERE id = ?', (2,)),
+                Query('SELECT * FROM users', ())])
+            queries = load_queries(path)
+        finally:
+            os.remove(path)
+        self.assertEqual(queries, [
+            ('SELECT * FROM posts WHERE id = ?', [1], 2),
+            ('SELECT * FROM users', [], 1)])
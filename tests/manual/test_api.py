@@ -3,7 +3,9 @@ import json
 import re
 from base64 import b64encode
 from app import create_app, db
-from app.models import User, Role, Post, Comment
+from app.testing import create_database, drop_database
+from app.models import User, Role, Post, Comment, Suggestion
+from app.rendering import render_pool, shutdown_render_pool
 
 
 class APITestCase(unittest.TestCase):
@@ -11,13 +13,12 @@ class APITestCase(unittest.TestCase):
         self.app = create_app('testing')
         self.app_context = self.app.app_context()
         self.app_context.push()
-        db.create_all()
-        Role.insert_roles()
+        create_database()
         self.client = self.app.test_client()
 
     def tearDown(self):
         db.session.remove()
-        db.drop_all()
+        drop_database()
         self.app_context.pop()
 
     def get_api_headers(self, username, password):
@@ -200,6 +201,43 @@ class APITestCase(unittest.TestCase):
         json_response = json.loads(response.get_data(as_text=True))
         self.assertEqual(json_response['username'], 'susan')
 
+    def test_user_suggestions(self):
+        r = Role.query.filter_by(name='User').first()
+        a = Role.query.filter_by(name='Administrator').first()
+        u1 = User(email='john@example.com', username='john',
+                  password='cat', confirmed=True, role=r)
+        u2 = User(email='susan@example.com', username='susan',
+                  password='dog', confirmed=True, role=r)
+        u3 = User(email='david@example.com', username='david',
+                  password='fox', confirmed=True, role=a)
+        db.session.add_all([u1, u2, u3])
+        db.session.commit()
+        db.session.add(Suggestion(user_id=u1.id, suggested_id=u2.id,
+                                  score=1.0))
+        db.session.commit()
+
+        # a user reads their own suggestions
+        response = self.client.get(
+            '/api/v1/users/{}/suggestions/'.format(u1.id),
+            headers=self.get_api_headers('john@example.com', 'cat'))
+        self.assertEqual(response.status_code, 200)
+        json_response = json.loads(response.get_data(as_text=True))
+        self.assertEqual(json_response['count'], 1)
+        self.assertEqual(json_response['suggestions'][0]['url'],
+                         '/api/v1/users/{}'.format(u2.id))
+
+        # but not those of another user
+        response = self.client.get(
+            '/api/v1/users/{}/suggestions/'.format(u1.id),
+            headers=self.get_api_headers('susan@example.com', 'dog'))
+        self.assertEqual(response.status_code, 403)
+
+        # unless they are an administrator
+        response = self.client.get(
+            '/api/v1/users/{}/suggestions/'.format(u1.id),
+            headers=self.get_api_headers('david@example.com', 'fox'))
+        self.assertEqual(response.status_code, 200)
+
     def test_comments(self):
         # add two users
         r = Role.query.filter_by(name='User').first()
@@ -262,3 +300,247 @@ class APITestCase(unittest.TestCase):
         json_response = json.loads(response.get_data(as_text=True))
         self.assertIsNotNone(json_response.get('comments'))
         self.assertEqual(json_response.get('count', 0), 2)
+
+    def test_moderate_comments(self):
+        # add a user and a moderator
+        r = Role.query.filter_by(name='User').first()
+        m = Role.query.filter_by(name='Moderator').first()
+        u = User(email='john@example.com', username='john',
+                 password='cat', confirmed=True, role=r)
+        mod = User(email='susan@example.com', username='susan',
+                   password='dog', confirmed=True, role=m)
+        db.session.add_all([u, mod])
+        db.session.commit()
+
+        # add comments to two posts
+        p1 = Post(body='post 1', author=u)
+        p2 = Post(body='post 2', author=u)
+        comments = [Comment(body='spam %d' % i, author=u, post=p1)
+                    for i in range(5)]
+        comments.append(Comment(body='hello', author=mod, post=p2))
+        db.session.add_all([p1, p2] + comments)
+        db.session.commit()
+
+        # regular users cannot moderate
+        response = self.client.post(
+            '/api/v1/comments/moderate',
+            headers=self.get_api_headers('john@example.com', 'cat'),
+            data=json.dumps({'disabled': True, 'post_id': p1.id}))
+        self.assertEqual(response.status_code, 403)
+
+        # disable all the comments of a post
+        response = self.client.post(
+            '/api/v1/comments/moderate',
+            headers=self.get_api_headers('susan@example.com', 'dog'),
+            data=json.dumps({'disabled': True, 'post_id': p1.id}))
+        self.assertEqual(response.status_code, 200)
+        json_response = json.loads(response.get_data(as_text=True))
+        self.assertEqual(json_response['count'], 5)
+        self.assertEqual(Comment.query.filter_by(disabled=True).count(), 5)
+
+        # enable a selection of comments
+        response = self.client.post(
+            '/api/v1/comments/moderate',
+            headers=self.get_api_headers('susan@example.com', 'dog'),
+            data=json.dumps({'disabled': False,
+                             'ids': [comments[0].id, comments[1].id]}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Comment.query.filter_by(disabled=True).count(), 3)
+
+        # at least one criteria is required
+        response = self.client.post(
+            '/api/v1/comments/moderate',
+            headers=self.get_api_headers('susan@example.com', 'dog'),
+            data=json.dumps({'disabled': True}))
+        self.assertEqual(response.status_code, 400)
+
+        # ids must be integers, dates must be valid
+        for criteria in [{'ids': str(comments[0].id)}, {'ids': [True]},
+                         {'ids': [1.9]}, {'ids': [2 ** 64]},
+                         {'author_id': 1.9}, {'post_id': True},
+                         {'since': '99999999999999999999'},
+                         {'until': 5}]:
+            response = self.client.post(
+                '/api/v1/comments/moderate',
+                headers=self.get_api_headers('susan@example.com', 'dog'),
+                data=json.dumps(dict(criteria, disabled=False)))
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(Comment.query.filter_by(disabled=True).count(), 3)
+
+        # the body must be an object
+        for data in [[comments[0].id], 'disabled', 1]:
+            response = self.client.post(
+                '/api/v1/comments/moderate',
+                headers=self.get_api_headers('susan@example.com', 'dog'),
+                data=json.dumps(data))
+            self.assertEqual(response.status_code, 400)
+
+    def test_fields_and_expand(self):
+        # add two users with a post each and a comment
+        r = Role.query.filter_by(name='User').first()
+        u1 = User(email='john@example.com', username='john',
+                  password='cat', confirmed=True, role=r)
+        u2 = User(email='susan@example.com', username='susan',
+                  password='dog', confirmed=True, role=r)
+        p1 = Post(body='post 1', author=u1)
+        p2 = Post(body='post 2', author=u2)
+        c = Comment(body='comment', author=u2, post=p1)
+        db.session.add_all([u1, u2, p1, p2, c])
+        db.session.commit()
+        headers = self.get_api_headers('john@example.com', 'cat')
+
+        # only the requested fields are returned
+        response = self.client.get('/api/v1/posts/?fields=url,body',
+                                   headers=headers)
+        self.assertEqual(response.status_code, 200)
+        json_response = json.loads(response.get_data(as_text=True))
+        self.assertEqual(
+            sorted(json_response['posts'], key=lambda p: p['body']),
+            [{'url': '/api/v1/posts/%d' % p1.id, 'body': 'post 1'},
+             {'url': '/api/v1/posts/%d' % p2.id, 'body': 'post 2'}])
+        response = self.client.get('/api/v1/users/%d?fields=username' % u1.id,
+                                   headers=headers)
+        json_response = json.loads(response.get_data(as_text=True))
+        self.assertEqual(json_response, {'username': 'john'})
+
+        # counts are computed for the whole page
+        response = self.client.get('/api/v1/posts/?fields=comment_count',
+                                   headers=headers)
+        json_response = json.loads(response.get_data(as_text=True))
+        self.assertEqual(
+            sorted(p['comment_count'] for p in json_response['posts']),
+            [0, 1])
+
+        # authors are embedded
+        response = self.client.get(
+            '/api/v1/posts/%d/comments/?expand=author' % p1.id,
+            headers=headers)
+        self.assertEqual(response.status_code, 200)
+        json_response = json.loads(response.get_data(as_text=True))
+        author = json_response['comments'][0]['author']
+        self.assertEqual(author['username'], 'susan')
+        self.assertEqual(author['post_count'], 1)
+        response = self.client.get(
+            '/api/v1/posts/%d?expand=author&fields=body,author.username' %
+            p2.id, headers=headers)
+        json_response = json.loads(response.get_data(as_text=True))
+        self.assertEqual(json_response, {'body': 'post 2',
+                                         'author': {'username': 'susan'}})
+
+        # unknown fields and expansions are rejected
+        for query in ['/api/v1/posts/?fields=secret',
+                      '/api/v1/posts/?fields=author.username',
+                      '/api/v1/users/%d?expand=author' % u1.id,
+                      '/api/v1/comments/?expand=post']:
+            response = self.client.get(query, headers=headers)
+            self.assertEqual(response.status_code, 400)
+
+        # writes with unknown fields are rejected before writing
+        response = self.client.post('/api/v1/posts/?fields=secret',
+                                    headers=headers,
+                                    data=json.dumps({'body': 'post 3'}))
+        self.assertEqual(response.status_code, 400)
+        response = self.client.put('/api/v1/posts/%d?fields=secret' % p1.id,
+                                   headers=headers,
+                                   data=json.dumps({'body': 'edited'}))
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(
+            '/api/v1/posts/%d/comments/?fields=secret' % p1.id,
+            headers=headers, data=json.dumps({'body': 'comment 2'}))
+        self.assertEqual(response.status_code, 400)
+        db.session.remove()
+        self.assertEqual(Post.query.count(), 2)
+        self.assertEqual(Post.query.get(p1.id).body, 'post 1')
+        self.assertEqual(Comment.query.count(), 1)
+
+    def test_batch(self):
+        # add two users with posts and comments
+        r = Role.query.filter_by(name='User').first()
+        u1 = User(email='john@example.com', username='john',
+                  password='cat', confirmed=True, role=r)
+        u2 = User(email='susan@example.com', username='susan',
+                  password='dog', confirmed=True, role=r)
+        posts = [Post(body='post %d' % i, author=u1) for i in range(3)]
+        c = Comment(body='comment', author=u2, post=posts[0])
+        db.session.add_all([u1, u2, c] + posts)
+        db.session.commit()
+        headers = self.get_api_headers('john@example.com', 'cat')
+
+        # results follow the order of the request
+        response = self.client.get(
+            '/api/v1/users/?ids=%d,%d,%d' % (u2.id, u1.id, u2.id),
+            headers=headers)
+        self.assertEqual(response.status_code, 200)
+        json_response = json.loads(response.get_data(as_text=True))
+        self.assertEqual([u['username'] for u in json_response['users']],
+                         ['susan', 'john', 'susan'])
+        self.assertEqual(json_response['users'][1]['post_count'], 3)
+
+        # missing resources are returned as null
+        response = self.client.get(
+            '/api/v1/posts/?ids=%d,12345,%d&fields=body' %
+            (posts[2].id, posts[0].id), headers=headers)
+        json_response = json.loads(response.get_data(as_text=True))
+        self.assertEqual(json_response['posts'],
+                         [{'body': 'post 2'}, None, {'body': 'post 0'}])
+        response = self.client.get(
+            '/api/v1/comments/?ids=%d&expand=author' % c.id, headers=headers)
+        json_response = json.loads(response.get_data(as_text=True))
+        self.assertEqual(json_response['comments'][0]['author']['username'],
+                         'susan')
+
+        # invalid and oversized batches are rejected
+        self.app.config['FLASKY_API_MAX_BATCH'] = 2
+        for query in ['/api/v1/users/', '/api/v1/users/?ids=',
+                      '/api/v1/users/?ids=1,x', '/api/v1/posts/?ids=1,2,3',
+                      '/api/v1/posts/?ids=99999999999999999999999']:
+            response = self.client.get(query, headers=headers)
+            self.assertEqual(response.status_code, 400)
+
+    def test_comment_batch(self):
+        # add a user and two posts
+        r = Role.query.filter_by(name='User').first()
+        u = User(email='john@example.com', username='john',
+                 password='cat', confirmed=True, role=r)
+        p1 = Post(body='first', author=u)
+        p2 = Post(body='second', author=u)
+        db.session.add_all([u, p1, p2])
+        db.session.commit()
+        headers = self.get_api_headers('john@example.com', 'cat')
+
+        # valid comments are added, invalid ones are reported per item
+        items = [{'post_id': p1.id, 'body': 'good [post](http://a.com)'},
+                 {'post_id': p2.id},
+                 {'post_id': 12345, 'body': 'lost'},
+                 {'post_id': p2.id, 'body': '*nice*'},
+                 'comment',
+                 {'post_id': 99999999999999999999999, 'body': 'far'}]
+        self.app.config['FLASKY_RENDER_PARALLEL_MIN'] = 2
+        self.app.config['FLASKY_RENDER_WORKERS'] = 2
+        response = self.client.post('/api/v1/comments/batch',
+                                    headers=headers, data=json.dumps(items))
+        self.assertEqual(response.status_code, 200)
+        json_response = json.loads(response.get_data(as_text=True))
+        self.assertEqual(json_response['count'], 2)
+        self.assertEqual([item['status'] for item in json_response['results']],
+                         [201, 400, 404, 201, 400, 400])
+        # the render pool is created once per process
+        pool = render_pool()
+        self.assertIsNotNone(pool)
+        self.assertIs(render_pool(3), pool)
+        shutdown_render_pool()
+        comment = Comment.query.filter_by(post_id=p2.id).one()
+        self.assertEqual(json_response['results'][3]['url'],
+                         '/api/v1/comments/%d' % comment.id)
+        self.assertEqual(comment.body_html, '<em>nice</em>')
+        self.assertEqual(comment.author_id, u.id)
+        self.assertEqual(p1.comments.one().body_html,
+                         Comment(body=items[0]['body']).body_html)
+
+        # the batch itself must be a non-empty list of bounded size
+        self.app.config['FLASKY_API_MAX_COMMENT_BATCH'] = 1
+        for data in [[], {'comments': 'x'}, items[:2]]:
+            response = self.client.post('/api/v1/comments/batch',
+                                        headers=headers,
+                                        data=json.dumps(data))
+            self.assertEqual(response.status_code, 400)
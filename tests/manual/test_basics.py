@@ -1,6 +1,27 @@
+import io
+import os
+import shutil
+import tempfile
 import unittest
-from flask import current_app
+from unittest import mock
+from flask import current_app, _app_ctx_stack, _request_ctx_stack
 from app import create_app, db
+from app import testing
+from app.models import Role, User
+from app.testing import create_database, drop_database, run_parallel, \
+    suite_modules, ContextTestResult
+
+SAMPLE_TESTS = """
+import unittest
+
+
+class SampleTestCase(unittest.TestCase):
+    def test_pass(self):
+        pass
+
+    def test_fail(self):
+        self.fail()
+"""
 
 
 class BasicsTestCase(unittest.TestCase):
@@ -8,11 +29,11 @@ class BasicsTestCase(unittest.TestCase):
         self.app = create_app('testing')
         self.app_context = self.app.app_context()
         self.app_context.push()
-        db.create_all()
+        create_database()
 
     def tearDown(self):
         db.session.remove()
-        db.drop_all()
+        drop_database()
         self.app_context.pop()
 
     def test_app_exists(self):
@@ -20,3 +41,77 @@ class BasicsTestCase(unittest.TestCase):
 
     def test_app_is_testing(self):
         self.assertTrue(current_app.config['TESTING'])
+
+    def test_app_without_web(self):
+        app = create_app('testing', web=False)
+        self.assertEqual(app.blueprints, {})
+        self.assertIn('sqlalchemy', app.extensions)
+        self.assertIn('main', self.app.blueprints)
+
+    def test_cloned_database(self):
+        self.assertEqual(Role.query.count(), 3)
+        db.session.add(User(email='john@example.com', password='cat'))
+        db.session.commit()
+        db.session.remove()
+
+        # the next database is a fresh clone of the template
+        app = create_app('testing')
+        with app.app_context():
+            create_database()
+            self.assertEqual(Role.query.count(), 3)
+            self.assertEqual(User.query.count(), 0)
+            db.session.remove()
+            drop_database()
+        self.assertEqual(User.query.count(), 1)
+
+    def test_template_with_leaked_session(self):
+        # the session of this test is still open when the template is built
+        self.assertEqual(Role.query.count(), 3)
+        app = create_app('testing')
+        with mock.patch.dict(testing._templates, clear=True), \
+                app.app_context():
+            create_database()
+            self.assertEqual(db.get_engine(app).execute(
+                'SELECT COUNT(*) FROM roles').scalar(), 3)
+            db.session.remove()
+            drop_database()
+
+
+class ParallelTestCase(unittest.TestCase):
+    def setUp(self):
+        self.top_level_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.top_level_dir)
+        for name in ('sample_one', 'sample_two'):
+            with open(os.path.join(self.top_level_dir, name + '.py'),
+                      'w') as f:
+                f.write(SAMPLE_TESTS)
+
+    def test_run_parallel(self):
+        suite = unittest.TestLoader().discover(self.top_level_dir,
+                                               pattern='sample_*.py')
+        names = suite_modules(suite)
+        self.assertEqual(names, ['sample_one', 'sample_two'])
+        stream = io.StringIO()
+        results = run_parallel(names, 2, self.top_level_dir, stream=stream)
+        self.assertEqual(sorted(result.name for result in results), names)
+        for result in results:
+            self.assertEqual((result.tests, result.failures, result.errors),
+                             (2, 1, 0))
+            self.assertFalse(result.successful)
+        self.assertEqual(stream.getvalue().count('FAIL: test_fail'), 2)
+
+    def test_leaked_contexts_are_popped(self):
+        app = create_app('testing')
+
+        class LeakingTestCase(unittest.TestCase):
+            def test_leak(self):
+                app.app_context().push()
+                app.test_request_context().push()
+
+        app_context = _app_ctx_stack.top
+        runner = unittest.TextTestRunner(stream=io.StringIO(),
+                                         resultclass=ContextTestResult)
+        result = runner.run(LeakingTestCase('test_leak'))
+        self.assertTrue(result.wasSuccessful())
+        self.assertIs(_app_ctx_stack.top, app_context)
+        self.assertIsNone(_request_ctx_stack.top)
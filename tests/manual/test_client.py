@@ -1,20 +1,21 @@
 import re
 import unittest
+from urllib.parse import urlparse
 from app import create_app, db
-from app.models import User, Role
+from app.testing import create_database, drop_database
+from app.models import User, Role, Post, Comment, Follow
 
 class FlaskClientTestCase(unittest.TestCase):
     def setUp(self):
         self.app = create_app('testing')
         self.app_context = self.app.app_context()
         self.app_context.push()
-        db.create_all()
-        Role.insert_roles()
+        create_database()
         self.client = self.app.test_client(use_cookies=True)
 
     def tearDown(self):
         db.session.remove()
-        db.drop_all()
+        drop_database()
         self.app_context.pop()
 
     def test_home_page(self):
@@ -60,3 +61,163 @@ class FlaskClientTestCase(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTrue('You have been logged out' in response.get_data(
             as_text=True))
+
+    def test_bulk_moderation(self):
+        m = Role.query.filter_by(name='Moderator').first()
+        mod = User(email='susan@example.com', username='susan',
+                   password='dog', confirmed=True, role=m)
+        u = User(email='john@example.com', username='john',
+                 password='cat', confirmed=True)
+        db.session.add_all([mod, u])
+        db.session.commit()
+        post = Post(body='a post', author=mod)
+        comments = [Comment(body='spam', author=u, post=post)
+                    for i in range(3)]
+        db.session.add_all([post] + comments)
+        db.session.commit()
+        self.client.post('/auth/login', data={
+            'email': 'susan@example.com',
+            'password': 'dog'
+        })
+
+        response = self.client.get('/moderate')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue('name="ids" value="%d"' % comments[0].id in
+                        response.get_data(as_text=True))
+
+        # disable everything from an author
+        response = self.client.post('/moderate/bulk', data={
+            'author': 'john',
+            'disable': 'Disable'
+        }, follow_redirects=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue('3 comments have been disabled' in
+                        response.get_data(as_text=True))
+        self.assertEqual(Comment.query.filter_by(disabled=True).count(), 3)
+
+        # enable the selected comments
+        response = self.client.post('/moderate/bulk', data={
+            'ids': [comments[0].id, comments[2].id],
+            'enable': 'Enable'
+        }, follow_redirects=True)
+        self.assertTrue('2 comments have been enabled' in
+                        response.get_data(as_text=True))
+        self.assertEqual(Comment.query.filter_by(disabled=True).count(), 1)
+
+        # only redirect to the pages of the site
+        for next in ['/user/john', '//evil.example/', '/\\evil.example/',
+                     'http://evil.example/']:
+            response = self.client.post('/moderate/bulk?next=' + next,
+                                        data={'ids': [comments[1].id],
+                                              'enable': 'Enable'})
+            self.assertEqual(response.status_code, 302)
+            location = urlparse(response.headers['Location'])
+            self.assertEqual(location.netloc, 'localhost')
+            self.assertEqual(location.path, next if next == '/user/john'
+                             else '/moderate')
+
+    def test_unfollow_with_stale_graph(self):
+        john = User(email='john@example.com', username='john',
+                    password='cat', confirmed=True)
+        susan = User(email='susan@example.com', username='susan',
+                     password='dog', confirmed=True)
+        db.session.add_all([john, susan])
+        db.session.commit()
+        graph = self.app.extensions['follow_graph']
+        self.assertFalse(graph.is_following(john.id, susan.id))
+        # a follow committed by another process, the graph does not know it
+        db.session.execute(Follow.__table__.insert().values(
+            follower_id=john.id, followed_id=susan.id))
+        db.session.commit()
+        self.client.post('/auth/login', data={
+            'email': 'john@example.com',
+            'password': 'cat'
+        })
+        response = self.client.get('/unfollow/susan', follow_redirects=True)
+        self.assertTrue('You are not following susan anymore' in
+                        response.get_data(as_text=True))
+        response = self.client.get('/follow/susan', follow_redirects=True)
+        self.assertTrue('You are now following susan' in
+                        response.get_data(as_text=True))
+
+    def test_moderation_queue(self):
+        m = Role.query.filter_by(name='Moderator').first()
+        mod = User(email='susan@example.com', username='susan',
+                   password='dog', confirmed=True, role=m)
+        u = User(email='john@example.com', username='john',
+                 password='cat', confirmed=True)
+        db.session.add_all([mod, u])
+        db.session.commit()
+        post = Post(body='a post', author=mod)
+        comments = [Comment(body='comment %d' % i, author=u, post=post)
+                    for i in range(5)]
+        db.session.add_all([post] + comments)
+        db.session.commit()
+        self.client.post('/auth/login', data={
+            'email': 'john@example.com',
+            'password': 'cat'
+        })
+        self.client.get('/flag/{}'.format(comments[1].id))
+        self.client.get('/auth/logout')
+        self.client.post('/auth/login', data={
+            'email': 'susan@example.com',
+            'password': 'dog'
+        })
+        self.client.get('/moderate/disable/{}'.format(comments[2].id))
+
+        # flagged queue
+        response = self.client.get('/moderate/queue/flagged')
+        self.assertEqual(response.status_code, 200)
+        data = response.get_data(as_text=True)
+        self.assertTrue('comment 1' in data)
+        self.assertFalse('comment 0' in data)
+
+        # pending queue, paged by two
+        self.app.config['FLASKY_COMMENTS_PER_PAGE'] = 2
+        response = self.client.get('/moderate/queue/pending?author=john')
+        data = response.get_data(as_text=True)
+        self.assertTrue('comment 4' in data and 'comment 3' in data)
+        next = re.search(r'after=([0-9-]+)', data).group(1)
+        response = self.client.get(
+            '/moderate/queue/pending?author=john&after=' + next)
+        data = response.get_data(as_text=True)
+        self.assertTrue('comment 0' in data)
+        self.assertFalse('comment 3' in data)
+        self.assertFalse('after=' in data)
+
+    def test_latest_comments(self):
+        u = User(email='john@example.com', username='john',
+                 password='cat', confirmed=True)
+        post = Post(body='a post', author=u)
+        db.session.add_all([u, post])
+        db.session.commit()
+        comments = [Comment(body='comment %d' % i, author=u, post=post)
+                    for i in range(5)]
+        db.session.add_all(comments)
+        db.session.commit()
+        self.app.config['FLASKY_COMMENTS_PER_PAGE'] = 2
+        self.client.post('/auth/login', data={
+            'email': 'john@example.com',
+            'password': 'cat'
+        })
+
+        # posting a comment redirects to its anchor in the latest page
+        response = self.client.post('/post/{}'.format(post.id), data={
+            'body': 'newest comment'})
+        self.assertEqual(response.status_code, 302)
+        comment = Comment.query.filter_by(body='newest comment').first()
+        self.assertTrue(response.headers['Location'].endswith(
+            '#comment-{}'.format(comment.id)))
+        response = self.client.get(response.headers['Location'])
+        data = response.get_data(as_text=True)
+        self.assertTrue('id="comment-{}"'.format(comment.id) in data)
+        self.assertTrue(data.index('comment 4') < data.index('newest'))
+        self.assertFalse('comment 3' in data)
+
+        # earlier comments are read backwards from a cursor
+        before = re.search(r'before=([0-9-]+)', data).group(1)
+        response = self.client.get('/post/{}?page=-1&before={}'.format(
+            post.id, before))
+        data = response.get_data(as_text=True)
+        self.assertTrue(data.index('comment 2') < data.index('comment 3'))
+        self.assertFalse('comment 4' in data)
@@ -0,0 +1,101 @@
+import gzip
+import json
+import unittest
+import zlib
+from flask import Response, jsonify
+from app import create_app, db, compress
+from app.testing import create_database, drop_database
+
+
+class CompressTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.add_url_rule('/test/json', 'json', lambda: jsonify(
+            {'items': ['item %d' % i for i in range(200)]}))
+        self.app.add_url_rule('/test/small', 'small', lambda: jsonify({}))
+        self.app.add_url_rule('/test/stream', 'stream', lambda: Response(
+            ('line %d\n' % i for i in range(100)), mimetype='text/plain'))
+        self.app.add_url_rule('/test/image', 'image', lambda: Response(
+            b'\0' * 2000, mimetype='image/png'))
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        create_database()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        drop_database()
+        self.app_context.pop()
+
+    def test_gzip(self):
+        response = self.client.get('/test/json',
+                                   headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        data = json.loads(gzip.decompress(response.get_data()).decode('utf-8'))
+        self.assertEqual(len(data['items']), 200)
+        self.assertEqual(int(response.headers['Content-Length']),
+                         len(response.get_data()))
+
+    def test_html(self):
+        response = self.client.get('/', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn(b'Stranger', gzip.decompress(response.get_data()))
+
+    def test_not_accepted(self):
+        for accept in [None, 'identity', 'gzip;q=0', 'deflate']:
+            headers = {'Accept-Encoding': accept} if accept else {}
+            response = self.client.get('/test/json', headers=headers)
+            self.assertNotIn('Content-Encoding', response.headers)
+            self.assertIn('Accept-Encoding', response.headers['Vary'])
+
+    def test_negotiation(self):
+        self.assertEqual(compress.negotiate(
+            self.app.test_request_context(headers={
+                'Accept-Encoding': '*;q=0.5, gzip;q=0.1'}).request
+            .accept_encodings), list(compress.encoders)[0])
+        self.assertEqual(compress.negotiate(
+            self.app.test_request_context(headers={
+                'Accept-Encoding': 'br;q=0, zstd;q=0, gzip'}).request
+            .accept_encodings), 'gzip')
+
+    def test_skipped_responses(self):
+        headers = {'Accept-Encoding': 'gzip'}
+        response = self.client.get('/test/small', headers=headers)
+        self.assertNotIn('Content-Encoding', response.headers)
+        response = self.client.get('/test/image', headers=headers)
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.app.config['FLASKY_COMPRESS'] = False
+        response = self.client.get('/test/json', headers=headers)
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_stream(self):
+        response = self.client.get('/test/stream',
+                                   headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertNotIn('Content-Length', response.headers)
+        chunks = list(response.response)
+        self.assertGreater(len(chunks), 1)
+        # every chunk is flushed, so the client can decode it on arrival
+        decompressor = zlib.decompressobj(31)
+        self.assertEqual(decompressor.decompress(chunks[0]),
+                         b'line 0\n')
+        body = gzip.decompress(b''.join(chunks)).decode('utf-8')
+        self.assertEqual(body, ''.join('line %d\n' % i for i in range(100)))
+
+    def test_static_cache(self):
+        headers = {'Accept-Encoding': 'gzip'}
+        response = self.client.get('/static/styles.css', headers=headers)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        etag, weak = response.get_etag()
+        self.assertTrue(weak)
+        body = response.get_data()
+        response.close()
+        cached = [key for key in compress._cache if key[1] == etag]
+        self.assertEqual(len(cached), 1)
+        response = self.client.get('/static/styles.css', headers=headers)
+        self.assertEqual(response.get_data(), body)
+        response.close()
+        response = self.client.get('/static/styles.css', headers=dict(
+            headers, **{'If-None-Match': 'W/"%s"' % etag}))
+        self.assertEqual(response.status_code, 304)
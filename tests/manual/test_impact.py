@@ -0,0 +1,124 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from app.impact import LineRecorder, ImpactMap, function_spans, \
+    affected_tests, select_tests
+
+SOURCE = '''import os
+
+
+@decorator
+def first(a):
+    return a
+
+
+class Model(object):
+    def method(self):
+        def inner():
+            pass
+        return inner
+
+    # the comment of second
+    def second(self):
+        try:
+            pass
+        except ValueError:
+            def handler():
+                pass
+'''
+
+
+def sample(a):
+    if a:
+        return 1
+    return 2
+
+
+class ImpactTestCase(unittest.TestCase):
+    def test_function_spans(self):
+        self.assertEqual(
+            [(span.name, span.start, span.end)
+             for span in function_spans(SOURCE)],
+            [('first', 4, 8), ('Model.method', 10, 15),
+             ('Model.method.inner', 11, 12), ('Model.second', 16, 21),
+             ('Model.second.handler', 20, 21)])
+
+    def test_line_recorder(self):
+        root = os.path.dirname(os.path.abspath(__file__))
+        recorder = LineRecorder(root)
+        recorder.start()
+        sample(True)
+        recorder.stop()
+        first_line = sample.__code__.co_firstlineno
+        path = os.path.basename(__file__)
+        self.assertTrue({(path, first_line), (path, first_line + 1),
+                         (path, first_line + 2)} <= recorder.lines)
+        self.assertNotIn((path, first_line + 3), recorder.lines)
+
+        # code compiled from strings has no file, even under the root
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(root)
+        recorder = LineRecorder(root)
+        recorder.start()
+        exec(compile('sample(False)', '<string>', 'exec'))
+        recorder.stop()
+        self.assertEqual(set(path for path, line in recorder.lines), {path})
+
+        recorder = LineRecorder(root, exclude=[__file__])
+        recorder.start()
+        sample(True)
+        recorder.stop()
+        self.assertEqual(recorder.lines, set())
+
+    def test_impact_map(self):
+        impact = ImpactMap('abc', dirty=False)
+        impact.add('test_a', [('app/models.py', 10), ('app/models.py', 12)])
+        impact.add('test_b', [('app/models.py', 12), ('app/views.py', 3)])
+        impact.add('test_c', [])
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        impact.save(os.path.join(tmpdir, 'impact.json'))
+        impact = ImpactMap.load(os.path.join(tmpdir, 'impact.json'))
+        self.assertEqual(impact.commit, 'abc')
+        self.assertEqual(impact.tests_covering('app/models.py', 10, 11),
+                         {'test_a'})
+        self.assertEqual(impact.tests_covering('app/models.py'),
+                         {'test_a', 'test_b'})
+        self.assertEqual(impact.tests_covering('app/views.py', 1, 2), set())
+        self.assertEqual(impact.tests_covering('app/other.py'), set())
+
+    def test_affected_tests(self):
+        impact = ImpactMap('abc', dirty=False)
+        impact.add('test_a', [('app/models.py', 6)])
+        impact.add('test_b', [('app/views.py', 3)])
+        impact.add_imported([('app/models.py', 1), ('app/models.py', 4),
+                             ('app/models.py', 5)])
+        source = 'import os\n\n\nclass A(object):\n    def f(self):\n' \
+            '        return 1\n'
+
+        def affected(changes):
+            def git(*args):
+                return '' if args[0] == 'ls-files' else source
+            with mock.patch('app.impact.git', git), \
+                    mock.patch('app.impact.changed_lines',
+                               return_value=changes):
+                return affected_tests(impact, '/root/tests', '/root')[0]
+
+        self.assertEqual(affected({'app/models.py': {6}}), {'test_a'})
+        # module level code runs when any test imports the module
+        self.assertEqual(affected({'app/models.py': {4}}),
+                         {'test_a', 'test_b'})
+        # a Python file the tracer never saw might run at import time
+        self.assertEqual(affected({'app/exceptions.py': {1}}),
+                         {'test_a', 'test_b'})
+        self.assertEqual(affected({'README.md': {1}}), set())
+
+    def test_select_tests(self):
+        suite = unittest.defaultTestLoader.loadTestsFromTestCase(
+            ImpactTestCase)
+        selected = select_tests(suite, {self.id()}, set())
+        self.assertEqual([test.id() for test in selected], [self.id()])
+        selected = select_tests(suite, set(), {__name__})
+        self.assertEqual(selected.countTestCases(), suite.countTestCases())
@@ -0,0 +1,97 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+from app import create_app, db
+from app.testing import create_database, drop_database
+from app.importer import import_posts, read_records
+from app.models import User, Post
+
+
+class ImporterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        create_database()
+        db.session.add_all([User(username='john', email='john@example.com'),
+                            User(username='susan',
+                                 email='susan@example.com')])
+        db.session.commit()
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        db.session.remove()
+        drop_database()
+        self.app_context.pop()
+
+    def jsonl(self, records):
+        return io.StringIO('\n'.join(
+            record if isinstance(record, str) else json.dumps(record)
+            for record in records) + '\n')
+
+    def test_import_jsonl(self):
+        stream = self.jsonl([
+            {'author': 'john', 'body': '*one*',
+             'timestamp': '2017-01-02T03:04:05+01:00'},
+            {'author': 'nobody', 'body': 'two'},
+            'not json',
+            '',
+            {'author': 'susan', 'body': ''},
+            {'author': 'susan', 'body': 'three', 'timestamp': 'soon'},
+            {'author': 'susan', 'body': 'four'}])
+        state = import_posts(stream, 'jsonl', batch_size=2, workers=1)
+        self.assertEqual(state['records'], 6)
+        self.assertEqual(state['imported'], 2)
+        self.assertEqual(state['skipped'], {
+            'unknown author': 1, 'invalid record': 1, 'missing body': 1,
+            'invalid timestamp': 1})
+        post = Post.query.filter_by(body='*one*').one()
+        self.assertEqual(post.body_html, '<p><em>one</em></p>')
+        self.assertEqual(post.timestamp, datetime(2017, 1, 2, 2, 4, 5))
+        self.assertEqual(post.author.username, 'john')
+        self.assertEqual(Post.query.filter_by(body='four').one().author_id,
+                         User.query.filter_by(username='susan').one().id)
+
+    def test_import_csv_in_parallel(self):
+        stream = io.StringIO('author,body,timestamp\n' + ''.join(
+            '%s,"post, %d",\n' % (['john', 'susan'][i % 2], i)
+            for i in range(10)))
+        self.app.config['FLASKY_RENDER_PARALLEL_MIN'] = 2
+        progress = []
+        state = import_posts(stream, 'csv', batch_size=4, workers=2,
+                             progress=lambda *args: progress.append(args))
+        self.assertEqual(state['imported'], 10)
+        self.assertEqual([args[:2] for args in progress],
+                         [(4, 4), (8, 8), (10, 10)])
+        self.assertEqual(Post.query.filter_by(body='post, 7').one().body_html,
+                         '<p>post, 7</p>')
+
+    def test_resume(self):
+        records = [{'author': 'john', 'body': 'post %d' % i}
+                   for i in range(5)]
+        checkpoint = os.path.join(self.tmpdir, 'checkpoint.json')
+        with open(checkpoint, 'w') as f:
+            json.dump({'records': 3, 'imported': 3, 'skipped': {}}, f)
+        state = import_posts(self.jsonl(records), 'jsonl', batch_size=10,
+                             workers=1, checkpoint=checkpoint)
+        self.assertEqual(sorted(post.body for post in Post.query),
+                         ['post 3', 'post 4'])
+        with open(checkpoint) as f:
+            self.assertEqual(json.load(f), state)
+        self.assertEqual(state['records'], 5)
+        self.assertEqual(state['imported'], 5)
+
+        # a finished import has nothing left to do
+        import_posts(self.jsonl(records), 'jsonl', workers=1,
+                     checkpoint=checkpoint)
+        self.assertEqual(Post.query.count(), 2)
+
+    def test_read_records_skip(self):
+        stream = self.jsonl(['{"a": 1}', '', '{"a": 2}', '{"a": 3}'])
+        self.assertEqual(list(read_records(stream, 'jsonl', skip=1)),
+                         [{'a': 2}, {'a': 3}])
@@ -0,0 +1,178 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from app.impact import ImpactMap
+from app.mutation import generate_mutants, apply_mutant, run_pool, \
+    run_mutants, function_scores, find_mutants, KILLED, SURVIVED, \
+    NO_TESTS, TIMEOUT
+
+SOURCE = '''import functools
+
+
+def checked(f):
+    @functools.wraps(f)
+    def wrapper(*args):
+        return f(*args)
+    return wrapper
+
+
+def limit(value, maximum=10):
+    """Limit a value."""
+    if value > maximum and True:
+        return maximum
+    return value
+
+
+class Counter(object):
+    @checked
+    def double(self, value):
+        return value * 2
+
+    @staticmethod
+    def spin(value):
+        while value:
+            pass
+'''
+
+TESTS = '''import unittest
+from mutated_sample import limit, Counter
+
+
+class SampleTestCase(unittest.TestCase):
+    def test_limit(self):
+        self.assertEqual(limit(20), 10)
+
+    def test_double(self):
+        Counter().double(2)
+
+    def test_spin(self):
+        Counter.spin(False)
+'''
+
+LEAKING_TESTS = '''import unittest
+from flask import Flask, _app_ctx_stack
+
+
+class LeakingTestCase(unittest.TestCase):
+    leaked = None
+
+    def test_a_leak(self):
+        LeakingTestCase.leaked = Flask(__name__).app_context()
+        LeakingTestCase.leaked.push()
+
+    def test_b_clean(self):
+        # the tests of a mutant run fastest first, test_a may not have run
+        if LeakingTestCase.leaked is not None:
+            self.assertIsNot(_app_ctx_stack.top, LeakingTestCase.leaked)
+
+    def test_c_broken(self):
+        self.fail()
+'''
+
+
+class MutationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        for name, source in (('mutated_sample', SOURCE),
+                             ('mutated_sample_tests', TESTS),
+                             ('leaking_sample_tests', LEAKING_TESTS)):
+            with open(os.path.join(self.root, name + '.py'), 'w') as f:
+                f.write(source)
+        sys.path.insert(0, self.root)
+        self.addCleanup(sys.path.remove, self.root)
+        self.addCleanup(sys.modules.pop, 'mutated_sample', None)
+        self.addCleanup(sys.modules.pop, 'mutated_sample_tests', None)
+        self.addCleanup(sys.modules.pop, 'leaking_sample_tests', None)
+
+    def mutants(self):
+        return generate_mutants('mutated_sample.py', SOURCE)
+
+    def test_generate_mutants(self):
+        mutants = self.mutants()
+        self.assertEqual(
+            [(mutant.function, mutant.line, mutant.description)
+             for mutant in mutants], [
+                ('checked', 8, 'removed return statement'),
+                ('checked', 7, 'removed return statement'),
+                ('limit', 15, 'removed return statement'),
+                ('limit', 13, 'negated condition'),
+                ('limit', 14, 'removed return statement'),
+                ('limit', 13, 'and -> or'),
+                ('limit', 13, '> -> <='),
+                ('limit', 13, 'True -> False'),
+                ('Counter.double', 21, 'removed return statement'),
+                ('Counter.double', 21, '2 -> 3'),
+                ('Counter.spin', 25, 'negated condition')])
+        self.assertEqual(
+            len(find_mutants(['mutated_sample.py::Counter'], self.root)), 3)
+
+    def test_apply_mutant(self):
+        import mutated_sample
+        flipped = [mutant for mutant in self.mutants()
+                   if mutant.description == '> -> <='][0]
+        self.assertEqual(mutated_sample.limit(20), 10)
+        function, original = apply_mutant(flipped, self.root)
+        try:
+            self.assertIs(function, mutated_sample.limit)
+            self.assertEqual(mutated_sample.limit(20), 20)
+        finally:
+            function.__code__ = original
+
+        # decorated methods are found behind their wrappers
+        doubled = [mutant for mutant in self.mutants()
+                   if mutant.description == '2 -> 3'][0]
+        function, original = apply_mutant(doubled, self.root)
+        function.__code__ = original
+        self.assertEqual(mutated_sample.Counter().double(2), 4)
+
+    def test_run_pool(self):
+        results = dict(run_pool([(abs, (-3,), None),
+                                 (time.sleep, (10,), 0.5)], 2))
+        self.assertEqual(results[0], 3)
+        self.assertIsInstance(results[1], TimeoutError)
+
+    def test_run_mutants(self):
+        mutants = self.mutants()
+        impact = ImpactMap()
+        tests = 'mutated_sample_tests.SampleTestCase.'
+        impact.add(tests + 'test_limit', [('mutated_sample.py', line)
+                                          for line in (7, 13, 14, 15)])
+        impact.add(tests + 'test_double', [('mutated_sample.py', 21)])
+        impact.add(tests + 'test_spin', [('mutated_sample.py', 25)])
+        results = run_mutants(mutants, impact, self.root, 2, 1.0)
+        statuses = dict(((result.mutant.line, result.mutant.description),
+                         result.status) for result in results)
+        self.assertEqual(statuses[(13, '> -> <=')], KILLED)
+        self.assertEqual(statuses[(14, 'removed return statement')], KILLED)
+        # limit(20) returns before the last line
+        self.assertEqual(statuses[(15, 'removed return statement')],
+                         SURVIVED)
+        self.assertEqual(statuses[(21, '2 -> 3')], SURVIVED)
+        self.assertEqual(statuses[(25, 'negated condition')], TIMEOUT)
+        self.assertEqual(statuses[(8, 'removed return statement')], NO_TESTS)
+        scores = function_scores(results)
+        self.assertEqual(scores['mutated_sample.py::Counter.spin'], (1, 1))
+        self.assertEqual(scores['mutated_sample.py::Counter.double'], (0, 2))
+
+    def test_baseline_failures(self):
+        mutants = [mutant for mutant in self.mutants()
+                   if mutant.line in (21, 25)]
+        impact = ImpactMap()
+        tests = 'leaking_sample_tests.LeakingTestCase.'
+        impact.add(tests + 'test_a_leak', [('mutated_sample.py', 21)])
+        impact.add(tests + 'test_b_clean', [('mutated_sample.py', 21)])
+        impact.add(tests + 'test_c_broken', [('mutated_sample.py', 25)])
+        failures = []
+        results = run_mutants(mutants, impact, self.root, 2, 1.0,
+                              baseline_failures=failures.extend)
+        # the context leaked by a test does not fail the next one
+        self.assertEqual(failures, [tests + 'test_c_broken'])
+        details = dict((result.mutant.line, (result.status, result.detail))
+                       for result in results)
+        self.assertEqual(details[21][0], SURVIVED)
+        self.assertEqual(details[25],
+                         (NO_TESTS, '1 failing without mutation'))
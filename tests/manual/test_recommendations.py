@@ -0,0 +1,87 @@
+import json
+import unittest
+from base64 import b64encode
+from app import create_app, db
+from app.testing import create_database, drop_database
+from app.models import User
+
+try:
+    import scipy
+except ImportError:  # pragma: no cover
+    scipy = None
+
+
+@unittest.skipIf(scipy is None, 'SciPy is not installed')
+class RecommendationsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        create_database()
+
+    def tearDown(self):
+        db.session.remove()
+        drop_database()
+        self.app_context.pop()
+
+    def add_users(self, *names):
+        users = [User(username=name, email=name + '@example.com')
+                 for name in names]
+        db.session.add_all(users)
+        db.session.commit()
+        return users
+
+    def test_friends_of_friends(self):
+        from app.recommendations import refresh_suggestions
+        john, susan, david, alice, bob = self.add_users(
+            'john', 'susan', 'david', 'alice', 'bob')
+        john.follow(susan)
+        john.follow(david)
+        susan.follow(alice)
+        david.follow(alice)
+        david.follow(bob)
+        db.session.commit()
+
+        self.assertEqual(refresh_suggestions(top_k=10, full=True), 5)
+        self.assertEqual(
+            [(u.username, score) for u, score in john.suggested_users()],
+            [('alice', 2.0), ('bob', 1.0)])
+        self.assertEqual(
+            [u.username for u, score in john.suggested_users(1)], ['alice'])
+        self.assertEqual(susan.suggested_users(), [])
+
+        # already followed users are not suggested
+        john.follow(bob)
+        db.session.commit()
+        self.assertEqual(
+            [u.username for u, score in john.suggested_users()], ['alice'])
+
+        # only the users affected by new follows are refreshed, here eve
+        # and john, who is followed by eve and followed bob
+        eve, = self.add_users('eve')
+        eve.follow(john)
+        db.session.commit()
+        self.assertEqual(refresh_suggestions(top_k=10), 2)
+        self.assertEqual(
+            sorted(u.username for u, score in eve.suggested_users()),
+            ['bob', 'david', 'susan'])
+
+    def test_api(self):
+        from app.recommendations import refresh_suggestions
+        john, susan, david = self.add_users('john', 'susan', 'david')
+        john.follow(susan)
+        susan.follow(david)
+        db.session.commit()
+        refresh_suggestions(top_k=10)
+        john.password = 'cat'
+        john.confirmed = True
+        db.session.commit()
+        response = self.app.test_client().get(
+            '/api/v1/users/{}/suggestions/'.format(john.id),
+            headers={'Authorization': 'Basic ' + b64encode(
+                b'john@example.com:cat').decode('utf-8')})
+        self.assertEqual(response.status_code, 200)
+        json_response = json.loads(response.get_data(as_text=True))
+        self.assertEqual(json_response['count'], 1)
+        self.assertEqual(json_response['suggestions'][0]['username'],
+                         'david')
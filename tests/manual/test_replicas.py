@@ -0,0 +1,98 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+from flask import session
+from app import create_app, db
+from app.models import User, Role
+
+
+class ReplicaRoutingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        fd, self.replica_path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(fd)
+        self.app.config['SQLALCHEMY_BINDS'] = {
+            'replica0': 'sqlite:///' + self.replica_path}
+        self.app.config['FLASKY_DB_REPLICAS'] = ['replica0']
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.replica = db.get_engine(self.app, bind='replica0')
+        db.metadata.create_all(bind=self.replica)
+        db.replica_monitor.reset()
+
+        # john only exists in the primary, susan only in the replica
+        db.session.add(User(username='john', email='john@example.com'))
+        db.session.commit()
+        self.replica.execute(User.__table__.insert(),
+                             username='susan', email='susan@example.com')
+        db.session.remove()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.replica.dispose()
+        db.replica_monitor.reset()
+        self.app_context.pop()
+        os.remove(self.replica_path)
+
+    def read_from(self):
+        if User.query.filter_by(username='susan').first() is not None:
+            return 'replica'
+        if User.query.filter_by(username='john').first() is not None:
+            return 'primary'
+
+    def test_get_reads_from_replica(self):
+        with self.app.test_request_context('/', method='GET'):
+            self.assertEqual(self.read_from(), 'replica')
+
+    def test_post_reads_from_primary(self):
+        with self.app.test_request_context('/', method='POST'):
+            self.assertEqual(self.read_from(), 'primary')
+
+    def test_pending_writes_read_from_primary(self):
+        with self.app.test_request_context('/', method='GET'):
+            db.session.add(User(username='david', email='david@example.com'))
+            self.assertEqual(self.read_from(), 'primary')
+
+    def test_last_seen_update_does_not_pin_primary(self):
+        with self.app.test_request_context('/', method='GET'):
+            u = User.query.get(1)
+            u.ping()
+            self.assertEqual(self.read_from(), 'replica')
+
+    def test_read_your_writes(self):
+        with self.app.test_request_context('/', method='GET'):
+            session['db_last_write'] = time.time()
+            self.assertEqual(self.read_from(), 'primary')
+        db.session.remove()
+        with self.app.test_request_context('/', method='GET'):
+            session['db_last_write'] = time.time() - \
+                self.app.config['FLASKY_DB_STICKY_SECONDS'] - 1
+            self.assertEqual(self.read_from(), 'replica')
+
+    def test_lagging_replica_falls_back_to_primary(self):
+        with mock.patch.object(db.replica_monitor, 'probe',
+                               return_value=60.0):
+            with self.app.test_request_context('/', method='GET'):
+                self.assertEqual(self.read_from(), 'primary')
+
+    def test_dispose_engines(self):
+        engines = [db.get_engine(self.app), self.replica]
+        connections = [engine.connect() for engine in engines]
+        pools = [engine.pool for engine in engines]
+
+        # a forked process forgets the pools without closing the connections
+        db.dispose_engines(self.app, close=False)
+        for engine, pool, conn in zip(engines, pools, connections):
+            self.assertIsNot(engine.pool, pool)
+            self.assertEqual(conn.execute('SELECT 1').scalar(), 1)
+            conn.close()
+
+        pools = [engine.pool for engine in engines]
+        db.dispose_engines(self.app)
+        for engine, pool in zip(engines, pools):
+            self.assertIsNot(engine.pool, pool)
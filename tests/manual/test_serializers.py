@@ -0,0 +1,75 @@
+import json
+import unittest
+from datetime import datetime
+from flask import url_for
+from flask.json import dumps as flask_dumps
+from app import create_app, db
+from app.testing import create_database, drop_database
+from app.models import User, Post, Comment
+from app.serializers import jsonify, get_serializer, url_template, \
+    resource_url, orjson
+
+
+class SerializersTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        create_database()
+
+    def tearDown(self):
+        db.session.remove()
+        drop_database()
+        self.app_context.pop()
+
+    def test_url_templates(self):
+        with self.app.test_request_context(
+                base_url='http://localhost/flasky'):
+            for endpoint in ['api.get_user', 'api.get_user_posts',
+                             'api.get_post', 'api.get_post_comments',
+                             'api.get_comment']:
+                self.assertEqual(resource_url(endpoint, 12),
+                                 url_for(endpoint, id=12))
+            self.assertTrue(resource_url('api.get_post', 3).startswith(
+                '/flasky/api/v1/'))
+            self.assertIsNone(url_template('main.user'))
+            self.assertIsNone(url_template('main.index'))
+            self.assertEqual(resource_url('main.edit', 4), '/flasky/edit/4')
+
+    def test_serializers_match_flask(self):
+        data = {'b': [1, 2.5, None, True], 'a': 'café',
+                'timestamp': datetime(2017, 1, 2, 3, 4, 5)}
+        expected = json.loads(flask_dumps(data))
+        for name in ['json', 'orjson']:
+            if name == 'orjson' and orjson is None:
+                continue
+            serializer = get_serializer(name)
+            for pretty in [False, True]:
+                self.assertEqual(
+                    json.loads(serializer.dumps(data, pretty).decode('utf-8')),
+                    expected)
+            self.assertEqual(serializer.dumps(data, sort_keys=True).decode(
+                'utf-8').index('"a"'), 1)
+
+    def test_unknown_serializer(self):
+        with self.assertRaises(ValueError):
+            get_serializer('marshal')
+
+    def test_jsonify(self):
+        self.app.config['JSONIFY_PRETTYPRINT_REGULAR'] = False
+        with self.app.test_request_context():
+            response = jsonify({'posts': [1, 2]})
+        self.assertEqual(response.mimetype, 'application/json')
+        self.assertEqual(response.get_data(), b'{"posts":[1,2]}\n')
+
+    def test_to_json(self):
+        user = User(username='john', email='john@example.com')
+        post = Post(body='body', author=user)
+        comment = Comment(body='comment', post=post, author=user)
+        db.session.add_all([user, post, comment])
+        db.session.commit()
+        with self.app.test_request_context():
+            fast = [user.to_json(), post.to_json(), comment.to_json()]
+            self.app.config['FLASKY_URL_TEMPLATES'] = False
+            slow = [user.to_json(), post.to_json(), comment.to_json()]
+        self.assertEqual(fast, slow)
@@ -0,0 +1,23 @@
+import io
+import sys
+import unittest
+import startup
+
+
+class StartupTestCase(unittest.TestCase):
+    def test_import_timer(self):
+        sys.modules.pop('colorsys', None)
+        timer = startup.start(report=False)
+        try:
+            import colorsys
+        finally:
+            timer.stop()
+        self.assertNotIn(timer, sys.meta_path)
+        self.assertIn('colorsys', timer.times)
+        self_time, cumulative = timer.times['colorsys']
+        self.assertGreaterEqual(cumulative, self_time)
+        self.assertIs(type(colorsys.__loader__),
+                      type(sys.modules['os'].__loader__))
+        output = io.StringIO()
+        timer.report(file=output)
+        self.assertIn('colorsys', output.getvalue())
@@ -0,0 +1,106 @@
+import json
+import random
+import unittest
+from base64 import b64encode
+from datetime import datetime, timedelta
+from app import create_app, db
+from app.testing import create_database, drop_database
+from app.models import User, Post
+from app.timeline import merged_timeline, use_merged_timeline, TimelinePage
+
+
+class TimelineTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        create_database()
+        random.seed(1)
+        self.users = [User(username='user%d' % i,
+                           email='user%d@example.com' % i)
+                      for i in range(8)]
+        db.session.add_all(self.users)
+        db.session.commit()
+        start = datetime(2017, 1, 1)
+        for i in range(120):
+            # repeated timestamps exercise the id tie break
+            db.session.add(Post(body='post %d' % i,
+                                author=random.choice(self.users),
+                                timestamp=start + timedelta(
+                                    minutes=random.randint(0, 60))))
+        self.reader = self.users[0]
+        for user in self.users[1:6]:
+            self.reader.follow(user)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        drop_database()
+        self.app_context.pop()
+
+    def joined_timeline(self):
+        return self.reader.followed_posts.order_by(
+            Post.timestamp.desc(), Post.id.desc()).all()
+
+    def test_merge_matches_join(self):
+        expected = self.joined_timeline()
+        posts, has_next = merged_timeline(self.reader, 20)
+        self.assertEqual(posts, expected[:20])
+        self.assertTrue(has_next)
+        posts, has_next = merged_timeline(self.reader, 20, 40)
+        self.assertEqual(posts, expected[40:60])
+        posts, has_next = merged_timeline(self.reader, 1000)
+        self.assertEqual(posts, expected)
+        self.assertFalse(has_next)
+
+    def test_followed_user_without_posts(self):
+        quiet = User(username='quiet', email='quiet@example.com')
+        db.session.add(quiet)
+        self.reader.follow(quiet)
+        db.session.commit()
+        posts, has_next = merged_timeline(self.reader, 20, 20)
+        self.assertEqual(posts, self.joined_timeline()[20:40])
+
+    def test_engine_selection(self):
+        # users follow themselves, plus the five users followed in setUp
+        self.app.config['FLASKY_TIMELINE_MERGE_THRESHOLD'] = 6
+        self.assertTrue(use_merged_timeline(self.reader))
+        self.assertFalse(use_merged_timeline(self.users[1]))
+        self.app.config['FLASKY_TIMELINE_MERGE_THRESHOLD'] = None
+        self.assertFalse(use_merged_timeline(self.reader))
+
+    def test_page(self):
+        page = TimelinePage(self.reader, 2, 10)
+        self.assertEqual(page.items, self.joined_timeline()[10:20])
+        self.assertTrue(page.has_prev)
+        self.assertTrue(page.has_next)
+        self.assertEqual(list(page.iter_pages()), [1, 2, 3])
+
+        # a last page that is full does not link to an empty page
+        reader = User(username='reader', email='reader@example.com')
+        db.session.add(reader)
+        reader.follow(self.users[1])
+        db.session.commit()
+        count = self.users[1].posts.count()
+        page = TimelinePage(reader, 1, count)
+        self.assertEqual(len(page.items), count)
+        self.assertFalse(page.has_next)
+
+    def test_api(self):
+        self.app.config['FLASKY_TIMELINE_MERGE_THRESHOLD'] = 1
+        self.reader.password = 'cat'
+        self.reader.confirmed = True
+        db.session.commit()
+        client = self.app.test_client()
+        response = client.get(
+            '/api/v1/users/%d/timeline/' % self.reader.id,
+            headers={'Authorization': 'Basic ' + b64encode(
+                b'user0@example.com:cat').decode('utf-8')})
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.get_data(as_text=True))
+        self.assertEqual(data['count'], self.reader.followed_posts.count())
+        expected = self.joined_timeline()[
+            :self.app.config['FLASKY_POSTS_PER_PAGE']]
+        self.assertEqual([p['url'] for p in data['posts']],
+                         ['/api/v1/posts/%d' % p.id
+                          for p in expected])
@@ -0,0 +1,141 @@
+import json
+import unittest
+from base64 import b64encode
+from datetime import datetime, timedelta
+from unittest import mock
+from app import create_app, db
+from app.testing import create_database, drop_database
+from app.models import User, Post, Comment, TrendingPost
+from app.trending import activity_score, decayed_value, add_activity, \
+    TrendingPagination
+
+
+class TrendingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        create_database()
+        self.john = User(username='john', email='john@example.com',
+                         password='cat', confirmed=True)
+        self.susan = User(username='susan', email='susan@example.com')
+        db.session.add_all([self.john, self.susan])
+        db.session.commit()
+        self.posts = [Post(body='post %d' % i, author=self.susan)
+                      for i in range(4)]
+        db.session.add_all(self.posts)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        drop_database()
+        self.app_context.pop()
+
+    def comment(self, post, count=1, timestamp=None):
+        for i in range(count):
+            comment = Comment(body='comment', post=post, author=self.john)
+            if timestamp is not None:
+                comment.timestamp = timestamp
+            db.session.add(comment)
+        db.session.commit()
+
+    def ranking(self):
+        return [t.post_id for t in TrendingPost.query.order_by(
+            TrendingPost.score.desc(), TrendingPost.post_id.desc())]
+
+    def test_decay(self):
+        half_life = self.app.config['FLASKY_TRENDING_HALF_LIFE']
+        now = datetime.utcnow()
+        score = activity_score(now - timedelta(seconds=half_life), 2.0,
+                               half_life)
+        self.assertAlmostEqual(decayed_value(score, half_life, now), 1.0)
+
+    def test_comments(self):
+        self.comment(self.posts[0], 1)
+        self.comment(self.posts[1], 3)
+        self.comment(self.posts[2], 2)
+        self.assertEqual(self.ranking(), [self.posts[1].id, self.posts[2].id,
+                                          self.posts[0].id])
+        value = decayed_value(TrendingPost.query.get(self.posts[1].id).score,
+                              self.app.config['FLASKY_TRENDING_HALF_LIFE'])
+        self.assertAlmostEqual(value, 3.0, places=3)
+
+    def test_old_comments_count_less(self):
+        half_life = self.app.config['FLASKY_TRENDING_HALF_LIFE']
+        self.comment(self.posts[0], 3, datetime.utcnow() - timedelta(
+            seconds=2 * half_life))
+        self.comment(self.posts[1], 1)
+        self.assertEqual(self.ranking(), [self.posts[1].id, self.posts[0].id])
+
+    def test_decayed_posts_are_removed(self):
+        half_life = self.app.config['FLASKY_TRENDING_HALF_LIFE']
+        self.comment(self.posts[0], 1, datetime.utcnow() - timedelta(
+            seconds=10 * half_life))
+        self.comment(self.posts[1], 1)
+        self.assertEqual(self.ranking(), [self.posts[1].id])
+
+    def test_concurrent_first_activity(self):
+        # another transaction adds the post between the select and the insert
+        half_life = self.app.config['FLASKY_TRENDING_HALF_LIFE']
+        now = datetime.utcnow()
+        post_id = self.posts[0].id
+        connection = db.session.connection()
+        execute = connection.execute
+
+        def racing_execute(statement, *args, **kwargs):
+            result = execute(statement, *args, **kwargs)
+            if not racing_execute.raced:
+                racing_execute.raced = True
+                score = result.scalar()
+                execute(TrendingPost.__table__.insert().values(
+                    post_id=post_id,
+                    score=activity_score(now, 1.0, half_life)))
+                return mock.Mock(**{'scalar.return_value': score})
+            return result
+        racing_execute.raced = False
+
+        with mock.patch.object(connection, 'execute', racing_execute):
+            add_activity(connection, self.app.config,
+                         [(post_id, now, 1.0)])
+        db.session.commit()
+        value = decayed_value(TrendingPost.query.get(post_id).score,
+                              half_life, now)
+        self.assertAlmostEqual(value, 2.0)
+
+    def test_follows(self):
+        self.john.follow(self.susan)
+        db.session.commit()
+        latest = max(self.posts, key=lambda p: (p.timestamp, p.id))
+        self.assertEqual(self.ranking(), [latest.id])
+
+    def test_disabled(self):
+        self.app.config['FLASKY_TRENDING'] = False
+        self.comment(self.posts[0])
+        self.assertEqual(self.ranking(), [])
+
+    def test_pagination(self):
+        for i, post in enumerate(self.posts):
+            self.comment(post, i + 1)
+        page = TrendingPagination(3)
+        self.assertEqual(page.items, self.posts[::-1][:3])
+        self.assertTrue(page.has_next)
+        page = TrendingPagination(3, page.next_cursor)
+        self.assertEqual(page.items, self.posts[:1])
+        self.assertFalse(page.has_next)
+
+    def test_views(self):
+        self.comment(self.posts[2], 2)
+        self.comment(self.posts[3])
+        client = self.app.test_client()
+        response = client.get('/trending')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('post 2', response.get_data(as_text=True))
+        response = client.get('/api/v1/posts/trending/', headers={
+            'Authorization': 'Basic ' + b64encode(
+                b'john@example.com:cat').decode('utf-8')})
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.get_data(as_text=True))
+        self.assertEqual([p['url'] for p in data['posts']],
+                         ['/api/v1/posts/%d' % self.posts[2].id,
+                          '/api/v1/posts/%d' % self.posts[3].id])
+        self.assertIsNone(data['next'])
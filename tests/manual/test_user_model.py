@@ -2,6 +2,7 @@ import unittest
 import time
 from datetime import datetime
 from app import create_app, db
+from app.testing import create_database, drop_database
 from app.models import User, AnonymousUser, Role, Permission, Follow
 import warnings
 warnings.filterwarnings("ignore", category=DeprecationWarning)
@@ -11,12 +12,11 @@ class UserModelTestCase(unittest.TestCase):
         self.app = create_app('testing')
         self.app_context = self.app.app_context()
         self.app_context.push()
-        db.create_all()
-        Role.insert_roles()
+        create_database()
 
     def tearDown(self):
         db.session.remove()
-        db.drop_all()
+        drop_database()
         self.app_context.pop()
 
     def test_password_setter(self):
@@ -38,6 +38,14 @@ class UserModelTestCase(unittest.TestCase):
         u2 = User(password='cat')
         self.assertTrue(u.password_hash != u2.password_hash)
 
+    def test_password_hash_method(self):
+        u = User(password='cat')
+        self.assertTrue(u.password_hash.startswith('pbkdf2:sha256:1$'))
+        self.app.config['FLASKY_PASSWORD_HASH'] = 'pbkdf2:sha256'
+        u.password = 'dog'
+        self.assertTrue(u.password_hash.startswith('pbkdf2:sha256:50000$'))
+        self.assertTrue(u.verify_password('dog'))
+
     def test_valid_confirmation_token(self):
         u = User(password='cat')
         db.session.add(u)
@@ -218,3 +226,73 @@ class UserModelTestCase(unittest.TestCase):
                          'posts_url', 'followed_posts_url', 'post_count']
         self.assertEqual(sorted(json_user.keys()), sorted(expected_keys))
         self.assertEqual('/api/v1/users/' + str(u.id), json_user['url'])
+
+    def test_add_self_follows(self):
+        u1 = User(email='john@example.com', password='cat')
+        u2 = User(email='susan@example.org', password='dog')
+        db.session.add_all([u1, u2])
+        db.session.commit()
+        self.assertTrue(User.self_follows_are_current())
+        u1.unfollow(u1)
+        db.session.commit()
+        self.assertFalse(u1.is_following(u1))
+        self.assertFalse(User.self_follows_are_current())
+        self.assertEqual(User.add_self_follows(), 1)
+        self.assertTrue(u1.is_following(u1))
+        self.assertTrue(User.self_follows_are_current())
+        self.assertEqual(User.add_self_follows(), 0)
+
+    def test_roles_are_current(self):
+        self.assertTrue(Role.roles_are_current())
+        r = Role.query.filter_by(name='Moderator').first()
+        r.remove_permission(Permission.MODERATE)
+        db.session.commit()
+        self.assertFalse(Role.roles_are_current())
+        Role.insert_roles()
+        self.assertTrue(Role.roles_are_current())
+
+    def test_follow_graph(self):
+        graph = self.app.extensions['follow_graph']
+        u1 = User(email='john@example.com', password='cat')
+        u2 = User(email='susan@example.org', password='dog')
+        db.session.add_all([u1, u2])
+        db.session.commit()
+        self.assertTrue(graph.is_following(u1.id, u1.id))
+        self.assertFalse(graph.is_following(u1.id, u2.id))
+
+        # uncommitted follows are checked in the database
+        u1.follow(u2)
+        self.assertTrue(u1.is_following(u2))
+        self.assertFalse(graph.is_following(u1.id, u2.id))
+        db.session.commit()
+        self.assertTrue(graph.is_following(u1.id, u2.id))
+        self.assertTrue(u2.is_followed_by(u1))
+        self.assertEqual(u2.followers_count(), 2)
+        self.assertEqual(u1.followed_count(), 2)
+
+        # rolled back changes are discarded
+        u1.unfollow(u2)
+        db.session.flush()
+        db.session.rollback()
+        self.assertTrue(graph.is_following(u1.id, u2.id))
+        u1.unfollow(u2)
+        db.session.commit()
+        self.assertFalse(u1.is_following(u2))
+        self.assertEqual(list(graph.followers_ids(u2.id)), [u2.id])
+
+    def test_follow_with_stale_graph(self):
+        graph = self.app.extensions['follow_graph']
+        u1 = User(email='john@example.com', password='cat')
+        u2 = User(email='susan@example.org', password='dog')
+        db.session.add_all([u1, u2])
+        db.session.commit()
+        self.assertFalse(graph.is_following(u1.id, u2.id))
+        # a follow committed by another process, the graph does not know it
+        db.session.execute(Follow.__table__.insert().values(
+            follower_id=u1.id, followed_id=u2.id))
+        db.session.commit()
+        graph.remove(u1.id, u2.id)
+        self.assertFalse(u1.is_following(u2))
+        u1.follow(u2)
+        db.session.commit()
+        self.assertEqual(u1.followed.filter_by(followed_id=u2.id).count(), 1)
@@ -0,0 +1,94 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from app import create_app, db
+from app.testing import create_database, drop_database
+from app.models import User, Role, Post, Permission
+from app.warmup import warm_up, compile_templates
+from config import config
+
+
+class WarmupTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        create_database()
+
+    def tearDown(self):
+        db.session.remove()
+        drop_database()
+        self.app_context.pop()
+
+    def test_warm_up(self):
+        u = User(email='john@example.com', password='cat')
+        db.session.add_all([u, Post(body='post', author=u)])
+        db.session.commit()
+        results = warm_up(self.app)
+        self.assertEqual(list(results), [
+            'mappers', 'templates', 'roles', 'queries', 'follow graph',
+            'url templates', 'renderer'])
+        for name, (result, seconds) in results.items():
+            self.assertIsNotNone(result, name)
+        self.assertEqual(len(self.app.jinja_env.cache),
+                         results['templates'][0])
+        self.assertIn('role_permissions', self.app.extensions)
+        self.assertIn('api.get_post', self.app.extensions['url_templates'])
+
+    def test_cached_role_permissions(self):
+        u = User(email='john@example.com', password='cat')
+        db.session.add(u)
+        db.session.commit()
+        db.session.expunge_all()
+        u = User.query.first()
+        self.assertTrue(u.can(Permission.WRITE))
+        self.assertNotIn('role', u.__dict__)
+
+        # changes to the roles are picked up
+        role = Role.query.filter_by(name='User').first()
+        role.remove_permission(Permission.WRITE)
+        db.session.commit()
+        db.session.expunge_all()
+        self.assertFalse(User.query.first().can(Permission.WRITE))
+
+    def test_template_bytecode_cache(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+
+        class CachedConfig(config['testing']):
+            FLASKY_TEMPLATE_CACHE_DIR = cache_dir
+
+        config['cached'] = CachedConfig
+        self.addCleanup(config.pop, 'cached')
+        app = create_app('cached')
+        count = compile_templates(app)
+        self.assertEqual(len(os.listdir(cache_dir)), count)
+
+        # a new application loads the compiled templates from the cache
+        app = create_app('cached')
+        cache = app.jinja_env.bytecode_cache
+        loaded = []
+        load_bytecode = cache.load_bytecode
+
+        def load(bucket):
+            load_bytecode(bucket)
+            loaded.append(bucket.code is not None)
+
+        cache.load_bytecode = load
+        app.jinja_env.get_template('index.html')
+        self.assertEqual(loaded, [True])
+
+    def test_unwritable_template_cache(self):
+        class CachedConfig(config['testing']):
+            FLASKY_TEMPLATE_CACHE_DIR = '/read-only/jinja'
+
+        config['cached'] = CachedConfig
+        self.addCleanup(config.pop, 'cached')
+        with mock.patch('os.makedirs', side_effect=PermissionError(
+                13, 'Permission denied')):
+            app = create_app('cached')
+        self.assertIsNone(app.jinja_env.bytecode_cache)
+        with app.test_request_context():
+            app.jinja_env.get_template('index.html')
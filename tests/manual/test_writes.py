@@ -0,0 +1,80 @@
+import os
+import tempfile
+import threading
+import unittest
+from app import create_app, db, writes
+from app.models import User, Role, Post
+from app.main.views import add_post
+
+
+def add_user(username):
+    user = User(username=username, email=username + '@example.com')
+    db.session.add(user)
+    db.session.flush()
+    return user.id
+
+
+def fail():
+    raise ValueError('bad unit')
+
+
+class WriteQueueTestCase(unittest.TestCase):
+    def setUp(self):
+        # the writer thread needs a database shared across threads
+        fd, self.db_path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(fd)
+        self.app = create_app('testing')
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = \
+            'sqlite:///' + self.db_path
+        self.app.config['FLASKY_SERIALIZE_WRITES'] = True
+        self.app.config['FLASKY_WRITE_GROUP_WAIT'] = 0.05
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+
+    def tearDown(self):
+        writes.stop()
+        db.session.remove()
+        db.drop_all()
+        db.get_engine(self.app).dispose()
+        self.app_context.pop()
+        os.remove(self.db_path)
+
+    def test_execute(self):
+        id = writes.execute(add_user, 'john')
+        self.assertEqual(User.query.get(id).username, 'john')
+
+    def test_group_commit(self):
+        batches = writes.batches
+        futures = [writes.submit(add_user, 'user%d' % i) for i in range(20)]
+        ids = [f.result(5) for f in futures]
+        self.assertEqual(len(set(ids)), 20)
+        self.assertEqual(User.query.count(), 20)
+        self.assertLess(writes.batches - batches, 20)
+
+    def test_failed_unit_is_isolated(self):
+        good = writes.submit(add_user, 'john')
+        bad = writes.submit(fail)
+        other = writes.submit(add_user, 'susan')
+        with self.assertRaises(ValueError):
+            bad.result(5)
+        self.assertIsNotNone(good.result(5))
+        self.assertIsNotNone(other.result(5))
+        self.assertEqual(User.query.count(), 2)
+
+    def test_requests_from_threads(self):
+        user_id = writes.execute(add_user, 'john')
+        app = self.app
+
+        def worker(i):
+            with app.app_context():
+                writes.execute(add_post, 'post %d' % i, user_id)
+
+        threads = [threading.Thread(target=worker, args=(i,))
+                   for i in range(10)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(Post.query.count(), 10)